@@ -0,0 +1,199 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import numpy as np
+
+
+class ClipSpec:
+    """
+    Layout of the clip tensors of BehaviorClassifier.
+
+    A clip of frames of shape (frames, height, width, channels) is stacked into a tensor of shape
+    (height, width, time_steps) with time_steps = frames * channels, by reinterpreting the contiguous frames.
+    """
+    def __init__(self, image_size, time_steps, channels=3):
+        """
+        :param image_size: size (width, height) of frames.
+        :param time_steps: size of the last axis of the tensor, i.e. number of frames times channels.
+        :param channels: number of channels of frames.
+        """
+        if time_steps % channels:
+            raise ValueError('time_steps %d is not a multiple of channels %d.' % (time_steps, channels))
+        self.width, self.height = (int(length) for length in image_size)
+        self.time_steps = int(time_steps)
+        self.channels = channels
+
+    @classmethod
+    def from_config(cls, config, channels=3):
+        """
+        :param config: config of a model with image_size and time_steps such as BehaviorClassifier.config.
+        """
+        return cls(config['image_size'], config['time_steps'], channels)
+
+    @classmethod
+    def from_frames(cls, frame_shape, frames):
+        """
+        :param frame_shape: shape (height, width, channels) of frames.
+        :param frames: number of frames in a clip.
+        """
+        height, width, channels = frame_shape
+        return cls((width, height), frames * channels, channels)
+
+    @property
+    def frames(self):
+        return self.time_steps // self.channels
+
+    @property
+    def frame_shape(self):
+        return self.height, self.width, self.channels
+
+    @property
+    def shape(self):
+        """ Shape of a tensor, which is BehaviorClassifier.shape. """
+        return self.height, self.width, self.time_steps
+
+    def validate(self, shape):
+        """
+        :param shape: input shape of a model such as BehaviorClassifier.shape.
+        :raise ValueError: if the shape does not match.
+        """
+        if tuple(shape) != self.shape:
+            raise ValueError('Clip tensors of shape %s do not match the model input %s.' % (self.shape, tuple(shape)))
+
+    def to_tensor(self, clips):
+        """
+        :param clips: clips of shape (clips, frames, height, width, channels) or a clip without the first axis.
+        :return: tensors of shape (clips, height, width, time_steps). It is a view if the clips are contiguous.
+        :raise ValueError: if the clips do not match the spec.
+        """
+        clips = np.asarray(clips)
+        if clips.shape[-4:] != (self.frames, ) + self.frame_shape:
+            raise ValueError('Clips of shape %s do not match %s.' % (clips.shape, (self.frames, ) + self.frame_shape))
+        return clips.reshape((-1, ) + self.shape)
+
+    def windows(self, frames, starts):
+        """
+        :param frames: frames of shape (frames, height, width, channels).
+        :param starts: indices of the first frames of windows.
+        :return: tensors of the windows of shape (windows, height, width, time_steps).
+        """
+        frames = np.asarray(frames)
+        if frames.shape[1:] != self.frame_shape:
+            raise ValueError('Frames of shape %s do not match %s.' % (frames.shape[1:], self.frame_shape))
+        starts = np.asarray(starts, dtype=np.int64)
+        if len(frames) >= self.frames and frames.flags.c_contiguous:
+            views = np.lib.stride_tricks.as_strided(
+                frames, shape=(len(frames) - self.frames + 1, self.frames) + self.frame_shape,
+                strides=(frames.strides[0], ) + frames.strides, writeable=False)
+            return self.to_tensor(views[starts])
+        return self.to_tensor(np.stack([frames[start:start + self.frames] for start in starts])
+                              if len(starts) else np.empty((0, self.frames) + self.frame_shape, frames.dtype))
+
+    def clip_starts(self, offsets, stride=None):
+        """
+        Windows of clips of variable lengths, which do not cross the boundaries of clips.
+        :param offsets: offsets of clips in the frames, whose last element is the number of frames.
+        :param stride: number of frames between windows. Windows do not overlap if None.
+        :return: indices of the first frames of the windows and indices of the clips of the windows.
+        """
+        stride = stride or self.frames
+        starts, clips = [], []
+        for i, (begin, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+            clip_starts = range(int(begin), int(end) - self.frames + 1, stride)
+            starts.extend(clip_starts)
+            clips.extend([i] * len(clip_starts))
+        return np.asarray(starts, dtype=np.int64), np.asarray(clips, dtype=np.int64)
+
+    def clip_windows(self, frames, offsets, stride=None):
+        """
+        Windows of the frames of clips of variable lengths. Windows do not cross the boundaries of clips.
+        :param frames: frames of all the clips of shape (frames, height, width, channels).
+        :param offsets: offsets of clips in the frames, whose last element is the number of frames.
+        :param stride: number of frames between windows. Windows do not overlap if None.
+        :return: tensors of shape (windows, height, width, time_steps) and indices of the clips of the windows.
+        """
+        stride = stride or self.frames
+        starts, clips = self.clip_starts(offsets, stride)
+        if stride == self.frames and len(starts) * self.frames == len(frames):
+            return self.to_tensor(np.asarray(frames).reshape((-1, self.frames) + self.frame_shape)), clips
+        return self.windows(frames, starts), clips
+
+
+class WindowBatches:
+    """
+    Batches of windows of frames and their targets for training.
+
+    The windows of a batch are copied out of the frames only when the batch is taken,
+    so that training on memory-mapped frames such as CompiledDataset.frames keeps one batch in memory.
+    """
+    def __init__(self, spec, frames, starts, y, batch_size=32, shuffle=True):
+        """
+        :param spec: ClipSpec of the windows.
+        :param frames: frames of shape (frames, height, width, channels).
+        :param starts: indices of the first frames of the windows, e.g. from ClipSpec.clip_starts.
+        :param y: targets of the windows.
+        :param batch_size: number of windows in a batch.
+        :param shuffle: shuffle the windows at the end of every epoch.
+        """
+        self.spec = spec
+        self.frames = frames
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.y = np.asarray(y)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self._order = np.arange(len(self.starts))
+        self.on_epoch_end()
+
+    def __len__(self):
+        return -(-len(self.starts) // self.batch_size)
+
+    def __getitem__(self, index):
+        """
+        :return: tensors of shape (windows, height, width, time_steps) and targets of the batch.
+        """
+        windows = np.sort(self._order[index * self.batch_size:(index + 1) * self.batch_size])
+        return self.spec.windows(self.frames, self.starts[windows]), self.y[windows]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            np.random.shuffle(self._order)
+
+    def split(self, train_size, shuffle=True):
+        """
+        Split the windows randomly into two WindowBatches sharing the frames.
+        :param train_size: proportion of the windows in the first one.
+        :param shuffle: shuffle the windows of the second one at the end of every epoch.
+        :return: WindowBatches of train_size and of the rest.
+        """
+        windows = np.random.permutation(len(self.starts))
+        n = int(round(train_size * len(windows)))
+        first, second = np.sort(windows[:n]), np.sort(windows[n:])
+        return (WindowBatches(self.spec, self.frames, self.starts[first], self.y[first], self.batch_size, self.shuffle),
+                WindowBatches(self.spec, self.frames, self.starts[second], self.y[second], self.batch_size, shuffle))
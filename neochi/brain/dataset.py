@@ -0,0 +1,343 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import os
+import json
+import multiprocessing
+import base64
+import hashlib
+import zipfile
+import posixpath
+import numpy as np
+
+
+def decode_frame(raw, out=None):
+    """
+    Decode a frame of the JSON format recorded by the eye.
+    :param raw: bytes or str of the JSON.
+    :param out: array to decode the frame into. A new array is returned if None.
+    :return: frame of shape (height, width, channel).
+    """
+    image_json = json.loads(raw)
+    frame = np.frombuffer(base64.b64decode(image_json['image']), np.uint8)\
+        .reshape((image_json['height'], image_json['width'], image_json['channel']))
+    if out is None:
+        return frame.copy()
+    out[...] = frame
+    return out
+
+
+class ZipDataset:
+    """
+    Labelled clips read directly from an uploaded data.zip without extracting it.
+
+    The zip has labels.json listing directoryName and label of the clips,
+    and a directory of JSON frames for each clip. Clips are decoded one by one into a preallocated array,
+    so iterating over the dataset keeps only one clip in memory.
+    """
+    def __init__(self, zip_path):
+        """
+        :param zip_path: path of data.zip.
+        """
+        self._zip_path = zip_path
+        with zipfile.ZipFile(zip_path) as archive:
+            self._entries = json.loads(archive.read('labels.json'))['labels']
+            members = {}
+            for info in archive.infolist():
+                if info.filename.endswith('/'):
+                    continue
+                directory, filename = posixpath.split(info.filename)
+                members.setdefault(directory, []).append(info)
+        self._members = [sorted(members.get(entry['directoryName'].rstrip('/'), []), key=lambda info: info.filename)
+                         for entry in self._entries]
+        self._frame_shape = None
+
+    @property
+    def labels(self):
+        return [entry['label'] for entry in self._entries]
+
+    @property
+    def directory_names(self):
+        return [entry['directoryName'] for entry in self._entries]
+
+    def members(self, index):
+        """
+        :param index: index of a clip.
+        :return: list of ZipInfo of the frames of the clip in order.
+        """
+        return self._members[index]
+
+    @property
+    def frame_shape(self):
+        """ Shape (height, width, channel) of the first frame. """
+        if self._frame_shape is None:
+            first = next((members[0] for members in self._members if members), None)
+            if first is None:
+                raise ValueError('%s has no frames.' % self._zip_path)
+            with zipfile.ZipFile(self._zip_path) as archive:
+                self._frame_shape = decode_frame(archive.read(first)).shape
+        return self._frame_shape
+
+    @property
+    def clip_lengths(self):
+        return [len(members) for members in self._members]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def read_clip(self, archive, index, out=None):
+        """
+        :param archive: opened ZipFile of the dataset.
+        :param index: index of a clip.
+        :param out: array of shape (frames, height, width, channel) to decode the clip into.
+        :return: clip of shape (frames, height, width, channel).
+        """
+        members = self._members[index]
+        if out is None:
+            out = np.empty((len(members), ) + self.frame_shape, dtype=np.uint8)
+        for i, info in enumerate(members):
+            decode_frame(archive.read(info), out[i])
+        return out
+
+    def __iter__(self):
+        """
+        Yield clips and labels in the order of labels.json.
+        The yielded clip is overwritten by the next one when clips have the same length.
+        """
+        buffers = {}
+        with zipfile.ZipFile(self._zip_path) as archive:
+            for index, entry in enumerate(self._entries):
+                length = len(self._members[index])
+                if length not in buffers:
+                    buffers = {length: np.empty((length, ) + self.frame_shape, dtype=np.uint8)}
+                yield self.read_clip(archive, index, buffers[length]), entry['label']
+
+    def load(self):
+        """
+        Decode all the clips into one preallocated array.
+        :return: clips of shape (clips, frames, height, width, channel) and list of labels.
+        :raise ValueError: if the clips have different lengths.
+        """
+        lengths = set(self.clip_lengths)
+        if len(lengths) > 1:
+            raise ValueError('Clips have different lengths: %s' % sorted(lengths))
+        X = np.empty((len(self), lengths.pop() if lengths else 0) + self.frame_shape, dtype=np.uint8)
+        with zipfile.ZipFile(self._zip_path) as archive:
+            for index in range(len(self)):
+                self.read_clip(archive, index, X[index])
+        return X, self.labels
+
+    def to_tf_dataset(self, transform=None):
+        """
+        :param transform: callable taking a clip and a label and returning the element of the dataset.
+                          The clip is copied by default so that elements are not overwritten.
+        :return: tf.data.Dataset generating the elements lazily.
+        """
+        import tensorflow as tf
+
+        if transform is None:
+            def transform(clip, label):
+                return clip.copy(), label
+
+        def generate():
+            for clip, label in self:
+                yield transform(clip, label)
+        element = [np.asarray(value) for value in transform(*next(iter(self)))]
+        types = tuple(tf.string if value.dtype.kind in 'US' else tf.as_dtype(value.dtype) for value in element)
+        shapes = (tf.TensorShape((None, ) + element[0].shape[1:]), tf.TensorShape(element[1].shape))
+        return tf.data.Dataset.from_generator(generate, types, shapes)
+
+
+def _file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _clip_signature(members):
+    digest = hashlib.sha1()
+    for info in members:
+        digest.update(('%s:%d:%d;' % (info.filename, info.CRC, info.file_size)).encode())
+    return digest.hexdigest()
+
+
+class CompiledDataset:
+    """
+    Dataset compiled by compile_dataset, whose frames are memory-mapped from a file.
+
+    Frames of all the clips are stored contiguously in one array of shape (frames, height, width, channel),
+    and the clip i is frames[offsets[i]:offsets[i + 1]].
+    """
+    index_filename = 'index.json'
+    frames_filename = 'frames.dat'
+
+    def __init__(self, directory):
+        """
+        :param directory: directory of the compiled dataset.
+        """
+        self._directory = directory
+        with open(os.path.join(directory, self.index_filename)) as f:
+            self._index = json.load(f)
+        self.offsets = np.cumsum([0] + [clip['length'] for clip in self._index['clips']])
+        shape = (int(self.offsets[-1]), ) + tuple(self._index['frame_shape'])
+        self.frames = np.memmap(os.path.join(directory, self.frames_filename), dtype=self._index['dtype'],
+                                mode='r', shape=shape) if shape[0] else np.empty(shape, self._index['dtype'])
+
+    @property
+    def zip_hash(self):
+        return self._index['zip_hash']
+
+    @property
+    def frame_shape(self):
+        return tuple(self._index['frame_shape'])
+
+    @property
+    def labels(self):
+        return [clip['label'] for clip in self._index['clips']]
+
+    @property
+    def directory_names(self):
+        return [clip['directoryName'] for clip in self._index['clips']]
+
+    @property
+    def clip_lengths(self):
+        return [clip['length'] for clip in self._index['clips']]
+
+    def __len__(self):
+        return len(self._index['clips'])
+
+    def clip(self, index):
+        return self.frames[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self):
+        for index, label in enumerate(self.labels):
+            yield self.clip(index), label
+
+    def load(self):
+        """
+        :return: memory-mapped clips of shape (clips, frames, height, width, channel) and list of labels.
+        :raise ValueError: if the clips have different lengths.
+        """
+        lengths = set(self.clip_lengths)
+        if len(lengths) > 1:
+            raise ValueError('Clips have different lengths: %s' % sorted(lengths))
+        return self.frames.reshape((len(self), lengths.pop() if lengths else 0) + self.frame_shape), self.labels
+
+
+def _compiled_prefix(index, dataset, signatures):
+    if index is None or tuple(index['frame_shape']) != dataset.frame_shape:
+        return 0
+    kept = 0
+    for clip, name, signature in zip(index['clips'], dataset.directory_names, signatures):
+        if clip['directoryName'] != name or clip['signature'] != signature:
+            break
+        kept += 1
+    return kept
+
+
+def _write_index(directory, index):
+    path = os.path.join(directory, CompiledDataset.index_filename)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f)
+    os.replace(path + '.tmp', path)
+
+
+def _decode_clips(zip_path, frames_path, shape, clips):
+    frames = np.memmap(frames_path, dtype=np.uint8, mode='r+', shape=shape)
+    with zipfile.ZipFile(zip_path) as archive:
+        for offset, names in clips:
+            for i, name in enumerate(names):
+                decode_frame(archive.read(name), frames[offset + i])
+    frames.flush()
+
+
+def _decode_clips_task(args):
+    return _decode_clips(*args)
+
+
+def _split(items, n):
+    size, remainder = divmod(len(items), n)
+    chunks, start = [], 0
+    for i in range(n):
+        end = start + size + (1 if i < remainder else 0)
+        chunks.append(items[start:end])
+        start = end
+    return [chunk for chunk in chunks if chunk]
+
+
+def compile_dataset(zip_path, directory, workers=None):
+    """
+    Compile data.zip into a memory-mapped frame file and a label index in the directory.
+
+    The compiled dataset is reused without decoding if the zip has the same content hash,
+    and only clips which are not compiled yet are decoded if the zip has new clips appended.
+    Clips are decoded by a pool of processes, each of which writes into the slots of its clips in the file.
+    :param zip_path: path of data.zip.
+    :param directory: directory of the compiled dataset.
+    :param workers: number of decoding processes. The number of CPUs if None. 1 decodes in this process.
+    :return: CompiledDataset.
+    """
+    zip_hash = _file_hash(zip_path)
+    index_path = os.path.join(directory, CompiledDataset.index_filename)
+    index = None
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if index['zip_hash'] == zip_hash:
+            return CompiledDataset(directory)
+    os.makedirs(directory, exist_ok=True)
+
+    dataset = ZipDataset(zip_path)
+    signatures = [_clip_signature(dataset.members(i)) for i in range(len(dataset))]
+    kept = _compiled_prefix(index, dataset, signatures)
+    if index is not None and kept < len(index['clips']):
+        os.remove(index_path)
+    lengths = dataset.clip_lengths
+    offsets = np.cumsum([0] + lengths)
+    frame_bytes = int(np.prod(dataset.frame_shape))
+    frames_path = os.path.join(directory, CompiledDataset.frames_filename)
+    with open(frames_path, 'ab') as f:
+        f.truncate(int(offsets[-1]) * frame_bytes)
+    clips = [(int(offsets[i]), [info.filename for info in dataset.members(i)]) for i in range(kept, len(dataset))]
+    shape = (int(offsets[-1]), ) + dataset.frame_shape
+    workers = min(workers or os.cpu_count() or 1, len(clips))
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            pool.map(_decode_clips_task, [(zip_path, frames_path, shape, chunk)
+                                          for chunk in _split(clips, workers * 4)])
+    elif clips:
+        _decode_clips(zip_path, frames_path, shape, clips)
+    _write_index(directory, {
+        'zip_hash': zip_hash,
+        'dtype': 'uint8',
+        'frame_shape': list(dataset.frame_shape),
+        'clips': [{'directoryName': name, 'label': label, 'length': length, 'signature': signature}
+                  for name, label, length, signature in zip(dataset.directory_names, dataset.labels, lengths,
+                                                            signatures)],
+    })
+    return CompiledDataset(directory)
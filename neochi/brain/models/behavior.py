@@ -26,13 +26,129 @@ __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 import os
 import json
+import threading
 import numpy as np
-from tensorflow import keras
-from tensorflow.keras import callbacks
-from sklearn.model_selection import train_test_split
 from .base import Model
 
 
+FORMATS = ('h5', 'saved_model', 'tflite')
+_models = {}
+_models_lock = threading.Lock()
+
+
+class TFLiteModel:
+    """
+    Keras like interface to a TensorFlow Lite model. It uses tflite_runtime if it is installed instead of TensorFlow.
+    """
+    def __init__(self, path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self._interpreter = Interpreter(model_path=path)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    def predict_on_batch(self, X):
+        X = np.asarray(X, dtype=self._input['dtype'])
+        with self._lock:
+            if self._batch_size != len(X):
+                self._interpreter.resize_tensor_input(self._input['index'], X.shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(X)
+            self._interpreter.set_tensor(self._input['index'], X)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output['index']).copy()
+
+    def predict(self, X):
+        return self.predict_on_batch(X)
+
+
+class SavedModel:
+    """
+    Keras like interface to the serving signature of a TensorFlow 2 SavedModel.
+    """
+    def __init__(self, path):
+        import tensorflow as tf
+        self._saved_model = tf.saved_model.load(path)
+        self._signature = self._saved_model.signatures['serving_default']
+        self._name, self._spec = next(iter(self._signature.structured_input_signature[1].items()))
+
+    def predict_on_batch(self, X):
+        import tensorflow as tf
+        outputs = self._signature(**{self._name: tf.constant(np.asarray(X), dtype=self._spec.dtype)})
+        return next(iter(outputs.values())).numpy()
+
+    def predict(self, X):
+        return self.predict_on_batch(X)
+
+
+def _model_path(save_dir, format):
+    if format not in FORMATS:
+        raise ValueError('Unknown model format: %s' % format)
+    return os.path.join(save_dir, {'h5': 'model.h5', 'saved_model': 'saved_model', 'tflite': 'model.tflite'}[format])
+
+
+def _load_model(path, format):
+    if format == 'tflite':
+        return TFLiteModel(path)
+    from tensorflow import keras
+    if format == 'saved_model':
+        experimental = getattr(keras, 'experimental', None)
+        if hasattr(experimental, 'load_from_saved_model'):
+            return experimental.load_from_saved_model(path)
+        return SavedModel(path)
+    return keras.models.load_model(path)
+
+
+def _keras_sequence(batches):
+    """
+    :param batches: WindowBatches.
+    :return: keras.utils.Sequence of the batches.
+    """
+    from tensorflow import keras
+
+    class WindowSequence(keras.utils.Sequence):
+        def __len__(self):
+            return len(batches)
+
+        def __getitem__(self, index):
+            return batches[index]
+
+        def on_epoch_end(self):
+            batches.on_epoch_end()
+    return WindowSequence()
+
+
+def load_model(save_dir, format='h5'):
+    """
+    Load a saved model once per process. It is loaded again if the file is modified.
+    :param save_dir: directory of the model.
+    :param format: 'h5', 'saved_model' or 'tflite'.
+    :return: Keras model or TFLiteModel.
+    """
+    path = _model_path(save_dir, format)
+    key = (os.path.abspath(path), format)
+    mtime = os.path.getmtime(path)
+    with _models_lock:
+        if key not in _models or _models[key][0] != mtime:
+            _models[key] = mtime, _load_model(path, format)
+        return _models[key][1]
+
+
+def load_config(save_dir):
+    """
+    Read the parameters of a saved model without loading TensorFlow.
+    :param save_dir: directory of the model.
+    :return: dict of shape, fps and labels.
+    """
+    with open(os.path.join(save_dir, 'model.json'), 'r') as f:
+        return json.load(f)
+
+
 class BehaviorClassifier(Model):
     def __init__(self, shape=None, fps=None, labels=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -60,6 +176,11 @@ class BehaviorClassifier(Model):
     def fps(self):
         return self._fps
 
+    @property
+    def classes(self):
+        """ Labels in the order of the model outputs, as encoded by LabelEncoder in fit. """
+        return sorted(set(self.labels)) if self.labels is not None else None
+
     @property
     def config(self):
         return {
@@ -69,17 +190,20 @@ class BehaviorClassifier(Model):
         }
 
     def _create_model(self):
+        from tensorflow import keras
         ipt = keras.layers.Input(shape=self._shape)
         cnn1_1 = keras.layers.SeparableConv2D(16, (3, 3), activation='relu')(ipt)
         pool1_1 = keras.layers.MaxPool2D()(cnn1_1)
         cnn2_1 = keras.layers.SeparableConv2D(32, (3, 3), activation='relu')(pool1_1)
         pool2_1 = keras.layers.MaxPool2D()(cnn2_1)
         fc1 = keras.layers.Dense(128, activation='relu')(keras.layers.Flatten()(pool2_1))
-        fc2 = keras.layers.Dense(len(self.labels), activation='softmax')(fc1)
+        fc2 = keras.layers.Dense(len(self.classes), activation='softmax')(fc1)
         self._model = keras.models.Model(inputs=[ipt, ], outputs=[fc2, ])
 
     def fit(self, X, y, optimizer='adam', loss='sparse_categorical_crossentropy',
             metrics=['accuracy', ], train_size=0.75, epochs=20, batch_size=32):
+        from tensorflow.keras import callbacks
+        from sklearn.model_selection import train_test_split
         self._create_model()
         X_train, X_test, y_train, y_test = train_test_split(X, y, train_size=train_size)
         self._model.compile(optimizer=optimizer, loss=loss, metrics=metrics)
@@ -91,6 +215,26 @@ class BehaviorClassifier(Model):
         print('TEST ACCURACY:', test_acc)
         return test_loss, test_acc
 
+    def fit_batches(self, batches, optimizer='adam', loss='sparse_categorical_crossentropy',
+                    metrics=['accuracy', ], train_size=0.75, epochs=20):
+        """
+        Fit on WindowBatches, which copies only a batch of windows out of the frames at a time.
+        The windows are split into train, validation and test sets in the same proportions as fit.
+        :param batches: WindowBatches of all the windows.
+        """
+        from tensorflow import keras
+        self._create_model()
+        train, test = batches.split(train_size, shuffle=False)
+        train, validation = train.split(train_size, shuffle=False)
+        self._model.compile(optimizer=optimizer, loss=loss, metrics=metrics)
+        es_cb = keras.callbacks.EarlyStopping()
+        self._model.fit(_keras_sequence(train), validation_data=_keras_sequence(validation),
+                        epochs=epochs, callbacks=[es_cb, ])
+        test_loss, test_acc = self._model.evaluate(_keras_sequence(test))
+        print('TEST LOSS:', test_loss)
+        print('TEST ACCURACY:', test_acc)
+        return test_loss, test_acc
+
     def predict(self, X):
         return np.argmax(self._model.predict(X), axis=1)
 
@@ -98,22 +242,81 @@ class BehaviorClassifier(Model):
         return self._model.evaluate(X, y)
 
     def predict_probs(self, X):
-        return self.predict(X)
+        return self._model.predict_on_batch(X)
 
     def predict_labels(self, X):
-        return [self.labels[i] for i in self.predict(X)]
+        return [self.classes[i] for i in self.predict(X)]
 
-    def save(self, save_dir):
+    def _export(self, save_dir, format):
+        import tensorflow as tf
+        path = _model_path(save_dir, format)
+        if format == 'saved_model':
+            experimental = getattr(tf.keras, 'experimental', None)
+            if hasattr(experimental, 'export_saved_model'):
+                experimental.export_saved_model(self._model, path)
+            elif hasattr(self._model, 'export'):
+                self._model.export(path)
+            else:
+                self._model.save(path, save_format='tf')
+        elif format == 'tflite':
+            if hasattr(tf.lite.TFLiteConverter, 'from_keras_model'):
+                converter = tf.lite.TFLiteConverter.from_keras_model(self._model)
+            else:
+                converter = tf.lite.TFLiteConverter.from_keras_model_file(_model_path(save_dir, 'h5'))
+            with open(path, 'wb') as f:
+                f.write(converter.convert())
+
+    def save(self, save_dir, format='h5'):
+        """
+        The files are replaced atomically, so that a running predictor reloading them does not read partial files.
+        :param format: format exported in addition to the HDF5 model, which is 'h5', 'saved_model' or 'tflite'.
+        """
         print('SAVE MODEL %s' % self.__class__.__name__)
-        with open(os.path.join(save_dir, 'model.json'), 'w') as f:
+        config_path = os.path.join(save_dir, 'model.json')
+        with open(config_path + '.tmp', 'w') as f:
             json.dump({'shape': list(self._shape), 'fps': self._fps, 'labels': self.labels}, f)
-        self._model.save(os.path.join(save_dir, 'model.h5'))
+        os.replace(config_path + '.tmp', config_path)
+        h5_path = _model_path(save_dir, 'h5')
+        self._model.save(h5_path[:-len('.h5')] + '.tmp.h5')
+        os.replace(h5_path[:-len('.h5')] + '.tmp.h5', h5_path)
+        if format != 'h5':
+            self._export(save_dir, format)
         print('MODEL %s SAVED' % self.__class__.__name__)
 
-    def load(self, save_dir):
+    def load_config(self, save_dir):
+        """
+        Load the parameters without the network, which is enough for config, shape and classes.
+        """
+        params = load_config(save_dir)
+        self._shape, self._fps, self.labels = (params[key] for key in ['shape', 'fps', 'labels'])
+
+    def _warm_up(self, network):
+        network.predict_on_batch(np.zeros((1, ) + tuple(self._shape), dtype=np.float32))
+
+    def load(self, save_dir, format='h5', warm_up=False):
+        """
+        :param format: format of the network, which is 'h5', 'saved_model' or 'tflite'.
+        :param warm_up: run a prediction so that the first actual prediction is not delayed by graph building.
+        """
         print('LOAD MODEL %s' % self.__class__.__name__)
-        with open(os.path.join(save_dir, 'model.json'), 'r') as f:
-            params = json.load(f)
-            self._shape, self._fps, self.labels = (params[key] for key in ['shape', 'fps', 'labels'])
-        self._model = keras.models.load_model(os.path.join(save_dir, 'model.h5'))
+        self.load_config(save_dir)
+        self._model = load_model(save_dir, format)
+        if warm_up:
+            self._warm_up(self._model)
         print('MODEL %s LOADED' % self.__class__.__name__)
+
+    def reload(self, save_dir, format='h5'):
+        """
+        Replace the network if its file was modified since it was loaded, e.g. by fit while predicting.
+        The new network is warmed up before it replaces the current one, so that predictions are not delayed.
+        :param format: format of the network, which is 'h5', 'saved_model' or 'tflite'.
+        :return: True if the network was replaced. config, shape and classes may have changed then.
+        """
+        network = load_model(save_dir, format)
+        if network is self._model:
+            return False
+        print('RELOAD MODEL %s' % self.__class__.__name__)
+        self.load_config(save_dir)
+        self._warm_up(network)
+        self._model = network
+        return True
@@ -0,0 +1,125 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import time
+import threading
+import collections
+from concurrent import futures
+import numpy as np
+
+
+class InferenceServer:
+    """
+    Micro-batching of predictions requested by several streams.
+
+    Inputs submitted from any thread are stacked into a batch until max_batch_size inputs are waiting
+    or the oldest one has waited for max_latency seconds, and the batch is predicted in one call.
+    """
+    def __init__(self, predict, max_batch_size=16, max_latency=0.005):
+        """
+        :param predict: callable taking a batch of inputs and returning a batch of outputs,
+                        e.g. BehaviorClassifier.predict_probs.
+        :param max_batch_size: maximum number of inputs in a batch.
+        :param max_latency: maximum seconds to wait for more inputs after the first input of a batch.
+        """
+        self._predict = predict
+        self._max_batch_size = max_batch_size
+        self._max_latency = max_latency
+        self._requests = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._batches = 0
+        self._predictions = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def stats(self):
+        return {
+            'batches': self._batches,
+            'predictions': self._predictions,
+            'mean_batch_size': self._predictions / self._batches if self._batches else 0.,
+        }
+
+    def submit(self, x):
+        """
+        Request a prediction.
+        :param x: input with a leading batch axis of size 1 such as FrameWindow.tensor, or without it.
+                  It is copied, so that the caller may reuse the buffer.
+        :return: concurrent.futures.Future of the output.
+        """
+        x = np.array(x)
+        if x.ndim and x.shape[0] == 1:
+            x = x[0]
+        future = futures.Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('InferenceServer is closed.')
+            self._requests.append((time.time(), x, future))
+            self._condition.notify()
+        return future
+
+    def predict(self, x, timeout=None):
+        return self.submit(x).result(timeout)
+
+    def _take_batch(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._requests or self._closed)
+            if not self._requests:
+                return []
+            deadline = self._requests[0][0] + self._max_latency
+            while len(self._requests) < self._max_batch_size and not self._closed:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                self._condition.wait(timeout)
+            return [self._requests.popleft() for _ in range(min(len(self._requests), self._max_batch_size))]
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            batch = [(x, future) for _, x, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                outputs = self._predict(np.stack([x for x, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self._batches += 1
+            self._predictions += len(batch)
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
+
+    def close(self):
+        """ Predict the waiting inputs and stop the server. """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
@@ -0,0 +1,108 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import numpy as np
+from .clips import ClipSpec
+
+
+class FrameWindow:
+    """
+    Sliding window of the latest frames in the input layout of BehaviorClassifier.
+
+    Each frame is written twice into a ring buffer of twice the window length,
+    so that the latest frames are always contiguous and the model input is a view of the buffer.
+    """
+    def __init__(self, image_size, time_steps, channels=3, dtype=np.uint8):
+        """
+        :param image_size: size (width, height) of frames.
+        :param time_steps: size of the last axis of the model input, i.e. number of frames times channels.
+        :param channels: number of channels of frames.
+        :param dtype: dtype of frames.
+        """
+        self._spec = ClipSpec(image_size, time_steps, channels)
+        self._length = self._spec.frames
+        self._buffer = np.zeros((2 * self._length, ) + self._spec.frame_shape, dtype=dtype)
+        self._count = 0
+
+    @classmethod
+    def from_config(cls, config, channels=3, dtype=np.uint8):
+        """
+        :param config: config of a model with image_size and time_steps such as BehaviorClassifier.config.
+        """
+        return cls(config['image_size'], config['time_steps'], channels, dtype)
+
+    @property
+    def length(self):
+        """ Number of frames in a full window. """
+        return self._length
+
+    @property
+    def spec(self):
+        return self._spec
+
+    @property
+    def frame_shape(self):
+        return self._spec.frame_shape
+
+    @property
+    def is_full(self):
+        return self._count >= self._length
+
+    def __len__(self):
+        return min(self._count, self._length)
+
+    def append(self, frame):
+        frame = np.asarray(frame)
+        if frame.shape != self.frame_shape:
+            raise ValueError('Frame of shape %s does not match %s.' % (frame.shape, self.frame_shape))
+        index = self._count % self._length
+        self._buffer[index] = frame
+        self._buffer[index + self._length] = frame
+        self._count += 1
+
+    def extend(self, frames):
+        for frame in frames:
+            self.append(frame)
+
+    def clear(self):
+        self._count = 0
+
+    @property
+    def frames(self):
+        """
+        View of the frames in the window, oldest first.
+        """
+        start = self._count % self._length
+        return self._buffer[start + self._length - len(self):start + self._length]
+
+    @property
+    def tensor(self):
+        """
+        View of the full window as a model input of shape (1, height, width, time_steps).
+        """
+        if not self.is_full:
+            raise ValueError('Window has %d of %d frames.' % (len(self), self._length))
+        return self._spec.to_tensor(self.frames)
@@ -1 +1 @@
-from .base import get_cache
\ No newline at end of file
+from .base import get_cache, reset_caches
\ No newline at end of file
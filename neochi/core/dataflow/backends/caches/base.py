@@ -24,10 +24,52 @@
 __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 
+import os
 import abc
+import threading
 import importlib
 
 
+class Pipeline:
+    """
+    Buffer of set and get commands executed in a batch.
+
+    Used as a context manager, the commands are executed when the block exits without an exception.
+    The results of the commands are available as results afterwards.
+    This implementation executes the commands one by one. Caches override it to execute them in one round trip.
+    """
+    def __init__(self, cache):
+        self._cache = cache
+        self._commands = []
+        self.results = None
+
+    def set(self, key, value):
+        self._commands.append(('set', key, value))
+        return self
+
+    def get(self, key):
+        self._commands.append(('get', key))
+        return self
+
+    def _execute(self, commands):
+        return [self._cache.set(*command[1:]) if command[0] == 'set' else self._cache.get(*command[1:])
+                for command in commands]
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        self.results = self._execute(commands)
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+        else:
+            self._commands = []
+
+
 class Cache(abc.ABC):
     @abc.abstractmethod
     def set(self, key, value):
@@ -37,9 +79,173 @@ class Cache(abc.ABC):
     def get(self, key):
         raise NotImplementedError
 
+    def get_version(self, key):
+        """
+        Get the version of a key, which increases every time a value is set to the key.
+        :param key: key.
+        :return: version or None if the cache does not keep versions.
+        """
+        return None
+
+    def get_with_version(self, key):
+        """
+        Get the value of a key and its version.
+        :param key: key.
+        :return: tuple of value and version.
+        """
+        version = self.get_version(key)
+        return self.get(key), version
+
+    def get_if_modified(self, key, version):
+        """
+        Get the value of a key only if its version differs from the given one.
+        :param key: key.
+        :param version: version of the value the caller already has.
+        :return: tuple of modified flag, value and version. value is None if not modified.
+        """
+        current_version = self.get_version(key)
+        if current_version is not None and current_version == version:
+            return False, None, current_version
+        value, current_version = self.get_with_version(key)
+        return True, value, current_version
+
+    def get_many(self, keys):
+        """
+        Get the values of several keys.
+        :param keys: list of keys.
+        :return: list of values. A value is None if its key does not exist.
+        """
+        return [self.get(key) for key in keys]
+
+    def set_many(self, mapping):
+        """
+        Set several values.
+        :param mapping: dict of keys and values.
+        :return: list of results of set.
+        """
+        return [self.set(key, value) for key, value in mapping.items()]
+
+    def get_many_if_modified(self, keys, versions):
+        """
+        Get the values of several keys which were modified since the given versions.
+        :param keys: list of keys.
+        :param versions: list of versions the caller already has.
+        :return: list of tuples of modified flag, value and version like get_if_modified.
+        """
+        return [self.get_if_modified(key, version) for key, version in zip(keys, versions)]
+
+    def pipeline(self):
+        """
+        Create a pipeline of commands.
+        :return: Pipeline.
+        """
+        return Pipeline(self)
+
+    def get_history(self, key, n):
+        """
+        Get the most recent values of a key.
+        :param key: key.
+        :param n: maximum number of values.
+        :return: list of values, oldest first.
+        """
+        raise NotImplementedError
+
+    def subscribe(self, key, callback):
+        """
+        Call callback(key) whenever a value is set to the key.
+        :param key: key.
+        :param callback: callable taking the key. It may be called from another thread.
+        """
+        raise NotImplementedError
+
+    def unsubscribe(self, key, callback):
+        raise NotImplementedError
+
+
+class AsyncCache(abc.ABC):
+    """ asyncio counterpart of Cache. """
+    @abc.abstractmethod
+    async def set(self, key, value):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get(self, key):
+        raise NotImplementedError
+
+    async def get_if_modified(self, key, version):
+        return True, await self.get(key), None
+
+    async def get_many(self, keys):
+        return [await self.get(key) for key in keys]
+
+    async def set_many(self, mapping):
+        return [await self.set(key, value) for key, value in mapping.items()]
+
+    async def subscribe(self, key, callback):
+        """
+        Call callback(key) in the event loop whenever a value is set to the key.
+        :param key: key.
+        :param callback: callable taking the key.
+        """
+        raise NotImplementedError
+
+    async def unsubscribe(self, key, callback):
+        raise NotImplementedError
+
 
-def get_cache(class_path, **kwargs):
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    hash(value)
+    return value
+
+
+def _create_cache(class_path, **kwargs):
     class_path = class_path.split('.')
     module_path = '.'.join(class_path[:-1])
     class_name = class_path[-1]
     return getattr(importlib.import_module(module_path), class_name)(**kwargs)
+
+
+def get_cache(class_path, shared=True, **kwargs):
+    """
+    Get a cache.
+    With shared, calls with the same class path and arguments in a process return the same instance,
+    so that connections are shared instead of being created for every Data.
+    :param class_path: class path of the cache.
+    :param shared: share the instance.
+    :param kwargs: arguments of the cache.
+    :return: Cache.
+    """
+    if not shared:
+        return _create_cache(class_path, **kwargs)
+    try:
+        key = (os.getpid(), class_path, _freeze(kwargs))
+    except TypeError:
+        return _create_cache(class_path, **kwargs)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = _create_cache(class_path, **kwargs)
+        return cache
+
+
+def reset_caches():
+    """ Forget shared caches. """
+    with _caches_lock:
+        _caches.clear()
+
+
+def _reset_caches_after_fork():
+    global _caches, _caches_lock
+    _caches, _caches_lock = {}, threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_caches_after_fork)
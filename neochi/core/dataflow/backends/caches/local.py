@@ -0,0 +1,247 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import sys
+import time
+import asyncio
+import threading
+import collections
+from . import base
+
+
+def _sizeof(value):
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, memoryview):
+        return value.nbytes
+    if hasattr(value, 'nbytes'):
+        return value.nbytes
+    return sys.getsizeof(value)
+
+
+class _Store:
+    def __init__(self, max_bytes=None):
+        self.lock = threading.RLock()
+        self.entries = collections.OrderedDict()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.subscribers = {}
+        self.versions = {}
+
+    def pop(self, key):
+        value, size, expires_at = self.entries.pop(key)
+        self.size -= size
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def evict(self, required):
+        if self.max_bytes is None:
+            return
+        while self.entries and self.size + required > self.max_bytes:
+            self.pop(next(iter(self.entries)))
+
+
+class LocalPipeline(base.Pipeline):
+    """ Pipeline executing its commands atomically. """
+    def _execute(self, commands):
+        notifications = []
+        with self._cache._store.lock:
+            results = [self._cache._set(command[1], command[2], None, notifications) if command[0] == 'set'
+                       else self._cache._get(command[1]) for command in commands]
+        self._cache._notify(notifications)
+        return results
+
+
+class LocalCache(base.Cache):
+    """
+    Thread-safe in-process cache.
+
+    Instances created with the same name share one store, so data written by one component
+    can be read by another component in the same process without copying.
+    Values are evicted in LRU order once the store exceeds max_bytes.
+    """
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    def __init__(self, name='default', max_bytes=None, ttl=None):
+        """
+        :param name: name of the shared store.
+        :param max_bytes: byte budget of the store. None means unlimited.
+        :param ttl: default time to live of values in seconds. None means values never expire.
+        """
+        with self._stores_lock:
+            if name not in self._stores:
+                self._stores[name] = _Store(max_bytes)
+            elif max_bytes is not None:
+                self._stores[name].max_bytes = max_bytes
+            self._store = self._stores[name]
+        self._ttl = ttl
+
+    @property
+    def size(self):
+        return self._store.size
+
+    def _set(self, key, value, ttl, notifications):
+        ttl = self._ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        size = _sizeof(value)
+        store = self._store
+        if key in store.entries:
+            store.pop(key)
+        else:
+            store.versions[key] = store.versions.get(key, 0) + 1
+        notifications.extend((key, callback) for callback in store.subscribers.get(key, []))
+        if store.max_bytes is not None and size > store.max_bytes:
+            return False
+        store.evict(size)
+        store.entries[key] = (value, size, expires_at)
+        store.size += size
+        return True
+
+    @staticmethod
+    def _notify(notifications):
+        for key, callback in notifications:
+            callback(key)
+
+    def set(self, key, value, ttl=None):
+        notifications = []
+        with self._store.lock:
+            result = self._set(key, value, ttl, notifications)
+        self._notify(notifications)
+        return result
+
+    def set_many(self, mapping, ttl=None):
+        notifications = []
+        with self._store.lock:
+            results = [self._set(key, value, ttl, notifications) for key, value in mapping.items()]
+        self._notify(notifications)
+        return results
+
+    def _get(self, key):
+        store = self._store
+        entry = store.entries.get(key)
+        if entry is None:
+            return None
+        value, size, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            store.pop(key)
+            return None
+        store.entries.move_to_end(key)
+        return value
+
+    def get(self, key):
+        with self._store.lock:
+            return self._get(key)
+
+    def get_version(self, key):
+        with self._store.lock:
+            return self._store.versions.get(key)
+
+    def get_with_version(self, key):
+        with self._store.lock:
+            return self._get(key), self._store.versions.get(key)
+
+    def get_if_modified(self, key, version):
+        with self._store.lock:
+            value = self._get(key)
+            current_version = self._store.versions.get(key)
+            if value is not None and current_version == version:
+                return False, None, current_version
+            return True, value, current_version
+
+    def get_many(self, keys):
+        with self._store.lock:
+            return [self._get(key) for key in keys]
+
+    def get_many_if_modified(self, keys, versions):
+        with self._store.lock:
+            return [self.get_if_modified(key, version) for key, version in zip(keys, versions)]
+
+    def pipeline(self):
+        return LocalPipeline(self)
+
+    def subscribe(self, key, callback):
+        with self._store.lock:
+            self._store.subscribers.setdefault(key, []).append(callback)
+
+    def unsubscribe(self, key, callback):
+        with self._store.lock:
+            callbacks = self._store.subscribers.get(key, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def delete(self, key):
+        store = self._store
+        with store.lock:
+            if key not in store.entries:
+                return False
+            store.pop(key)
+            return True
+
+    def clear(self):
+        store = self._store
+        with store.lock:
+            for key in list(store.entries):
+                store.pop(key)
+
+
+class AsyncLocalCache(base.AsyncCache):
+    """
+    asyncio interface to LocalCache.
+
+    It shares the stores of LocalCache, so values set by threads using LocalCache are notified to coroutines.
+    """
+    def __init__(self, name='default', max_bytes=None, ttl=None):
+        self._cache = LocalCache(name=name, max_bytes=max_bytes, ttl=ttl)
+        self._callbacks = {}
+
+    async def set(self, key, value, ttl=None):
+        return self._cache.set(key, value, ttl=ttl)
+
+    async def get(self, key):
+        return self._cache.get(key)
+
+    async def get_if_modified(self, key, version):
+        return self._cache.get_if_modified(key, version)
+
+    async def get_many(self, keys):
+        return self._cache.get_many(keys)
+
+    async def set_many(self, mapping, ttl=None):
+        return self._cache.set_many(mapping, ttl=ttl)
+
+    async def subscribe(self, key, callback):
+        loop = asyncio.get_event_loop()
+
+        def notify(key):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(callback, key)
+        self._callbacks[(key, callback)] = notify
+        self._cache.subscribe(key, notify)
+
+    async def unsubscribe(self, key, callback):
+        notify = self._callbacks.pop((key, callback), None)
+        if notify is not None:
+            self._cache.unsubscribe(key, notify)
@@ -24,18 +24,113 @@
 __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 
+import os
+import asyncio
+import functools
+import threading
 import redis
 from . import base
 
 
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _get_client(**kwargs):
+    """
+    Get a Redis client shared by the caches connecting with the same parameters in this process.
+    Clients with their own connection pool or a single connection are not shared.
+    """
+    for key in ['charset', 'errors']:
+        if kwargs[key] is None:
+            del kwargs[key]
+    if kwargs['connection_pool'] is not None or kwargs['single_connection_client']:
+        return redis.Redis(**kwargs)
+    try:
+        key = (os.getpid(), base._freeze(kwargs))
+    except TypeError:
+        return redis.Redis(**kwargs)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = redis.Redis(**kwargs)
+        return client
+
+
+def _reset_clients_after_fork():
+    global _clients, _clients_lock
+    _clients, _clients_lock = {}, threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
+def _pool_stats(pool):
+    return {
+        'created_connections': getattr(pool, '_created_connections', None),
+        'available_connections': len(getattr(pool, '_available_connections', [])),
+        'in_use_connections': len(getattr(pool, '_in_use_connections', [])),
+        'max_connections': pool.max_connections,
+    }
+
+
+def pool_stats():
+    """
+    Get statistics of the connection pools of the shared clients in this process.
+    :return: dict of connection descriptions and statistics.
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {repr(client.connection_pool): _pool_stats(client.connection_pool) for client in clients}
+
+
+class RedisPipeline(base.Pipeline):
+    """ Pipeline executing its commands in one MULTI/EXEC transaction. """
+    def _execute(self, commands):
+        pipeline = self._cache._redis.pipeline(transaction=True)
+        indices = []
+        for command in commands:
+            indices.append(len(pipeline))
+            if command[0] == 'set':
+                self._cache._pipe_set(pipeline, command[1], command[2])
+            else:
+                pipeline.get(command[1])
+        results = pipeline.execute()
+        return [results[i] for i in indices]
+
+
 class RedisCache(base.Cache):
+    _get_if_modified_script = """
+        local result = {}
+        for i = 1, #ARGV do
+            local version = redis.call('GET', KEYS[2 * i])
+            if version ~= false and version == ARGV[i] and redis.call('EXISTS', KEYS[2 * i - 1]) == 1 then
+                result[i] = {0, version}
+            else
+                result[i] = {1, version, redis.call('GET', KEYS[2 * i - 1])}
+            end
+        end
+        return result
+    """
+
     def __init__(self, host=u'localhost', port=6379, db=0, password=None,
                  socket_timeout=None, socket_connect_timeout=None, socket_keepalive=None, socket_keepalive_options=None,
                  connection_pool=None, unix_socket_path=None, encoding=u'utf-8', encoding_errors=u'strict',
                  charset=None, errors=None, decode_responses=False, retry_on_timeout=False,
                  ssl=False, ssl_keyfile=None, ssl_certfile=None, ssl_cert_reqs=u'required', ssl_ca_certs=None,
-                 max_connections=None, single_connection_client=False, health_check_interval=0):
-        self._redis = redis.Redis(host=host, port=port, db=db, password=password,
+                 max_connections=None, single_connection_client=False, health_check_interval=0,
+                 keyspace_notifications=False, channel_prefix=u'neochi:', version_suffix=u':version'):
+        """
+        Set values to and get values from Redis.
+
+        Updates are notified to subscribers through pub/sub. By default each set publishes to
+        channel_prefix + key. With keyspace_notifications, subscribers listen to the keyspace
+        notifications of Redis instead, so that writes from other clients are notified as well.
+        Each set also increments the version stored at key + version_suffix.
+        Caches connecting with the same parameters share one client and its connection pool.
+        """
+        self._redis = _get_client(host=host, port=port, db=db, password=password,
                                   socket_timeout=socket_timeout, socket_connect_timeout=socket_connect_timeout,
                                   socket_keepalive=socket_keepalive,
                                   socket_keepalive_options=socket_keepalive_options,
@@ -47,9 +142,195 @@ class RedisCache(base.Cache):
                                   ssl_cert_reqs=ssl_cert_reqs, ssl_ca_certs=ssl_ca_certs,
                                   max_connections=max_connections, single_connection_client=single_connection_client,
                                   health_check_interval=health_check_interval)
+        self._db = db
+        self._keyspace_notifications = keyspace_notifications
+        self._channel_prefix = channel_prefix
+        self._version_suffix = version_suffix
+        self._get_if_modified = self._redis.register_script(self._get_if_modified_script)
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._pubsub = None
+        self._pubsub_thread = None
+
+    def _channel(self, key):
+        if self._keyspace_notifications:
+            return u'__keyspace@%d__:%s' % (self._db, key)
+        return self._channel_prefix + key
+
+    def _key(self, channel):
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        if self._keyspace_notifications:
+            return channel.split(':', 1)[1]
+        return channel[len(self._channel_prefix):]
+
+    def _enable_keyspace_notifications(self):
+        try:
+            flags = self._redis.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+            if isinstance(flags, bytes):
+                flags = flags.decode()
+            missing = ''
+            if 'K' not in flags:
+                missing += 'K'
+            if '$' not in flags and 'A' not in flags:
+                missing += '$'
+            if missing:
+                self._redis.config_set('notify-keyspace-events', flags + missing)
+        except redis.exceptions.ResponseError:
+            pass
+
+    def _handle_message(self, message):
+        key = self._key(message['channel'])
+        with self._lock:
+            callbacks = list(self._callbacks.get(key, []))
+        for callback in callbacks:
+            callback(key)
+
+    def _version_key(self, key):
+        return key + self._version_suffix
+
+    @staticmethod
+    def _to_version(version):
+        return int(version) if version is not None else None
+
+    def _pipe_set(self, pipeline, key, value):
+        pipeline.set(key, value)
+        pipeline.incr(self._version_key(key))
+        if not self._keyspace_notifications:
+            pipeline.publish(self._channel(key), key)
 
     def set(self, key, value):
-        return self._redis.set(key, value)
+        pipeline = self._redis.pipeline(transaction=True)
+        self._pipe_set(pipeline, key, value)
+        return pipeline.execute()[0]
+
+    def set_many(self, mapping):
+        pipeline = self._redis.pipeline(transaction=True)
+        indices = []
+        for key, value in mapping.items():
+            indices.append(len(pipeline))
+            self._pipe_set(pipeline, key, value)
+        results = pipeline.execute()
+        return [results[i] for i in indices]
+
+    def get_many(self, keys):
+        return self._redis.mget(keys)
 
     def get(self, key):
         return self._redis.get(key)
+
+    def get_version(self, key):
+        return self._to_version(self._redis.get(self._version_key(key)))
+
+    def get_with_version(self, key):
+        pipeline = self._redis.pipeline(transaction=True)
+        pipeline.get(key)
+        pipeline.get(self._version_key(key))
+        value, version = pipeline.execute()
+        return value, self._to_version(version)
+
+    def get_if_modified(self, key, version):
+        return self.get_many_if_modified([key], [version])[0]
+
+    def get_many_if_modified(self, keys, versions):
+        redis_keys = []
+        for key in keys:
+            redis_keys.extend((key, self._version_key(key)))
+        results = self._get_if_modified(keys=redis_keys,
+                                        args=[version if version is not None else '' for version in versions])
+        return [(bool(result[0]), result[2] if result[0] else None, self._to_version(result[1]))
+                for result in results]
+
+    def pipeline(self):
+        return RedisPipeline(self)
+
+    def pool_stats(self):
+        return _pool_stats(self._redis.connection_pool)
+
+    def subscribe(self, key, callback):
+        with self._lock:
+            if key not in self._callbacks:
+                self._callbacks[key] = []
+                if self._pubsub is None:
+                    if self._keyspace_notifications:
+                        self._enable_keyspace_notifications()
+                    self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(**{self._channel(key): self._handle_message})
+                if self._pubsub_thread is None:
+                    self._pubsub_thread = self._pubsub.run_in_thread(sleep_time=0.1, daemon=True)
+            self._callbacks[key].append(callback)
+
+    def unsubscribe(self, key, callback):
+        with self._lock:
+            callbacks = self._callbacks.get(key, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks and key in self._callbacks:
+                del self._callbacks[key]
+                self._pubsub.unsubscribe(self._channel(key))
+
+    def close(self):
+        with self._lock:
+            if self._pubsub_thread is not None:
+                self._pubsub_thread.stop()
+                self._pubsub_thread.join(1.)
+                self._pubsub_thread = None
+            if self._pubsub is not None:
+                self._pubsub.close()
+                self._pubsub = None
+            self._callbacks = {}
+
+
+class AsyncRedisCache(base.AsyncCache):
+    """
+    asyncio interface to RedisCache.
+
+    Commands are run by the default executor of the event loop, so that they do not block it.
+    It shares the clients, versions and notifications of RedisCache, so sync and async processes interoperate.
+    """
+    def __init__(self, **kwargs):
+        """
+        :param kwargs: arguments of RedisCache such as host, port and db.
+        """
+        self._cache = RedisCache(**kwargs)
+        self._callbacks = {}
+
+    @staticmethod
+    async def _run(func, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, functools.partial(func, *args))
+
+    async def set(self, key, value):
+        return await self._run(self._cache.set, key, value)
+
+    async def get(self, key):
+        return await self._run(self._cache.get, key)
+
+    async def get_if_modified(self, key, version):
+        return await self._run(self._cache.get_if_modified, key, version)
+
+    async def get_many(self, keys):
+        return await self._run(self._cache.get_many, keys)
+
+    async def set_many(self, mapping):
+        return await self._run(self._cache.set_many, mapping)
+
+    async def get_many_if_modified(self, keys, versions):
+        return await self._run(self._cache.get_many_if_modified, keys, versions)
+
+    async def subscribe(self, key, callback):
+        loop = asyncio.get_event_loop()
+
+        def notify(key):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(callback, key)
+        self._callbacks[(key, callback)] = notify
+        await self._run(self._cache.subscribe, key, notify)
+
+    async def unsubscribe(self, key, callback):
+        notify = self._callbacks.pop((key, callback), None)
+        if notify is not None:
+            await self._run(self._cache.unsubscribe, key, notify)
+
+    async def close(self):
+        self._callbacks = {}
+        await self._run(self._cache.close)
@@ -0,0 +1,366 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import os
+import mmap
+import time
+import select
+import tempfile
+import threading
+import numpy as np
+from . import base
+
+
+class _Ring:
+    """
+    Fixed-size ring of the most recent values of a key in a memory mapped file.
+
+    Layout: a header of four uint64 (magic, slots, slot size, write count) followed by
+    the slots. Each slot starts with two uint64 (sequence, length) followed by the value.
+    The sequence of a slot is odd while the single writer fills it, and 2 * (i + 1) once
+    the i-th write is complete, so readers can detect torn values and retry.
+    """
+    magic = 0x3142524d48534e4e
+    _header_size = 32
+    _slot_header_size = 16
+
+    def __init__(self, path, slots, slot_size, create):
+        self.path = path
+        if create and not os.path.exists(path):
+            self._create(path, slots, slot_size)
+        with open(path, 'r+b') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0)
+        header = np.frombuffer(self._mmap, dtype=np.uint64, count=4)
+        if int(header[0]) != self.magic:
+            del header
+            self._mmap.close()
+            raise ValueError('%s is not a ring buffer.' % path)
+        self.slots, self.slot_size = int(header[1]), int(header[2])
+        self._header = header
+        self._stride = self._slot_header_size + self.slot_size
+        self._slot_headers = [np.frombuffer(self._mmap, dtype=np.uint64, count=2,
+                                            offset=self._header_size + i * self._stride)
+                              for i in range(self.slots)]
+
+    @classmethod
+    def _create(cls, path, slots, slot_size):
+        slot_size = (slot_size + 7) // 8 * 8
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            os.ftruncate(fd, cls._header_size + slots * (cls._slot_header_size + slot_size))
+            os.write(fd, np.array([cls.magic, slots, slot_size, 0], dtype=np.uint64).tobytes())
+        finally:
+            os.close(fd)
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+
+    @property
+    def count(self):
+        return int(self._header[3])
+
+    def _offset(self, slot):
+        return self._header_size + slot * self._stride + self._slot_header_size
+
+    def write(self, value):
+        value = memoryview(value).cast('B')
+        if value.nbytes > self.slot_size:
+            raise ValueError('Value of %d bytes exceeds slot size %d.' % (value.nbytes, self.slot_size))
+        count = self.count
+        slot = count % self.slots
+        slot_header = self._slot_headers[slot]
+        slot_header[0] = 2 * count + 1
+        offset = self._offset(slot)
+        self._mmap[offset:offset + value.nbytes] = value
+        slot_header[1] = value.nbytes
+        slot_header[0] = 2 * count + 2
+        self._header[3] = count + 1
+        return count + 1
+
+    def _read(self, i):
+        slot_header = self._slot_headers[i % self.slots]
+        if int(slot_header[0]) != 2 * i + 2:
+            return None
+        offset = self._offset(i % self.slots)
+        value = self._mmap[offset:offset + int(slot_header[1])]
+        if int(slot_header[0]) != 2 * i + 2:
+            return None
+        return value
+
+    def read(self, n, retries=100):
+        """
+        :return: tuple of the write count and the last n values, oldest first.
+        """
+        for _ in range(retries):
+            count = self.count
+            values = [self._read(i) for i in range(max(0, count - min(n, self.slots - 1)), count)]
+            if all(value is not None for value in values):
+                return count, values
+        raise RuntimeError('Could not read a consistent snapshot of %s.' % self.path)
+
+    def close(self):
+        self._header = None
+        self._slot_headers = []
+        self._mmap.close()
+
+
+class SharedMemoryCache(base.Cache):
+    """
+    Cache sharing values between processes on the same host through memory mapped files.
+
+    Each key holds a ring of its most recent values, so a reader can fetch a window of values in one read.
+    Only one process may write a key at a time.
+    Subscribers are notified by a thread which sleeps on a named pipe until a writer of a subscribed key wakes it
+    and then compares the write counts. The pipe of each subscribing cache is linked into a directory per key,
+    where writers find it. Without named pipes, the thread polls the write counts instead.
+    """
+    def __init__(self, name='neochi', slots=8, slot_size=1 << 20, directory=None, poll_interval=None):
+        """
+        :param name: prefix of the files backing the rings.
+        :param slots: number of values kept per key.
+        :param slot_size: maximum size of a value in bytes.
+        :param directory: directory of the files. /dev/shm is used if available.
+        :param poll_interval: maximum interval in seconds at which subscribed keys are checked without a wakeup.
+                              None means only on wakeups, or every 10 ms if named pipes are not supported.
+        """
+        if directory is None:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        self._name = name
+        self._slots = slots
+        self._slot_size = slot_size
+        self._directory = directory
+        self._poll_interval = poll_interval
+        self._rings = {}
+        self._lock = threading.RLock()
+        self._callbacks = {}
+        self._counts = {}
+        self._poller = None
+        self._wakeup = None
+        self._writers = {}
+        self._writers_lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self._directory, '%s.%s' % (self._name, key.replace('/', '_')))
+
+    def _subscribers_path(self, key):
+        return self._path(key) + '.subscribers'
+
+    def _subscriber_name(self):
+        return '%d.%d' % (os.getpid(), id(self))
+
+    def _ring(self, key, create=False):
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                path = self._path(key)
+                if not create and not os.path.exists(path):
+                    return None
+                ring = self._rings[key] = _Ring(path, self._slots, self._slot_size, create)
+            return ring
+
+    def _count(self, key):
+        ring = self._ring(key)
+        return ring.count if ring is not None else 0
+
+    def _open_wakeup(self):
+        if not hasattr(os, 'mkfifo'):
+            return
+        path = os.path.join(self._directory, '%s.wakeup.%s' % (self._name, self._subscriber_name()))
+        if os.path.exists(path):
+            os.unlink(path)
+        os.mkfifo(path)
+        read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        # Keeping a write end open prevents the read end from reporting EOF when writers close it.
+        write_fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        self._wakeup = (path, read_fd, write_fd)
+
+    def _close_wakeup(self):
+        if self._wakeup is None:
+            return
+        path, read_fd, write_fd = self._wakeup
+        self._wakeup = None
+        os.close(read_fd)
+        os.close(write_fd)
+        if os.path.exists(path):
+            os.unlink(path)
+
+    def _wake(self):
+        if self._wakeup is not None:
+            try:
+                os.write(self._wakeup[2], b'\0')
+            except BlockingIOError:
+                pass
+
+    def _wait(self):
+        if self._wakeup is None:
+            time.sleep(self._poll_interval or 0.01)
+            return
+        read_fd = self._wakeup[1]
+        select.select([read_fd], [], [], self._poll_interval)
+        try:
+            while os.read(read_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _wake_subscribers(self, key):
+        directory = self._subscribers_path(key)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        with self._writers_lock:
+            writers = self._writers.setdefault(key, {})
+            for name in set(writers) - set(names):
+                os.close(writers.pop(name))
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    if name not in writers:
+                        writers[name] = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+                    os.write(writers[name], b'\0')
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    # No process reads the pipe any more, so the subscriber is gone.
+                    if name in writers:
+                        os.close(writers.pop(name))
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _poll(self):
+        while True:
+            with self._lock:
+                if not self._callbacks:
+                    self._poller = None
+                    self._close_wakeup()
+                    return
+                updated = []
+                for key, callbacks in self._callbacks.items():
+                    count = self._count(key)
+                    if count != self._counts[key]:
+                        self._counts[key] = count
+                        updated.append((key, list(callbacks)))
+            for key, callbacks in updated:
+                for callback in callbacks:
+                    callback(key)
+            self._wait()
+
+    def set(self, key, value):
+        if isinstance(value, str):
+            value = value.encode()
+        self._ring(key, create=True).write(value)
+        self._wake_subscribers(key)
+        return True
+
+    def get(self, key):
+        return self.get_with_version(key)[0]
+
+    def get_version(self, key):
+        ring = self._ring(key)
+        if ring is None or ring.count == 0:
+            return None
+        return ring.count
+
+    def get_with_version(self, key):
+        ring = self._ring(key)
+        if ring is None:
+            return None, None
+        count, values = ring.read(1)
+        if not values:
+            return None, None
+        return values[0], count
+
+    def get_history(self, key, n):
+        ring = self._ring(key)
+        if ring is None:
+            return []
+        return ring.read(n)[1]
+
+    def subscribe(self, key, callback):
+        with self._lock:
+            if self._poller is None:
+                self._open_wakeup()
+            if key not in self._callbacks:
+                self._callbacks[key] = []
+                self._counts[key] = self._count(key)
+                if self._wakeup is not None:
+                    os.makedirs(self._subscribers_path(key), exist_ok=True)
+                    link = os.path.join(self._subscribers_path(key), self._subscriber_name())
+                    if not os.path.exists(link):
+                        os.link(self._wakeup[0], link)
+            self._callbacks[key].append(callback)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, daemon=True)
+                self._poller.start()
+
+    def _unlink_subscriber(self, key):
+        link = os.path.join(self._subscribers_path(key), self._subscriber_name())
+        if os.path.exists(link):
+            os.unlink(link)
+
+    def unsubscribe(self, key, callback):
+        with self._lock:
+            callbacks = self._callbacks.get(key, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks and self._callbacks.pop(key, None) is not None:
+                self._unlink_subscriber(key)
+                if not self._callbacks:
+                    self._wake()
+
+    def unlink(self, key):
+        with self._lock:
+            ring = self._rings.pop(key, None)
+        if ring is not None:
+            ring.close()
+        if os.path.exists(self._path(key)):
+            os.unlink(self._path(key))
+
+    def close(self):
+        with self._lock:
+            poller, self._poller = self._poller, None
+            for key in self._callbacks:
+                self._unlink_subscriber(key)
+            self._callbacks = {}
+            self._wake()
+        if poller is not None:
+            poller.join()
+        with self._lock:
+            self._close_wakeup()
+            for ring in self._rings.values():
+                ring.close()
+            self._rings = {}
+        with self._writers_lock:
+            for writers in self._writers.values():
+                for fd in writers.values():
+                    os.close(fd)
+            self._writers = {}
@@ -1,2 +1,4 @@
-from .base import Schema, Data, Image
+from .base import Schema, Data, AsyncData, Image, refresh, store
+from .sampling import FrameSampler
 from . import eye
+from . import brain
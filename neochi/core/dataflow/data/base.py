@@ -27,6 +27,8 @@ __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 import time
 import copy
 import abc
+import asyncio
+import threading
 import numpy as np
 import base64
 from .. import serializers
@@ -65,22 +67,72 @@ class Data(abc.ABC):
     _serializer = serializers.Serializer()
     _key = ''
 
-    def __init__(self, cache):
+    def __init__(self, cache, namespace=None):
+        """
+        :param cache: cache backend.
+        :param namespace: namespace such as a camera ID appended to the key, e.g. 'eye:image:cam1'.
+        """
         self._cache = cache
+        if namespace is not None:
+            self._key = '%s:%s' % (self._key, namespace)
         self._data = {'header': {}, 'body': {}}
+        self._version = None
+        self._loaded = False
+        self._hits = 0
+        self._misses = 0
+        self._condition = threading.Condition()
+        self._subscribed = False
+        self._updates = 0
+        self._seen_updates = 0
+        self._callbacks = []
 
-    def _update_timestamp(self):
-        self._data['header']['timestamp'] = time.time()
+    def _subscribe(self):
+        with self._condition:
+            if not self._subscribed:
+                self._cache.subscribe(self._key, self._notify)
+                self._subscribed = True
 
-    def _download_data(self):
-        json_str = self._cache.get(self._key)
-        if json_str is None:
+    def _notify(self, key):
+        with self._condition:
+            self._updates += 1
+            self._condition.notify_all()
+        for callback in list(self._callbacks):
+            callback(self)
+
+    def _update_timestamp(self, timestamp=None):
+        self._data['header']['timestamp'] = time.time() if timestamp is None else timestamp
+
+    def _serialize(self):
+        return self._serializer.serialize(self._data)
+
+    def _deserialize(self, raw):
+        return self._serializer.deserialize(raw)
+
+    def _load(self, modified, raw, version):
+        if not modified:
+            self._hits += 1
+            return None
+        if raw is None:
+            self._data = {'header': {}, 'body': {}}
+            self._version = version
+            self._loaded = False
             return None
-        self._data = self._serializer.deserialize(json_str)
+        self._misses += 1
+        self._data = self._deserialize(raw)
+        self._version = version
+        self._loaded = True
 
-    def _upload_data(self):
-        json_str = self._serializer.serialize(self._data)
-        self._cache.set(self._key, json_str)
+    def _download_data(self):
+        self._seen_updates = self._updates
+        self._load(*self._cache.get_if_modified(self._key, self._version))
+
+    def _dump(self, value, timestamp=None):
+        self._set_value(value)
+        self._update_timestamp(timestamp)
+        self._version = None
+        raw = self._serialize()
+        self._loaded = True
+        return raw
 
     def _get_value(self):
         raise NotImplementedError
@@ -88,38 +140,230 @@ class Data(abc.ABC):
     def _set_value(self, value):
         raise NotImplementedError
 
+    @property
+    def key(self):
+        return self._key
+
     @property
     def timestamp(self):
         return self._data['header']['timestamp']
 
+    @property
+    def hits(self):
+        """ Number of reads which reused the last decoded value because the version was unchanged. """
+        return self._hits
+
+    @property
+    def misses(self):
+        """ Number of reads which downloaded and decoded the value. """
+        return self._misses
+
     @property
     def value(self):
         self._download_data()
-        return self._get_value()
+        return self._get_value() if self._loaded else None
 
     @value.setter
     def value(self, v):
-        self._set_value(v)
-        self._update_timestamp()
-        self._upload_data()
+        self.set(v)
+
+    def set(self, value, timestamp=None):
+        """
+        Set the value.
+        :param value: value.
+        :param timestamp: time when the value was observed, e.g. when a frame was captured. Now if None.
+        """
+        self._cache.set(self._key, self._dump(value, timestamp))
+
+    def history(self, n, timestamps=False):
+        """
+        Get the most recent values if the cache keeps them.
+        :param n: maximum number of values.
+        :param timestamps: return pairs of timestamp and value.
+        :return: list of values, or of (timestamp, value) with timestamps, oldest first.
+        """
+        self._seen_updates = self._updates
+        self._version = None
+        values = []
+        for raw in self._cache.get_history(self._key, n):
+            self._data = self._deserialize(raw)
+            self._loaded = True
+            values.append((self.timestamp, self._get_value()) if timestamps else self._get_value())
+        return values
+
+    def wait_for_update(self, timeout=None):
+        """
+        Block until the value is updated after the last read.
+        :param timeout: timeout in seconds. None means waiting forever.
+        :return: False if timed out, True otherwise.
+        """
+        self._subscribe()
+        with self._condition:
+            return self._condition.wait_for(lambda: self._updates > self._seen_updates, timeout)
+
+    def add_callback(self, callback):
+        """
+        Call callback(data) whenever the value is updated. The callback may be called from another thread.
+        :param callback: callable taking this data.
+        """
+        self._subscribe()
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def close(self):
+        with self._condition:
+            if self._subscribed:
+                self._cache.unsubscribe(self._key, self._notify)
+                self._subscribed = False
+        self._callbacks = []
+
+
+def _group_by_cache(data):
+    groups = []
+    for datum in data:
+        for cache, group in groups:
+            if cache is datum._cache:
+                group.append(datum)
+                break
+        else:
+            groups.append((datum._cache, [datum]))
+    return groups
+
+
+def refresh(*data):
+    """
+    Download the values of several data in one round trip per cache.
+    :param data: Data instances.
+    :return: list of values. A value is None if it has never been set.
+    """
+    for cache, group in _group_by_cache(data):
+        results = cache.get_many_if_modified([datum._key for datum in group], [datum._version for datum in group])
+        for datum, result in zip(group, results):
+            datum._seen_updates = datum._updates
+            datum._load(*result)
+    return [datum._get_value() if datum._loaded else None for datum in data]
+
+
+def store(*items):
+    """
+    Set the values of several data in one round trip per cache.
+    :param items: tuples of a Data instance and its value.
+    """
+    raws = {datum: datum._dump(value) for datum, value in items}
+    for cache, group in _group_by_cache([datum for datum, value in items]):
+        cache.set_many({datum._key: raws[datum] for datum in group})
+
+
+class AsyncData:
+    """
+    asyncio interface to Data.
+
+    It wraps a Data class so that the same keys, serializers and values are shared with synchronous Data, e.g.
+    AsyncData(eye.Image, AsyncRedisCache(**KWARGS)).
+    """
+    def __init__(self, data_cls, cache, *args, **kwargs):
+        """
+        :param data_cls: Data class.
+        :param cache: AsyncCache.
+        :param args: other arguments of data_cls.
+        :param kwargs: other keyword arguments of data_cls.
+        """
+        self._datum = data_cls(cache, *args, **kwargs)
+        self._cache = cache
+
+    @property
+    def timestamp(self):
+        return self._datum.timestamp
+
+    @property
+    def hits(self):
+        return self._datum.hits
+
+    @property
+    def misses(self):
+        return self._datum.misses
+
+    async def get(self):
+        """
+        Download the value if it was modified since the last read.
+        :return: value, or None if it has never been set.
+        """
+        datum = self._datum
+        datum._load(*await self._cache.get_if_modified(datum._key, datum._version))
+        return datum._get_value() if datum._loaded else None
+
+    async def set(self, value):
+        await self._cache.set(self._datum._key, self._datum._dump(value))
+
+    async def updates(self):
+        """
+        Yield the value whenever it is updated. Updates arriving while the consumer is busy are coalesced.
+        """
+        event = asyncio.Event()
+
+        def notify(key):
+            event.set()
+        await self._cache.subscribe(self._datum._key, notify)
+        try:
+            while True:
+                await event.wait()
+                event.clear()
+                value = await self.get()
+                if value is not None:
+                    yield value
+        finally:
+            await self._cache.unsubscribe(self._datum._key, notify)
+
+    def __aiter__(self):
+        return self.updates()
 
 
 class Image(Data):
     class Serializer(serializers.Serializer):
+        _compile = True
+        _validator_extensions = [serializers.validators.default_value_extension,
+                                 serializers.validators.ndarray_type_extension]
         _schema = Schema.create(body={
             'type': 'object',
             'properties': {
                 'height': {'type': 'integer'},
                 'width': {'type': 'integer'},
                 'channel': {'type': 'integer'},
-                'image': {'type': 'string'},
+                'image': {'type': ['string', 'ndarray']},
             },
             'required': ['height', 'width', 'image', ]
         })
 
     _serializer = Serializer()
+    _binary_serializer = serializers.ImageSerializer()
+    _binary = False
     _key = 'image'
 
+    def __init__(self, cache, binary=None, namespace=None):
+        """
+        :param cache: cache backend.
+        :param binary: store the image as a binary frame instead of base64 in JSON.
+                       Readers accept both formats regardless of this flag.
+        :param namespace: namespace appended to the key.
+        """
+        super().__init__(cache, namespace)
+        if binary is not None:
+            self._binary = binary
+        self._decoded = (None, None)
+
+    def _serialize(self):
+        if self._binary:
+            return self._binary_serializer.serialize(self._data)
+        return self._serializer.serialize(self._data)
+
+    def _deserialize(self, raw):
+        if self._binary_serializer.is_binary(raw):
+            return self._binary_serializer.deserialize(raw)
+        return self._serializer.deserialize(raw)
+
     def _set_value(self, value):
         if isinstance(value, list):
             value = np.array(value, dtype=np.uint8)
@@ -129,7 +373,10 @@ class Image(Data):
             raise ValueError('Dimension of ndarray must be 2 or 3')
         if len(value.shape) == 3 and value.shape[2] != 3:
             raise ValueError('Channel length must be 3.')
-        encoded_image = base64.b64encode(value.tostring()).decode()
+        if self._binary or self._serializer.native_ndarray:
+            encoded_image = value
+        else:
+            encoded_image = base64.b64encode(value.tobytes()).decode()
         if len(value.shape) == 2:
             self._data['body'] = {'height': value.shape[0],
                                   'width': value.shape[1],
@@ -141,11 +388,17 @@ class Image(Data):
                                   'image': encoded_image}
 
     def _get_value(self):
-        decoded_image = base64.b64decode(self._data['body']['image'].encode())
-        if 'channel' in self._data['body']:
+        body = self._data['body']
+        if isinstance(body['image'], np.ndarray):
+            return body['image']
+        if self._decoded[0] is body:
+            return self._decoded[1]
+        decoded_image = base64.b64decode(body['image'].encode())
+        if 'channel' in body:
             image = np.frombuffer(decoded_image, dtype=np.uint8)\
-                .reshape((self._data['body']['height'], self._data['body']['width'], self._data['body']['channel']))
+                .reshape((body['height'], body['width'], body['channel']))
         else:
             image = np.frombuffer(decoded_image, dtype=np.uint8)\
-                .reshape((self._data['body']['height'], self._data['body']['width']))
+                .reshape((body['height'], body['width']))
+        self._decoded = (body, image)
         return image
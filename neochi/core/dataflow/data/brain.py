@@ -0,0 +1,52 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+from . import base
+from .. import serializers
+
+
+class Behavior(base.Data):
+    class Serializer(serializers.Serializer):
+        _compile = True
+        _schema = base.Schema.create(body={
+            'type': 'object',
+            'properties': {
+                'index': {'type': 'integer'},
+                'label': {'type': ['string', 'null'], 'default': None},
+                'probabilities': {'type': 'array', 'items': {'type': 'number'}},
+                'window_timestamp': {'type': ['number', 'null'], 'default': None},
+            },
+            'required': ['index', 'probabilities']
+        })
+
+    _serializer = Serializer()
+    _key = 'brain:behavior'
+
+    def _get_value(self):
+        return self._data['body']
+
+    def _set_value(self, value):
+        self._data['body'] = value
@@ -34,6 +34,7 @@ class Image(base.Image):
 
 class State(base.Data):
     class Serializer(serializers.Serializer):
+        _compile = True
         _schema = base.Schema.create(body={
             'type': 'object',
             'properties': {
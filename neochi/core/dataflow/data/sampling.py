@@ -0,0 +1,91 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import numpy as np
+
+
+class FrameSampler:
+    """
+    Resample frames to a fixed rate by their header timestamps.
+
+    Frames are emitted at every 1 / fps seconds. When frames arrive faster than fps, the extra frames are dropped,
+    and when they arrive slower, frames are repeated or interpolated.
+    """
+    def __init__(self, fps=None, method='nearest', max_gap=1.):
+        """
+        :param fps: frames per second of the output, e.g. BehaviorClassifier.fps. None passes all frames.
+        :param method: 'nearest' to select the nearest frame, or 'linear' to interpolate adjacent frames.
+        :param max_gap: seconds without frames after which sampling restarts instead of filling the gap.
+        """
+        if method not in ('nearest', 'linear'):
+            raise ValueError('Unknown method: %s' % method)
+        self._fps = fps
+        self._method = method
+        self._max_gap = max_gap
+        self._previous = None
+        self._next_time = None
+
+    @property
+    def fps(self):
+        return self._fps
+
+    def reset(self):
+        self._previous = None
+        self._next_time = None
+
+    def _interpolate(self, sample_time, timestamp, frame):
+        previous_timestamp, previous_frame = self._previous
+        weight = (sample_time - previous_timestamp) / (timestamp - previous_timestamp)
+        if self._method == 'nearest':
+            return previous_frame if weight < 0.5 else frame
+        mixed = (1. - weight) * previous_frame + weight * np.asarray(frame)
+        if np.issubdtype(np.asarray(frame).dtype, np.integer):
+            mixed = np.rint(mixed)
+        return mixed.astype(np.asarray(frame).dtype)
+
+    def add(self, timestamp, frame):
+        """
+        :param timestamp: timestamp of the frame.
+        :param frame: frame.
+        :return: list of frames sampled up to the timestamp. It is empty for duplicated or older frames.
+        """
+        if self._fps is None:
+            if self._previous is not None and timestamp <= self._previous[0]:
+                return []
+            self._previous = timestamp, frame
+            return [frame]
+        if self._previous is None or (self._max_gap is not None and timestamp - self._next_time > self._max_gap):
+            self._previous = timestamp, frame
+            self._next_time = timestamp + 1. / self._fps
+            return [frame]
+        if timestamp <= self._previous[0]:
+            return []
+        frames = []
+        while self._next_time <= timestamp:
+            frames.append(self._interpolate(self._next_time, timestamp, frame))
+            self._next_time += 1. / self._fps
+        self._previous = timestamp, frame
+        return frames
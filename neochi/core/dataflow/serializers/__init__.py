@@ -25,4 +25,9 @@ __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 
 from .base import Encoder, Decoder, Serializer
-from . import exceptions
\ No newline at end of file
+from .image import ImageSerializer
+from . import exceptions
+from . import formats
+from . import validators
+from . import registry
+from .registry import register
\ No newline at end of file
@@ -25,16 +25,18 @@ __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 
 import json
-import importlib
 import jsonschema
 from . import validators
+from . import exceptions
+from . import formats
+from . import registry
 
 
 class Encoder(json.JSONEncoder):
     def default(self, o):
         if hasattr(o, '__to_json__'):
-            json_obj = o.__to_json__()
-            json_obj['__json__'] = '{}/{}'.format(o.__module__, o.__class__.__name__)
+            json_obj = dict(o.__to_json__())
+            json_obj['__json__'] = registry.type_tag(o)
             return json_obj
         return super().default(o)
 
@@ -44,13 +46,10 @@ class Decoder(json.JSONDecoder):
         super().__init__(object_hook=self._object_hook, *args, **kwargs)
 
     def _object_hook(self, obj):
-        if '__json__' in obj:
-            module_path, cls_name = obj['__json__'].split('/')
-            cls = getattr(importlib.import_module(module_path), cls_name)
-            del obj['__json__']
-            return cls.__from_json__(obj)
-        else:
+        tag = obj.pop('__json__', None)
+        if tag is None:
             return obj
+        return registry.resolve(tag).__from_json__(obj)
 
 
 class BaseSerializer(type):
@@ -72,7 +71,17 @@ class BaseSerializer(type):
 
 
 class Serializer:
-    """ Serializing object to JSON and deserializing JSON to object. """
+    """
+    Serializing object to JSON and deserializing JSON to object.
+
+    _format selects the wire format by a formats.Format instance or its name in formats.FORMATS.
+    None means JSON encoded with _encoder and decoded with _decoder.
+    With _compile, the schema is compiled once into plain Python functions instead of being
+    interpreted by jsonschema on every call. It falls back to jsonschema if the schema has unsupported keywords.
+    _validation decides when objects are validated:
+    'always' on serialize and deserialize, 'writer' only on serialize,
+    and 'sample' once every _sample_rate calls. Default values are filled in either way.
+    """
     _encoder = Encoder
     _decoder = Decoder
     _validator = jsonschema.validators.Draft7Validator
@@ -81,9 +90,30 @@ class Serializer:
         'type': 'object',
         'properties': {},
     }
+    _format = None
+    _compile = False
+    _validation = 'always'
+    _sample_rate = 100
 
     def __init__(self):
+        if self._validation not in ('always', 'writer', 'sample'):
+            raise ValueError('Unknown validation policy: %s' % self._validation)
         self._validator = self._create_validator()
+        self._compiled_validator = self._compile_validator() if self._compile else None
+        self._fill_defaults = validators.compile_defaults(self._schema)
+        self._calls = 0
+        self._wire_format = self._create_format()
+
+    def _create_format(self):
+        if self._format is None:
+            return formats.JsonFormat(self._encoder, self._decoder)
+        if isinstance(self._format, str):
+            return formats.get_format(self._format)
+        return self._format
+
+    @property
+    def native_ndarray(self):
+        return self._wire_format.native_ndarray
 
     def _create_validator(self):
         validator = self._validator
@@ -91,24 +121,47 @@ class Serializer:
             validator = extension(validator)
         return validator(self._schema)
 
+    def _compile_validator(self):
+        try:
+            return validators.compile_validator(self._schema)
+        except exceptions.SchemaCompileError:
+            return None
+
+    def _needs_validation(self, serializing):
+        if self._validation == 'always':
+            return True
+        if self._validation == 'writer':
+            return serializing
+        self._calls += 1
+        return (self._calls - 1) % self._sample_rate == 0
+
+    def _validate_or_fill_defaults(self, obj, serializing):
+        if self._needs_validation(serializing):
+            self.validate(obj)
+        else:
+            self._fill_defaults(obj)
+
     def validate(self, obj):
-        self._validator.validate(obj)
+        if self._compiled_validator is not None:
+            self._compiled_validator(obj)
+        else:
+            self._validator.validate(obj)
 
     def serialize(self, obj):
         """
-        Encode object to JSON.
+        Encode object to JSON or the wire format.
         :param obj: object encoded.
-        :return: JSON string
+        :return: JSON string or bytes
         """
-        self._validator.validate(obj)
-        return json.dumps(obj, cls=self._encoder)
+        self._validate_or_fill_defaults(obj, True)
+        return self._wire_format.dumps(obj)
 
     def deserialize(self, json_str):
         """
-        Decode JSON to object.
+        Decode JSON or the wire format to object.
         :param json_str:
         :return: dict, list or any object having __from_json__ method.
         """
-        obj = json.loads(json_str, cls=self._decoder)
-        self._validator.validate(obj)
+        obj = self._wire_format.loads(json_str)
+        self._validate_or_fill_defaults(obj, False)
         return obj
@@ -24,4 +24,12 @@
 __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 
-from jsonschema.exceptions import ValidationError
\ No newline at end of file
+from jsonschema.exceptions import ValidationError
+
+
+class SchemaCompileError(ValueError):
+    pass
+
+
+class UnknownTypeError(ValueError):
+    pass
@@ -0,0 +1,272 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import abc
+import json
+import struct
+import numpy as np
+from . import registry
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+class Format(abc.ABC):
+    """
+    Wire format converting objects to str or bytes and back.
+
+    Objects having __to_json__ and __from_json__ are supported by every format.
+    Formats with native_ndarray encode ndarray values as raw bytes instead of requiring base64 strings.
+    """
+    native_ndarray = False
+
+    @abc.abstractmethod
+    def dumps(self, obj):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def loads(self, raw):
+        raise NotImplementedError
+
+
+class JsonFormat(Format):
+    def __init__(self, encoder=json.JSONEncoder, decoder=json.JSONDecoder):
+        self._encoder = encoder()
+        self._decoder = decoder()
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj)
+
+    def loads(self, raw):
+        if isinstance(raw, (bytes, bytearray)):
+            raw = raw.decode(json.detect_encoding(raw))
+        return self._decoder.decode(raw)
+
+
+class MsgpackFormat(Format):
+    native_ndarray = True
+    _ndarray_code = 1
+    _object_code = 2
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError('msgpack is required for MsgpackFormat.')
+
+    def _default(self, obj):
+        if isinstance(obj, np.ndarray):
+            obj = np.require(obj, requirements='C')
+            return msgpack.ExtType(self._ndarray_code, msgpack.packb(
+                [obj.dtype.str, list(obj.shape), memoryview(obj.reshape(-1)).cast('B')], use_bin_type=True))
+        if hasattr(obj, '__to_json__'):
+            return msgpack.ExtType(self._object_code, msgpack.packb(
+                [registry.type_tag(obj), obj.__to_json__()], default=self._default, use_bin_type=True))
+        raise TypeError('Object of type %s is not serializable' % obj.__class__.__name__)
+
+    def _ext_hook(self, code, data):
+        if code == self._ndarray_code:
+            dtype, shape, buffer = msgpack.unpackb(data, raw=False)
+            return np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+        if code == self._object_code:
+            tag, json_obj = msgpack.unpackb(data, raw=False, ext_hook=self._ext_hook)
+            return registry.resolve(tag).__from_json__(json_obj)
+        return msgpack.ExtType(code, data)
+
+    def dumps(self, obj):
+        return msgpack.packb(obj, default=self._default, use_bin_type=True)
+
+    def loads(self, raw):
+        return msgpack.unpackb(raw, raw=False, ext_hook=self._ext_hook)
+
+
+class CborFormat(Format):
+    native_ndarray = True
+    _ndarray_tag = 40001
+    _object_tag = 40002
+
+    def __init__(self):
+        if cbor2 is None:
+            raise ImportError('cbor2 is required for CborFormat.')
+
+    def _default(self, encoder, obj):
+        if isinstance(obj, np.ndarray):
+            obj = np.require(obj, requirements='C')
+            encoder.encode(cbor2.CBORTag(self._ndarray_tag, [obj.dtype.str, list(obj.shape), obj.tobytes()]))
+        elif hasattr(obj, '__to_json__'):
+            encoder.encode(cbor2.CBORTag(self._object_tag, [registry.type_tag(obj), obj.__to_json__()]))
+        else:
+            raise TypeError('Object of type %s is not serializable' % obj.__class__.__name__)
+
+    def _tag_hook(self, *args):
+        # cbor2 passes (decoder, tag) or (tag, immutable) depending on its version.
+        tag = next(arg for arg in args if isinstance(arg, cbor2.CBORTag))
+        if tag.tag == self._ndarray_tag:
+            dtype, shape, buffer = tag.value
+            return np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+        if tag.tag == self._object_tag:
+            type_name, json_obj = tag.value
+            return registry.resolve(type_name).__from_json__(dict(json_obj))
+        return tag
+
+    def dumps(self, obj):
+        return cbor2.dumps(obj, default=self._default)
+
+    def loads(self, raw):
+        return cbor2.loads(raw, tag_hook=self._tag_hook)
+
+
+class StructFormat(Format):
+    """
+    Compact built-in binary format.
+
+    Each value is a one byte type code followed by its payload. Lengths and shapes are little endian uint32.
+    ndarray values are stored as dtype, shape and raw bytes, and decoded as views on the given buffer.
+    """
+    native_ndarray = True
+    magic = b'NCSF'
+    _uint32 = struct.Struct('<I')
+    _int64 = struct.Struct('<q')
+    _float64 = struct.Struct('<d')
+
+    def _encode(self, obj, chunks):
+        if obj is None:
+            chunks.append(b'N')
+        elif obj is True:
+            chunks.append(b'T')
+        elif obj is False:
+            chunks.append(b'F')
+        elif isinstance(obj, int):
+            chunks.extend((b'i', self._int64.pack(obj)))
+        elif isinstance(obj, float):
+            chunks.extend((b'd', self._float64.pack(obj)))
+        elif isinstance(obj, str):
+            encoded = obj.encode()
+            chunks.extend((b's', self._uint32.pack(len(encoded)), encoded))
+        elif isinstance(obj, (bytes, bytearray)):
+            chunks.extend((b'b', self._uint32.pack(len(obj)), obj))
+        elif isinstance(obj, np.ndarray):
+            obj = np.require(obj, requirements='C')
+            dtype = obj.dtype.str.encode()
+            chunks.extend((b'a', self._uint32.pack(len(dtype)), dtype, self._uint32.pack(obj.ndim)))
+            chunks.extend(self._uint32.pack(n) for n in obj.shape)
+            chunks.append(memoryview(obj.reshape(-1)).cast('B'))
+        elif isinstance(obj, (list, tuple)):
+            chunks.extend((b'l', self._uint32.pack(len(obj))))
+            for item in obj:
+                self._encode(item, chunks)
+        elif isinstance(obj, dict):
+            chunks.extend((b'm', self._uint32.pack(len(obj))))
+            for key, value in obj.items():
+                self._encode(key, chunks)
+                self._encode(value, chunks)
+        elif isinstance(obj, np.generic):
+            self._encode(obj.item(), chunks)
+        elif hasattr(obj, '__to_json__'):
+            chunks.append(b'o')
+            self._encode(registry.type_tag(obj), chunks)
+            self._encode(obj.__to_json__(), chunks)
+        else:
+            raise TypeError('Object of type %s is not serializable' % obj.__class__.__name__)
+
+    def _decode(self, raw, view, offset):
+        code = view[offset]
+        offset += 1
+        if code == 0x4e:  # N
+            return None, offset
+        if code == 0x54:  # T
+            return True, offset
+        if code == 0x46:  # F
+            return False, offset
+        if code == 0x69:  # i
+            return self._int64.unpack_from(view, offset)[0], offset + 8
+        if code == 0x64:  # d
+            return self._float64.unpack_from(view, offset)[0], offset + 8
+        if code in (0x73, 0x62):  # s, b
+            length = self._uint32.unpack_from(view, offset)[0]
+            offset += 4
+            value = view[offset:offset + length]
+            return (str(value, 'utf-8') if code == 0x73 else value.tobytes()), offset + length
+        if code == 0x61:  # a
+            length = self._uint32.unpack_from(view, offset)[0]
+            dtype = np.dtype(str(view[offset + 4:offset + 4 + length], 'ascii'))
+            offset += 4 + length
+            ndim = self._uint32.unpack_from(view, offset)[0]
+            shape = struct.unpack_from('<%dI' % ndim, view, offset + 4)
+            offset += 4 + 4 * ndim
+            count = int(np.prod(shape))
+            value = np.frombuffer(raw, dtype=dtype, count=count, offset=offset).reshape(shape)
+            return value, offset + count * dtype.itemsize
+        if code == 0x6c:  # l
+            length = self._uint32.unpack_from(view, offset)[0]
+            offset += 4
+            value = []
+            for _ in range(length):
+                item, offset = self._decode(raw, view, offset)
+                value.append(item)
+            return value, offset
+        if code == 0x6d:  # m
+            length = self._uint32.unpack_from(view, offset)[0]
+            offset += 4
+            value = {}
+            for _ in range(length):
+                key, offset = self._decode(raw, view, offset)
+                value[key], offset = self._decode(raw, view, offset)
+            return value, offset
+        if code == 0x6f:  # o
+            tag, offset = self._decode(raw, view, offset)
+            json_obj, offset = self._decode(raw, view, offset)
+            return registry.resolve(tag).__from_json__(json_obj), offset
+        raise ValueError('Unknown type code %r at %d.' % (chr(code), offset - 1))
+
+    def dumps(self, obj):
+        chunks = [self.magic]
+        self._encode(obj, chunks)
+        return b''.join(chunks)
+
+    def loads(self, raw):
+        view = memoryview(raw).cast('B')
+        if view[:len(self.magic)] != self.magic:
+            raise ValueError('Invalid magic bytes.')
+        value, offset = self._decode(raw, view, len(self.magic))
+        return value
+
+
+FORMATS = {
+    'json': JsonFormat,
+    'msgpack': MsgpackFormat,
+    'cbor': CborFormat,
+    'struct': StructFormat,
+}
+
+
+def get_format(name, **kwargs):
+    return FORMATS[name](**kwargs)
@@ -0,0 +1,87 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import struct
+import numpy as np
+from . import exceptions
+
+
+class ImageSerializer:
+    """
+    Serializing image data to a fixed size binary header followed by the raw pixel bytes.
+
+    The header holds the magic bytes, the timestamp, the dtype and the shape of the image.
+    Deserialized images are views on the given buffer, so no intermediate copy is made.
+    """
+    magic = b'NCIM'
+    _header = struct.Struct('<4sd4sB3xIII')
+
+    @classmethod
+    def is_binary(cls, raw):
+        return isinstance(raw, (bytes, bytearray, memoryview)) and bytes(raw[:len(cls.magic)]) == cls.magic
+
+    def validate(self, obj):
+        try:
+            timestamp = obj['header']['timestamp']
+            image = obj['body']['image']
+        except (KeyError, TypeError) as e:
+            raise exceptions.ValidationError('Missing field: %s' % e)
+        if not isinstance(timestamp, (int, float)):
+            raise exceptions.ValidationError('Timestamp must be a number.')
+        if not isinstance(image, np.ndarray):
+            raise exceptions.ValidationError('Image must be ndarray.')
+        if not (image.ndim == 2 or image.ndim == 3):
+            raise exceptions.ValidationError('Dimension of ndarray must be 2 or 3')
+
+    def serialize(self, obj):
+        """
+        Encode image data to bytes.
+        :param obj: dict having header.timestamp and body.image.
+        :return: bytes
+        """
+        self.validate(obj)
+        image = np.ascontiguousarray(obj['body']['image'])
+        shape = image.shape + (0, ) * (3 - image.ndim)
+        header = self._header.pack(self.magic, obj['header']['timestamp'], image.dtype.str.encode(),
+                                   image.ndim, *shape)
+        return header + image.tobytes()
+
+    def deserialize(self, raw):
+        """
+        Decode bytes to image data.
+        :param raw: bytes encoded by serialize.
+        :return: dict having header and body. body.image is a read-only ndarray sharing memory with raw.
+        """
+        if not self.is_binary(raw):
+            raise exceptions.ValidationError('Invalid magic bytes.')
+        magic, timestamp, dtype, ndim, height, width, channel = self._header.unpack_from(raw)
+        shape = (height, width, channel)[:ndim]
+        image = np.frombuffer(raw, dtype=np.dtype(dtype.rstrip(b'\x00').decode()),
+                              count=int(np.prod(shape)), offset=self._header.size).reshape(shape)
+        body = {'height': height, 'width': width, 'image': image}
+        if ndim == 3:
+            body['channel'] = channel
+        return {'header': {'timestamp': timestamp}, 'body': body}
@@ -0,0 +1,109 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import threading
+import importlib
+from . import exceptions
+
+
+_lock = threading.Lock()
+_classes = {}
+_tags = {}
+_allowed_modules = {'neochi'}
+
+
+def register(cls=None, name=None):
+    """
+    Register a class having __to_json__ and __from_json__ so that it is decoded without importing its module.
+    It can be used as a decorator with or without arguments.
+    :param cls: registered class.
+    :param name: type tag written to encoded objects. module/ClassName by default.
+    """
+    def _register(cls):
+        tag = name if name is not None else '{}/{}'.format(cls.__module__, cls.__name__)
+        with _lock:
+            _classes[tag] = cls
+            _tags[cls] = tag
+        return cls
+    if cls is None:
+        return _register
+    return _register(cls)
+
+
+def allow(*modules):
+    """
+    Allow classes in the modules and their submodules to be imported when decoding unregistered type tags.
+    :param modules: module paths such as 'neochi'.
+    """
+    with _lock:
+        _allowed_modules.update(modules)
+
+
+def disallow(*modules):
+    with _lock:
+        _allowed_modules.difference_update(modules)
+
+
+def _is_allowed(module_path):
+    return any(module_path == module or module_path.startswith(module + '.') for module in _allowed_modules)
+
+
+def type_tag(obj):
+    cls = obj.__class__
+    tag = _tags.get(cls)
+    if tag is None:
+        tag = '{}/{}'.format(cls.__module__, cls.__name__)
+    return tag
+
+
+def resolve(tag):
+    """
+    Get the class of a type tag.
+    Unregistered tags are resolved by importing their module if it is allowed, and cached afterwards.
+    :param tag: type tag.
+    :return: class.
+    :raise UnknownTypeError: if the tag is neither registered nor in an allowed module.
+    """
+    cls = _classes.get(tag)
+    if cls is not None:
+        return cls
+    try:
+        module_path, cls_name = tag.split('/')
+    except (AttributeError, ValueError):
+        raise exceptions.UnknownTypeError('Invalid type tag: %r' % (tag, ))
+    with _lock:
+        allowed = _is_allowed(module_path)
+    if not allowed:
+        raise exceptions.UnknownTypeError('Module %s is not allowed.' % module_path)
+    try:
+        cls = getattr(importlib.import_module(module_path), cls_name)
+    except (ImportError, AttributeError):
+        raise exceptions.UnknownTypeError('Unknown type: %s' % tag)
+    if not hasattr(cls, '__from_json__'):
+        raise exceptions.UnknownTypeError('%s does not have __from_json__.' % tag)
+    with _lock:
+        _classes[tag] = cls
+    return cls
@@ -25,6 +25,8 @@ __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 
 import jsonschema
+import numpy as np
+from . import exceptions
 
 
 def default_value_extension(validator_class):
@@ -40,3 +42,142 @@ def default_value_extension(validator_class):
             yield error
 
     return jsonschema.validators.extend(validator_class, {'properties': set_defaults})
+
+
+def ndarray_type_extension(validator_class):
+    type_checker = validator_class.TYPE_CHECKER.redefine(
+        'ndarray', lambda checker, instance: isinstance(instance, np.ndarray))
+    return jsonschema.validators.extend(validator_class, type_checker=type_checker)
+
+
+_TYPES = {
+    'object': lambda v: isinstance(v, dict),
+    'array': lambda v: isinstance(v, list),
+    'string': lambda v: isinstance(v, str),
+    'number': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    'integer': lambda v: (isinstance(v, int) and not isinstance(v, bool)) or (isinstance(v, float) and v.is_integer()),
+    'boolean': lambda v: isinstance(v, bool),
+    'null': lambda v: v is None,
+    'ndarray': lambda v: isinstance(v, np.ndarray),
+}
+_KEYWORDS = {'type', 'properties', 'required', 'default', 'items', 'enum', 'title', 'description'}
+_MISSING = object()
+
+
+def _noop(instance):
+    pass
+
+
+def _default(subschema):
+    default = subschema.get('default', _MISSING)
+    return default() if callable(default) else default
+
+
+def compile_defaults(schema):
+    """
+    Compile a schema into a function filling default values of properties in place.
+    :param schema: JSON schema.
+    :return: function taking an instance.
+    """
+    properties = [(name, subschema, compile_defaults(subschema))
+                  for name, subschema in schema.get('properties', {}).items()]
+    items = compile_defaults(schema['items']) if isinstance(schema.get('items'), dict) else None
+    if not properties and items is None:
+        return _noop
+
+    def fill_defaults(instance):
+        if properties and isinstance(instance, dict):
+            for name, subschema, fill in properties:
+                if name not in instance:
+                    value = _default(subschema)
+                    if value is _MISSING:
+                        continue
+                    instance[name] = value
+                fill(instance[name])
+        if items is not None and isinstance(instance, list):
+            for item in instance:
+                items(item)
+    return fill_defaults
+
+
+def compile_validator(schema):
+    """
+    Compile a schema into a function validating an instance and filling default values in place.
+    It behaves like Draft7Validator extended by default_value_extension for the supported keywords.
+    :param schema: JSON schema.
+    :return: function taking an instance and raising ValidationError if it is invalid.
+    :raise SchemaCompileError: if the schema has unsupported keywords.
+    """
+    unsupported = set(schema) - _KEYWORDS
+    if unsupported:
+        raise exceptions.SchemaCompileError('Unsupported keywords: %s' % ', '.join(sorted(unsupported)))
+    checks = []
+
+    if 'type' in schema:
+        types = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+        if any(t not in _TYPES for t in types):
+            raise exceptions.SchemaCompileError('Unsupported type: %s' % schema['type'])
+        type_checks = [_TYPES[t] for t in types]
+
+        def check_type(instance):
+            for type_check in type_checks:
+                if type_check(instance):
+                    return
+            raise exceptions.ValidationError('%r is not of type %s' % (instance, ', '.join(repr(t) for t in types)))
+        checks.append(check_type)
+
+    if 'enum' in schema:
+        enum = schema['enum']
+
+        def check_enum(instance):
+            if instance not in enum:
+                raise exceptions.ValidationError('%r is not one of %r' % (instance, enum))
+        checks.append(check_enum)
+
+    if 'properties' in schema:
+        properties = [(name, subschema, compile_validator(subschema)) for name, subschema in schema['properties'].items()]
+
+        def check_properties(instance):
+            if not isinstance(instance, dict):
+                return
+            for name, subschema, validate in properties:
+                if name not in instance:
+                    value = _default(subschema)
+                    if value is _MISSING:
+                        continue
+                    instance[name] = value
+                validate(instance[name])
+        checks.append(check_properties)
+
+    if 'required' in schema:
+        required = schema['required']
+
+        def check_required(instance):
+            if not isinstance(instance, dict):
+                return
+            for name in required:
+                if name not in instance:
+                    raise exceptions.ValidationError('%r is a required property' % name)
+        checks.append(check_required)
+
+    if 'items' in schema:
+        if not isinstance(schema['items'], dict):
+            raise exceptions.SchemaCompileError('Only a single schema is supported for items.')
+        validate_item = compile_validator(schema['items'])
+
+        def check_items(instance):
+            if not isinstance(instance, list):
+                return
+            for item in instance:
+                validate_item(item)
+        checks.append(check_items)
+
+    if not checks:
+        return _noop
+    if len(checks) == 1:
+        return checks[0]
+
+    def validate(instance):
+        for check in checks:
+            check(instance)
+    return validate
@@ -0,0 +1,92 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import time
+import cv2
+import numpy as np
+
+
+class ChangeDetector:
+    """
+    Gate of frames which passes a frame only if it differs from the last passed frame or a keyframe is due.
+
+    The difference method compares the mean absolute difference of downscaled grayscale frames with the threshold.
+    The hash method compares the Hamming distance of difference hashes with the threshold.
+    """
+    def __init__(self, threshold=4., size=(8, 8), keyframe_interval=10., method='difference'):
+        """
+        :param threshold: minimum difference of a changed frame. Mean intensity for difference, bits for hash.
+        :param size: size (width, height) of the downscaled frame.
+        :param keyframe_interval: seconds after which a frame is passed even if it is unchanged. None means never.
+        :param method: 'difference' or 'hash'.
+        """
+        if method not in ('difference', 'hash'):
+            raise ValueError('Unknown method: %s' % method)
+        self._threshold = threshold
+        self._size = tuple(size)
+        self._keyframe_interval = keyframe_interval
+        self._method = method
+        self._reference = None
+        self._reference_time = None
+        self.passed = 0
+        self.suppressed = 0
+
+    def _gray(self, frame, size):
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def _signature(self, frame):
+        if self._method == 'hash':
+            gray = self._gray(frame, (self._size[0] + 1, self._size[1]))
+            return gray[:, 1:] > gray[:, :-1]
+        return self._gray(frame, self._size).astype(np.int16)
+
+    def _difference(self, signature):
+        if self._method == 'hash':
+            return np.count_nonzero(signature != self._reference)
+        return np.mean(np.abs(signature - self._reference))
+
+    def __call__(self, frame, timestamp=None):
+        """
+        :param frame: frame.
+        :param timestamp: time of the frame. The current time is used if None.
+        :return: True if the frame should be published.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        signature = self._signature(frame)
+        if self._reference is not None and self._difference(signature) < self._threshold and \
+                (self._keyframe_interval is None or timestamp - self._reference_time < self._keyframe_interval):
+            self.suppressed += 1
+            return False
+        self._reference = signature
+        self._reference_time = timestamp
+        self.passed += 1
+        return True
+
+    def reset(self):
+        """ Pass the next frame regardless of the difference. """
+        self._reference = None
@@ -23,7 +23,12 @@
 __author__ = 'Junya Kaneko <junya@mpsamurai.org>, Yutaro Kida'
 
 
+import os
+import copy
+import json
 import time
+import base64
+import threading
 import cv2
 import numpy as np
 
@@ -35,6 +40,9 @@ except ImportError:
     PI_CAMERA = False
 
 from neochi.core.dataflow import data
+from neochi.eye.pipeline import CaptureScheduler
+from neochi.eye.change import ChangeDetector
+from neochi.eye.preprocessing import Preprocessor
 
 
 class Capture:
@@ -42,28 +50,83 @@ class Capture:
         self._size = size
         self._rotation = rotation
         self._frame = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def rotation(self):
+        return self._rotation
 
     def capture(self):
-        ret, frame = self._capture()
+        with self._lock:
+            ret, frame = self._capture()
         return ret, frame
 
     def _capture(self):
         raise NotImplementedError
 
+    def recycle(self, frame):
+        """
+        Give back a captured frame which is no longer used, so that its buffer can be reused.
+        :param frame: frame returned by capture.
+        """
+        pass
+
+    def reconfigure(self, size=None, rotation=None):
+        """
+        Change the configuration without reopening the device. It is safe to call while another thread captures.
+        :param size: new size.
+        :param rotation: new rotation.
+        :return: False if the capture must be reopened to apply the configuration, True otherwise.
+        """
+        size = self._size if size is None else size
+        rotation = self._rotation if rotation is None else rotation
+        if list(size) == list(self._size) and rotation == self._rotation:
+            return True
+        with self._lock:
+            if not self._reconfigure(size, rotation):
+                return False
+            self._size = size
+            self._rotation = rotation
+        return True
+
+    def _reconfigure(self, size, rotation):
+        return False
+
 
 class CvCapture(Capture):
-    def __init__(self, size, rotation):
+    def __init__(self, size, rotation, interpolation=cv2.INTER_LINEAR, roi=None, buffers=4):
+        """
+        :param interpolation: interpolation used to resize frames.
+        :param roi: region (x, y, width, height) of camera frames to crop.
+        :param buffers: number of frame buffers. A frame is not overwritten until it is given back by recycle.
+        """
         super().__init__(size, rotation)
         self._cap = cv2.VideoCapture(0)
-        self._rotation = rotation
+        self._interpolation = interpolation
+        self._roi = roi
+        self._buffers = buffers
+        self._preprocess = Preprocessor(size, rotation, interpolation=interpolation, roi=roi, buffers=buffers)
+        self._raw = None
 
     def _capture(self):
-        ret, frame = self._cap.read()
-        if ret and frame is not None:
-            # TODO: rotation should be taken into account.
-            self._frame = cv2.cvtColor(cv2.resize(frame, tuple(self._size)), cv2.COLOR_BGR2RGB)
+        ret, raw = self._cap.read(self._raw)
+        if ret and raw is not None:
+            self._raw = raw
+            self._frame = self._preprocess(raw)
         return ret, self._frame
 
+    def recycle(self, frame):
+        self._preprocess.release(frame)
+
+    def _reconfigure(self, size, rotation):
+        self._preprocess = Preprocessor(size, rotation, interpolation=self._interpolation, roi=self._roi,
+                                        buffers=self._buffers)
+        return True
+
     def release(self):
         self._cap.release()
 
@@ -84,30 +147,177 @@ class PiCapture(Capture):
         self._frame = frame
         return True, self._frame
 
+    def _reconfigure(self, size, rotation):
+        if list(size) != list(self._size):
+            self._camera.resolution = size
+            self._cap = PiRGBArray(self._camera)
+        self._camera.rotation = rotation
+        return True
+
     def release(self):
         self._camera.close()
 
 
-def get_capture(size, rotation_pc=0, rotation_pi=90):
+class ReplayCapture(Capture):
+    """
+    Capture replaying frames from a video file, a directory of images,
+    or a dataset directory of JSON frames as used by scripts/brain/fit.py.
+    """
+    _image_extensions = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, source, size=None, rotation=0, fps=None, loop=True, preload=False, buffers=4):
+        """
+        :param source: path of a video file, an image directory, a directory of JSON frames
+                       or a dataset directory containing labels.json.
+        :param size: output size. None means the size of the source frames.
+        :param rotation: clockwise rotation in degrees.
+        :param fps: frames per second to pace the replay. None means as fast as possible.
+        :param loop: restart from the first frame at the end of the source.
+        :param preload: decode all the frames in advance, which excludes decoding from throughput tests.
+        :param buffers: number of frame buffers.
+        """
+        super().__init__(size, rotation)
+        self._source = source
+        self.fps = fps
+        self._loop = loop
+        self._buffers = buffers
+        self._preprocessors = {}
+        self._next_time = None
+        self._frames = list(self._read()) if preload else None
+        self._iterator = self._iterate()
+
+    def _read_json(self, path):
+        with open(path) as f:
+            image_json = json.load(f)
+        return np.frombuffer(base64.b64decode(image_json['image']), np.uint8)\
+            .reshape((image_json['height'], image_json['width'], image_json['channel'])), True
+
+    def _read_directory(self, directory):
+        for filename in sorted(os.listdir(directory)):
+            path = os.path.join(directory, filename)
+            extension = os.path.splitext(filename)[1].lower()
+            if extension == '.json' and filename != 'labels.json':
+                yield self._read_json(path)
+            elif extension in self._image_extensions:
+                yield cv2.imread(path), False
+
+    def _read_video(self):
+        cap = cv2.VideoCapture(self._source)
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield frame, False
+        finally:
+            cap.release()
+
+    def _read(self):
+        if os.path.isfile(self._source):
+            yield from self._read_video()
+        elif os.path.exists(os.path.join(self._source, 'labels.json')):
+            with open(os.path.join(self._source, 'labels.json')) as f:
+                labels = json.load(f)['labels']
+            for datum in labels:
+                yield from self._read_directory(os.path.join(self._source, datum['directoryName']))
+        else:
+            yield from self._read_directory(self._source)
+
+    def _iterate(self):
+        while True:
+            empty = True
+            for frame in (self._frames if self._frames is not None else self._read()):
+                empty = False
+                yield frame
+            if empty or not self._loop:
+                return
+
+    def _preprocess(self, frame, rgb):
+        size = self._size if self._size is not None else (frame.shape[1], frame.shape[0])
+        key = (tuple(size), rgb)
+        if key not in self._preprocessors:
+            self._preprocessors[key] = Preprocessor(size, self._rotation, color=None if rgb else cv2.COLOR_BGR2RGB,
+                                                    buffers=self._buffers)
+        return self._preprocessors[key](frame)
+
+    def _capture(self):
+        if self.fps:
+            now = time.time()
+            if self._next_time is not None and self._next_time > now:
+                time.sleep(self._next_time - now)
+            self._next_time = max((self._next_time or now) + 1. / self.fps, time.time())
+        try:
+            frame, rgb = next(self._iterator)
+        except StopIteration:
+            return False, None
+        self._frame = self._preprocess(frame, rgb)
+        return True, self._frame
+
+    def recycle(self, frame):
+        for preprocess in list(self._preprocessors.values()):
+            preprocess.release(frame)
+
+    def reconfigure(self, size=None, rotation=None):
+        with self._lock:
+            if size is not None:
+                self._size = size
+            if rotation is not None:
+                self._rotation = rotation
+            self._preprocessors = {}
+        return True
+
+    def release(self):
+        self._iterator.close()
+
+
+def get_capture(size, rotation_pc=0, rotation_pi=90, buffers=4, source=None, fps=None):
     """
     :param image_size:
-    :param fps[float]:
+    :param buffers: number of frame buffers reused by CvCapture.
+    :param source: path of frames to replay instead of a camera. See ReplayCapture.
+    :param fps: frames per second of the replay. None means as fast as possible.
     :return image: captured image. array(image_size,3)
     """
     print('START CAPTURE.')
+    if source is not None:
+        print("REPLAY:", source)
+        return ReplayCapture(source, size, rotation_pc, fps=fps, buffers=buffers)
     if not PI_CAMERA:
         print("PC_CAMERA:")
-        return CvCapture(size, rotation_pc)
+        return CvCapture(size, rotation_pc, buffers=buffers)
     else:
         print("PI_CAMERA")
         return PiCapture(size, rotation_pi)
 
 
 class Eye:
-    def __init__(self, cache, size=[32, 32], rotation_pc=0., rotation_pi=90., fps=0.5, init=True):
+    def __init__(self, cache, size=[32, 32], rotation_pc=0., rotation_pi=90., fps=0.5, init=True,
+                 queue_size=2, skip_stale=True, source=None, camera=None, scheduler=None,
+                 change_threshold=None, keyframe_interval=10., change_method='difference'):
+        """
+        :param queue_size: maximum number of captured frames waiting to be published.
+        :param skip_stale: publish only the newest of the waiting frames.
+        :param source: path of frames to replay instead of a camera. See ReplayCapture.
+        :param camera: camera ID used as the namespace of the image and state keys.
+        :param scheduler: CaptureScheduler shared with other eyes. A new one is used if None.
+        :param change_threshold: threshold of ChangeDetector to suppress unchanged frames. None publishes all frames.
+        :param keyframe_interval: seconds after which an unchanged frame is published.
+        :param change_method: method of ChangeDetector.
+        """
         self._cache = cache
-        self._image = data.eye.Image(cache)
-        self._state = data.eye.State(cache)
+        self._source = source
+        self._camera = camera
+        self._queue_size = queue_size
+        self._skip_stale = skip_stale
+        self._change_threshold = change_threshold
+        self._keyframe_interval = keyframe_interval
+        self._change_method = change_method
+        self._scheduler = scheduler if scheduler is not None else CaptureScheduler()
+        self._cap = None
+        self._prev_state = None
+        self._closed = threading.Event()
+        self._image = data.eye.Image(cache, namespace=camera)
+        self._state = data.eye.State(cache, namespace=camera)
         if init:
             self._state.value = {'size': size,
                                  'rotation_pc': rotation_pc,
@@ -115,6 +325,10 @@ class Eye:
                                  'fps': fps,
                                  'is_capturing': False}
 
+    @property
+    def camera(self):
+        return self._camera
+
     @property
     def image(self):
         return self._image.value
@@ -123,6 +337,20 @@ class Eye:
     def state(self):
         return self._state.value
 
+    def wait_for_image(self, timeout=None):
+        try:
+            return self._image.wait_for_update(timeout)
+        except NotImplementedError:
+            return True
+
+    def _wait_for_state(self, timeout):
+        try:
+            return self._state.wait_for_update(timeout)
+        except NotImplementedError:
+            if timeout > 0:
+                time.sleep(timeout)
+            return True
+
     def update_state(self, size=None, rotation_pc=None, rotation_pi=None, fps=None, is_capturing=None):
         value = {}
         if size:
@@ -137,31 +365,125 @@ class Eye:
             value['is_capturing'] = is_capturing
         self._state.value = value
 
+    @property
+    def metrics(self):
+        """ Counters and per stage latencies of the running capture. """
+        return self._scheduler.metrics.get(self._camera, {})
+
+    def _publish(self, frames):
+        for timestamp, frame in frames:
+            self._image.set(frame, timestamp)
+
+    def _close_capture(self):
+        cap, self._cap = self._cap, None
+        if cap is not None:
+            self._scheduler.remove(self._camera)
+            cap.release()
+
+    def _open_capture(self, state):
+        self._cap = get_capture(state['size'], state['rotation_pc'], state['rotation_pi'], 2 * self._queue_size + 2,
+                                self._source)
+        gate = ChangeDetector(self._change_threshold, keyframe_interval=self._keyframe_interval,
+                              method=self._change_method) if self._change_threshold is not None else None
+        self._scheduler.add(self._camera, self._cap, self._publish, state['fps'], self._queue_size,
+                            self._skip_stale, gate)
+
+    def _reconfigure_capture(self, state):
+        rotation = state['rotation_pi'] if isinstance(self._cap, PiCapture) else state['rotation_pc']
+        if not self._cap.reconfigure(state['size'], rotation):
+            return False
+        self._scheduler.set_fps(self._camera, state['fps'])
+        return True
+
+    def apply_state(self, state):
+        """
+        Open, reconfigure or close the capture according to the state.
+        :param state: value of the state.
+        """
+        try:
+            if state['is_capturing']:
+                if self._cap is not None and state != self._prev_state and not self._reconfigure_capture(state):
+                    self._close_capture()
+                if self._cap is None:
+                    self._open_capture(state)
+            elif self._cap is not None:
+                self._close_capture()
+        except KeyError:
+            print('EYE STATE ERROR:', state)
+        self._prev_state = copy.deepcopy(state)
+
     def start_capture(self):
-        cap = None
-        fps = 0.5
+        self._scheduler.start()
+        self._wait_for_state(0)
         current_state = self._state.value
-        while True:
-            start_time = time.time()
-            prev_state = current_state
-            current_state = self._state.value
-            if current_state['is_capturing'] and \
-                    (cap is None or not np.all([prev_state[key] == value for key, value in current_state.items()])):
-                try:
-                    cap = get_capture(current_state['size'], current_state['rotation_pc'], current_state['rotation_pi'])
-                    fps = current_state['fps']
-                except KeyError:
-                    print('EYE STATE ERROR:', current_state)
-            elif not current_state['is_capturing']:
-                if cap is not None:
-                    cap.release()
-                    cap = None
-                time.sleep(0.1)
-                continue
-            captured, image = cap.capture()
-            if not captured:
-                continue
-            self._image.value = image
-            sleep_duration = 1. / fps - (time.time() - start_time)
-            if sleep_duration > 0:
-                time.sleep(sleep_duration)
+        while not self._closed.is_set():
+            self.apply_state(current_state)
+            if self._wait_for_state(1.):
+                current_state = self._state.value
+
+    def close(self):
+        """
+        Make start_capture return and release the capture.
+        """
+        self._closed.set()
+        self._close_capture()
+        self._scheduler.stop()
+
+
+class EyeManager:
+    """
+    Eyes of several cameras driven by one CaptureScheduler, each of which is controlled by its own state.
+    """
+    def __init__(self, cache, cameras, **kwargs):
+        """
+        :param cache: cache backend.
+        :param cameras: camera IDs, or dict of camera IDs and keyword arguments of their Eye such as source.
+        :param kwargs: keyword arguments of Eye common to all the cameras.
+        """
+        if not isinstance(cameras, dict):
+            cameras = {camera: {} for camera in cameras}
+        self._scheduler = CaptureScheduler()
+        self._eyes = {}
+        for camera, camera_kwargs in cameras.items():
+            eye_kwargs = dict(kwargs)
+            eye_kwargs.update(camera_kwargs)
+            self._eyes[camera] = Eye(cache, camera=camera, scheduler=self._scheduler, **eye_kwargs)
+        self._updated = threading.Event()
+        self._polling = False
+        self._closed = threading.Event()
+
+    @property
+    def eyes(self):
+        return self._eyes
+
+    @property
+    def metrics(self):
+        return self._scheduler.metrics
+
+    def _wait_for_states(self, timeout):
+        if self._polling:
+            time.sleep(timeout)
+            return True
+        updated = self._updated.wait(timeout)
+        self._updated.clear()
+        return updated
+
+    def start_capture(self):
+        self._scheduler.start()
+        states = [eye._state for eye in self._eyes.values()]
+        try:
+            for state in states:
+                state.add_callback(lambda datum: self._updated.set())
+        except NotImplementedError:
+            self._polling = True
+        while not self._closed.is_set():
+            for eye, state in zip(self._eyes.values(), data.refresh(*states)):
+                if state is not None:
+                    eye.apply_state(state)
+            self._wait_for_states(1.)
+
+    def close(self):
+        self._closed.set()
+        self._updated.set()
+        for eye in self._eyes.values():
+            eye.close()
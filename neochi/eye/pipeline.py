@@ -0,0 +1,350 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import time
+import heapq
+import threading
+import collections
+
+
+class FrameQueue:
+    """
+    Bounded queue of frames which drops the oldest frame instead of blocking the producer.
+    """
+    def __init__(self, maxsize=2, condition=None, drop=None):
+        """
+        :param maxsize: maximum number of frames.
+        :param condition: threading.Condition notified on put. It may be shared by several queues.
+        :param drop: callable taking a frame dropped from the queue.
+        """
+        self._frames = collections.deque(maxlen=maxsize)
+        self._condition = condition if condition is not None else threading.Condition()
+        self._drop = drop
+        self._dropped = 0
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, frame):
+        with self._condition:
+            if len(self._frames) == self._frames.maxlen:
+                self._dropped += 1
+                if self._drop is not None:
+                    self._drop(self._frames[0])
+            self._frames.append(frame)
+            self._condition.notify()
+
+    def get_all(self, timeout=None):
+        """
+        Wait for frames and take all of them.
+        :param timeout: timeout in seconds. None means waiting forever.
+        :return: list of frames, oldest first. It is empty if timed out.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._frames) > 0, timeout)
+            return self.take()
+
+    def take(self):
+        """
+        Take all the frames without waiting.
+        :return: list of frames, oldest first.
+        """
+        with self._condition:
+            frames = list(self._frames)
+            self._frames.clear()
+            return frames
+
+
+class StageMetrics:
+    """
+    Latency statistics of a pipeline stage in seconds.
+    """
+    def __init__(self, alpha=0.1):
+        """
+        :param alpha: smoothing factor of the moving average.
+        """
+        self._alpha = alpha
+        self._lock = threading.Lock()
+        self.count = 0
+        self.last = 0.
+        self.mean = 0.
+        self.max = 0.
+
+    def add(self, latency):
+        with self._lock:
+            self.mean = latency if self.count == 0 else self.mean + self._alpha * (latency - self.mean)
+            self.count += 1
+            self.last = latency
+            self.max = max(self.max, latency)
+
+    def as_dict(self):
+        with self._lock:
+            return {'count': self.count, 'last': self.last, 'mean': self.mean, 'max': self.max}
+
+
+class _Source:
+    def __init__(self, capture, publish, fps, queue_size, skip_stale, condition, gate):
+        self.capture = capture
+        self.gate = gate
+        self.publish = publish
+        self.fps = fps
+        self._recycle = getattr(capture, 'recycle', None)
+        self.queue = FrameQueue(queue_size, condition, lambda item: self.recycle([item]))
+        self.skip_stale = skip_stale
+        self.started_at = time.time()
+        self.captured = 0
+        self.published = 0
+        self.skipped = 0
+        self.suppressed = 0
+        self.errors = 0
+        self.grab = StageMetrics()
+        self.wait = StageMetrics()
+        self.publish_metrics = StageMetrics()
+
+    def recycle(self, frames):
+        if self._recycle is not None:
+            for timestamp, frame in frames:
+                self._recycle(frame)
+
+    @property
+    def metrics(self):
+        elapsed = time.time() - self.started_at
+        return {
+            'captured': self.captured,
+            'published': self.published,
+            'dropped': self.queue.dropped,
+            'skipped': self.skipped,
+            'suppressed': self.suppressed,
+            'errors': self.errors,
+            'fps': self.captured / elapsed if elapsed > 0 else 0.,
+            'grab': self.grab.as_dict(),
+            'wait': self.wait.as_dict(),
+            'publish': self.publish_metrics.as_dict(),
+        }
+
+
+class CaptureScheduler:
+    """
+    Threaded capture of several sources.
+
+    A grab thread captures the sources in order of their next due time, each at its own fps,
+    and puts the frames into per source FrameQueues. A publisher thread takes them out and publishes them,
+    so that slow serialization or cache I/O does not delay the next grab.
+    An error of a capture or a publish is counted in the errors of the source, and the other sources keep running.
+    Frames which are published, skipped or dropped are given back to Capture.recycle if the capture has it.
+    """
+    def __init__(self):
+        self._sources = {}
+        self._schedule = []
+        self._sequence = 0
+        self._schedule_condition = threading.Condition()
+        self._queue_condition = threading.Condition()
+        self._grab_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def is_running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    @property
+    def metrics(self):
+        """
+        Counters and per stage latencies of each source. The wait stage is the time frames spend in the queue.
+        """
+        return {name: source.metrics for name, source in list(self._sources.items())}
+
+    def _push(self, next_time, name, source):
+        self._sequence += 1
+        heapq.heappush(self._schedule, (next_time, self._sequence, name, source))
+        self._schedule_condition.notify()
+
+    def add(self, name, capture, publish, fps, queue_size=2, skip_stale=True, gate=None):
+        """
+        :param name: name of the source.
+        :param capture: Capture.
+        :param publish: callable taking a list of (timestamp, frame), oldest first.
+        :param fps: frames per second.
+        :param queue_size: maximum number of frames waiting for the publisher. Older frames are dropped.
+        :param skip_stale: publish only the newest of the frames taken at once.
+        :param gate: callable taking a frame and its timestamp, which returns False to suppress the frame,
+                     e.g. ChangeDetector.
+        """
+        self.remove(name)
+        source = _Source(capture, publish, fps, queue_size, skip_stale, self._queue_condition, gate)
+        with self._schedule_condition:
+            self._sources[name] = source
+            self._push(time.time(), name, source)
+
+    def remove(self, name):
+        """
+        Remove a source. The capture is not used by the scheduler after this returns.
+        :param name: name of the source.
+        """
+        with self._grab_lock, self._schedule_condition:
+            self._sources.pop(name, None)
+
+    def set_fps(self, name, fps):
+        self._sources[name].fps = fps
+
+    def _next(self):
+        with self._schedule_condition:
+            while not self._stop.is_set():
+                while self._schedule and self._sources.get(self._schedule[0][2]) is not self._schedule[0][3]:
+                    heapq.heappop(self._schedule)
+                if not self._schedule:
+                    self._schedule_condition.wait(0.1)
+                    continue
+                delay = self._schedule[0][0] - time.time()
+                if delay > 0:
+                    self._schedule_condition.wait(delay)
+                    continue
+                return heapq.heappop(self._schedule)
+        return None
+
+    def _run_grab(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            next_time, sequence, name, source = item
+            with self._grab_lock:
+                if self._sources.get(name) is not source:
+                    continue
+                start_time = time.time()
+                try:
+                    captured, frame = source.capture.capture()
+                except Exception as e:
+                    source.errors += 1
+                    print('CAPTURE ERROR:', name, e)
+                    captured = False
+                now = time.time()
+                source.grab.add(now - start_time)
+                if captured:
+                    source.captured += 1
+                    source.queue.put((now, frame))
+            with self._schedule_condition:
+                self._push(max(next_time + 1. / source.fps, now), name, source)
+
+    def _publish(self, source, frames):
+        try:
+            self._publish_frames(source, frames)
+        finally:
+            source.recycle(frames)
+
+    def _publish_frames(self, source, frames):
+        if source.skip_stale:
+            source.skipped += len(frames) - 1
+            frames = frames[-1:]
+        if source.gate is not None:
+            passed = [(timestamp, frame) for timestamp, frame in frames if source.gate(frame, timestamp)]
+            source.suppressed += len(frames) - len(passed)
+            frames = passed
+            if not frames:
+                return
+        start_time = time.time()
+        for timestamp, frame in frames:
+            source.wait.add(start_time - timestamp)
+        try:
+            source.publish(frames)
+        except Exception as e:
+            source.errors += 1
+            print('PUBLISH ERROR:', e)
+            return
+        source.publish_metrics.add(time.time() - start_time)
+        source.published += len(frames)
+
+    def _run_publish(self):
+        while not self._stop.is_set():
+            with self._queue_condition:
+                self._queue_condition.wait_for(
+                    lambda: any(len(source.queue) for source in list(self._sources.values())), 0.1)
+            for source in list(self._sources.values()):
+                frames = source.queue.take()
+                if frames:
+                    self._publish(source, frames)
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._run_grab, daemon=True),
+                         threading.Thread(target=self._run_publish, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        with self._schedule_condition:
+            self._schedule_condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class CapturePipeline(CaptureScheduler):
+    """
+    CaptureScheduler of a single source.
+    """
+    def __init__(self, capture, publish, fps, queue_size=2, skip_stale=True, gate=None):
+        """
+        :param capture: Capture.
+        :param publish: callable taking a list of (timestamp, frame), oldest first.
+        :param fps: frames per second of the grab thread.
+        :param queue_size: maximum number of frames waiting for the publisher. Older frames are dropped.
+        :param skip_stale: publish only the newest of the frames taken at once.
+        :param gate: callable taking a frame and its timestamp, which returns False to suppress the frame.
+        """
+        super().__init__()
+        self.add(None, capture, publish, fps, queue_size, skip_stale, gate)
+        self._source = self._sources[None]
+
+    @property
+    def fps(self):
+        return self._source.fps
+
+    @fps.setter
+    def fps(self, fps):
+        self._source.fps = fps
+
+    @property
+    def metrics(self):
+        return self._source.metrics
+
+    def start(self):
+        self._source.started_at = time.time()
+        super().start()
@@ -0,0 +1,139 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import collections
+import cv2
+import numpy as np
+
+
+_ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+class Preprocessor:
+    """
+    Crop, resize, color conversion and rotation of camera frames into preallocated buffers.
+
+    The outputs are taken from a pool of buffers. An output is never overwritten until it is given back by release,
+    and a new array is returned instead if all the buffers are in use.
+    """
+    def __init__(self, size, rotation=0, interpolation=cv2.INTER_LINEAR, roi=None, color=cv2.COLOR_BGR2RGB,
+                 buffers=4):
+        """
+        :param size: output size (width, height) after rotation.
+        :param rotation: clockwise rotation in degrees.
+        :param interpolation: interpolation of cv2.resize.
+        :param roi: region (x, y, width, height) of the input frame to crop before resizing.
+        :param color: code of cv2.cvtColor. None means no conversion.
+        :param buffers: number of reusable output buffers.
+        """
+        self._size = tuple(int(length) for length in size)
+        self._rotation = rotation % 360
+        self._interpolation = interpolation
+        self._roi = roi
+        self._color = color
+        self._buffers = buffers
+        self._resized = None
+        self._converted = None
+        self._shape = None
+        self._owned = {}
+        self._free = collections.deque()
+        self._affine = None
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def rotation(self):
+        return self._rotation
+
+    def _resize_size(self):
+        if self._rotation in (90, 270):
+            return self._size[1], self._size[0]
+        return self._size
+
+    def _allocate(self, frame):
+        width, height = self._resize_size()
+        channels = frame.shape[2:]
+        self._resized = np.empty((height, width) + channels, dtype=np.uint8)
+        if self._color is not None:
+            channels = cv2.cvtColor(self._resized, self._color).shape[2:]
+        self._converted = np.empty((height, width) + channels, dtype=np.uint8) \
+            if self._color is not None and self._rotation else None
+        self._shape = (self._size[1], self._size[0]) + channels
+        self._owned = {}
+        self._free = collections.deque()
+        if self._rotation and self._rotation not in _ROTATIONS:
+            self._affine = cv2.getRotationMatrix2D(((width - 1) / 2., (height - 1) / 2.), -self._rotation, 1.)
+            self._affine[0, 2] += (self._size[0] - width) / 2.
+            self._affine[1, 2] += (self._size[1] - height) / 2.
+
+    def _output(self):
+        while self._free:
+            output = self._free.popleft()
+            if output.shape == self._shape:
+                return output
+        output = np.empty(self._shape, dtype=np.uint8)
+        if len(self._owned) < self._buffers:
+            self._owned[id(output)] = output
+        return output
+
+    def release(self, output):
+        """
+        Give back an output so that its buffer is reused. It is safe to call from another thread, but must be called
+        only once for each output.
+        Arrays which were not returned by this preprocessor are ignored.
+        :param output: output of this preprocessor which is no longer used.
+        """
+        if self._owned.get(id(output)) is output:
+            self._free.append(output)
+
+    def __call__(self, frame):
+        """
+        :param frame: input frame of shape (height, width, channels).
+        :return: preprocessed frame of shape (size[1], size[0], channels).
+        """
+        if self._roi is not None:
+            x, y, width, height = self._roi
+            frame = frame[y:y + height, x:x + width]
+        if self._resized is None or self._resized.shape[2:] != frame.shape[2:]:
+            self._allocate(frame)
+        output = self._output()
+        if not self._rotation:
+            if self._color is None:
+                return cv2.resize(frame, self._size, dst=output, interpolation=self._interpolation)
+            resized = cv2.resize(frame, self._size, dst=self._resized, interpolation=self._interpolation)
+            return cv2.cvtColor(resized, self._color, dst=output)
+        frame = cv2.resize(frame, self._resize_size(), dst=self._resized, interpolation=self._interpolation)
+        if self._color is not None:
+            frame = cv2.cvtColor(frame, self._color, dst=self._converted)
+        if self._rotation in _ROTATIONS:
+            return cv2.rotate(frame, _ROTATIONS[self._rotation], dst=output)
+        return cv2.warpAffine(frame, self._affine, self._size, dst=output, flags=self._interpolation)
@@ -29,7 +29,9 @@ DATAFLOW = {
         'CACHE': {
             'MODULE': 'neochi.core.dataflow.backends.caches.redis.RedisCache',
             'KWARGS': {
-                'host': 'redis'
+                'host': 'redis',
+                'socket_keepalive': True,
+                'health_check_interval': 30,
             }
         }
     }
@@ -39,11 +41,17 @@ BRAIN = {
     'DATA': {
         'UPLOAD_DIR': '/uploads',
         'ZIP_PATH': '/uploads/data.zip',
-        'DIR': '/data'
+        'DIR': '/data',
+        # Number of processes decoding the uploaded clips. None means the number of CPUs.
+        'WORKERS': None
     },
     'MODEL': {
         'MODULE': 'neochi.brain.models.behavior.BehaviorClassifier',
-        'KWARGS': {},
-        'DIR': '/models'
+        # Keyword arguments of the model. fps is the rate at which the training clips were recorded,
+        # which is saved with the model and used by predict to sample frames.
+        'KWARGS': {'fps': 1.},
+        'DIR': '/models',
+        # Format of the network used for prediction, which is 'h5', 'saved_model' or 'tflite'.
+        'FORMAT': 'h5'
     }
 }
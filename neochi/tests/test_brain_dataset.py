@@ -0,0 +1,155 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import os
+import json
+import base64
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from ..brain import dataset
+
+
+def write_dataset(path, clips, labels, prefix='clip'):
+    with zipfile.ZipFile(path, 'w') as archive:
+        entries = []
+        for i, (clip, label) in enumerate(zip(clips, labels)):
+            directory = '%s%03d' % (prefix, i)
+            entries.append({'directoryName': directory, 'label': label})
+            for j, frame in enumerate(clip):
+                archive.writestr('%s/%03d.json' % (directory, j), json.dumps({
+                    'image': base64.b64encode(frame.tobytes()).decode(),
+                    'height': frame.shape[0], 'width': frame.shape[1], 'channel': frame.shape[2]}))
+        archive.writestr('labels.json', json.dumps({'labels': entries}))
+
+
+def random_clips(n, frames=5, size=(4, 6)):
+    return [np.random.randint(0, 256, size=(frames, size[0], size[1], 3), dtype=np.uint8) for _ in range(n)]
+
+
+class TestZipDataset(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, 'data.zip')
+        self._clips = random_clips(3)
+        self._labels = ['sit', 'stand', 'sit']
+        write_dataset(self._path, self._clips, self._labels)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_if_it_loads_clips(self):
+        ds = dataset.ZipDataset(self._path)
+        self.assertEqual(len(ds), 3)
+        self.assertEqual(ds.frame_shape, (4, 6, 3))
+        X, labels = ds.load()
+        np.testing.assert_array_equal(X, np.array(self._clips))
+        self.assertEqual(labels, self._labels)
+
+    def test_if_it_streams_clips(self):
+        for (clip, label), expected, expected_label in zip(dataset.ZipDataset(self._path), self._clips, self._labels):
+            np.testing.assert_array_equal(clip, expected)
+            self.assertEqual(label, expected_label)
+
+    def test_if_it_rejects_clips_of_different_lengths(self):
+        write_dataset(self._path, [self._clips[0], self._clips[1][:3]], self._labels[:2])
+        ds = dataset.ZipDataset(self._path)
+        self.assertEqual(ds.clip_lengths, [5, 3])
+        self.assertRaises(ValueError, ds.load)
+        self.assertEqual([len(clip) for clip, label in ds], [5, 3])
+
+    def test_if_it_creates_tf_dataset(self):
+        try:
+            import tensorflow as tf
+        except ImportError:
+            self.skipTest('TensorFlow is not installed.')
+        with tf.Graph().as_default():
+            element = tf.compat.v1.data.make_one_shot_iterator(
+                dataset.ZipDataset(self._path).to_tf_dataset()).get_next()
+            with tf.compat.v1.Session() as session:
+                elements = [session.run(element) for i in range(len(self._clips))]
+        np.testing.assert_array_equal(elements[1][0], self._clips[1])
+
+
+class TestCompiledDataset(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, 'data.zip')
+        self._cache_dir = os.path.join(self._dir.name, 'compiled')
+        self._clips = random_clips(5)
+        self._labels = ['sit', 'stand', 'sit', 'lie', 'stand']
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _compile(self):
+        with mock.patch.object(dataset, '_decode_clips', wraps=dataset._decode_clips) as decode_clips:
+            compiled = dataset.compile_dataset(self._path, self._cache_dir, workers=1)
+        return compiled, [offset // 5 for call in decode_clips.call_args_list for offset, names in call[0][3]]
+
+    def test_if_it_compiles_dataset(self):
+        write_dataset(self._path, self._clips, self._labels)
+        compiled, decoded = self._compile()
+        self.assertEqual(decoded, [0, 1, 2, 3, 4])
+        X, labels = compiled.load()
+        self.assertIsInstance(X, np.memmap)
+        np.testing.assert_array_equal(X, np.array(self._clips))
+        self.assertEqual(labels, self._labels)
+        compiled, decoded = self._compile()
+        self.assertEqual(decoded, [])
+        np.testing.assert_array_equal(compiled.clip(4), self._clips[4])
+
+    def test_if_it_appends_new_clips(self):
+        write_dataset(self._path, self._clips[:3], self._labels[:3])
+        self._compile()
+        write_dataset(self._path, self._clips, self._labels)
+        compiled, decoded = self._compile()
+        self.assertEqual(decoded, [3, 4])
+        np.testing.assert_array_equal(compiled.load()[0], np.array(self._clips))
+
+    def test_if_it_recompiles_changed_clips(self):
+        write_dataset(self._path, self._clips[:3], self._labels[:3])
+        self._compile()
+        write_dataset(self._path, self._clips[1:], self._labels[1:])
+        compiled, decoded = self._compile()
+        self.assertEqual(decoded, [0, 1, 2, 3])
+        np.testing.assert_array_equal(compiled.load()[0], np.array(self._clips[1:]))
+
+    def test_if_it_keeps_clips_of_different_lengths(self):
+        write_dataset(self._path, [self._clips[0], self._clips[1][:2]], self._labels[:2])
+        compiled = dataset.compile_dataset(self._path, self._cache_dir)
+        self.assertEqual(compiled.clip_lengths, [5, 2])
+        np.testing.assert_array_equal(compiled.clip(1), self._clips[1][:2])
+        self.assertRaises(ValueError, compiled.load)
+
+    def test_if_workers_decode_in_order(self):
+        clips = random_clips(20)
+        labels = ['sit'] * 20
+        write_dataset(self._path, clips, labels)
+        compiled = dataset.compile_dataset(self._path, self._cache_dir, workers=3)
+        np.testing.assert_array_equal(compiled.load()[0], np.array(clips))
@@ -0,0 +1,113 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import os
+import sys
+import json
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from ..brain.models import behavior
+
+
+class TestBehaviorClassifier(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self._dir.name, 'model.json'), 'w') as f:
+            json.dump({'shape': [32, 32, 15], 'fps': 2., 'labels': ['stand', 'sit', 'stand']}, f)
+        with open(os.path.join(self._dir.name, 'model.h5'), 'w') as f:
+            f.write('')
+
+    def tearDown(self):
+        self._dir.cleanup()
+        behavior._models.clear()
+
+    def test_if_it_does_not_import_tensorflow(self):
+        output = subprocess.check_output([sys.executable, '-c',
+                                          'import sys; import neochi.brain.models.behavior; '
+                                          'print("tensorflow" in sys.modules, "sklearn" in sys.modules)'],
+                                         cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+        self.assertEqual(output.split(), [b'False', b'False'])
+
+    def test_if_it_loads_config_only(self):
+        model = behavior.BehaviorClassifier()
+        model.load_config(self._dir.name)
+        self.assertEqual(model.config, {'image_size': (32, 32), 'time_steps': 15, 'fps': 2.})
+        self.assertEqual(model.classes, ['sit', 'stand'])
+
+    def test_if_it_caches_loaded_models(self):
+        with mock.patch.object(behavior, '_load_model', side_effect=lambda path, format: object()) as load_model:
+            first = behavior.load_model(self._dir.name)
+            self.assertIs(behavior.load_model(self._dir.name), first)
+            self.assertEqual(load_model.call_count, 1)
+            os.utime(os.path.join(self._dir.name, 'model.h5'), (0, 0))
+            self.assertIsNot(behavior.load_model(self._dir.name), first)
+        self.assertRaises(ValueError, behavior.load_model, self._dir.name, 'onnx')
+
+
+class TestSavedBehaviorClassifier(unittest.TestCase):
+    def setUp(self):
+        try:
+            import tensorflow
+        except ImportError:
+            self.skipTest('TensorFlow is not installed.')
+        self._dir = tempfile.TemporaryDirectory()
+        self._model = behavior.BehaviorClassifier(shape=(16, 16, 6), fps=2., labels=['sit', 'stand', 'sit'])
+        self._model._create_model()
+        self._X = np.random.randint(0, 256, size=(3, 16, 16, 6)).astype(np.float32)
+
+    def tearDown(self):
+        self._dir.cleanup()
+        behavior._models.clear()
+
+    def test_if_it_outputs_probabilities_of_classes(self):
+        self.assertEqual(self._model.predict_probs(self._X).shape, (3, 2))
+        self.assertTrue(set(self._model.predict_labels(self._X)) <= {'sit', 'stand'})
+
+    def test_if_it_loads_saved_formats(self):
+        expected = self._model.predict_probs(self._X)
+        for format in behavior.FORMATS:
+            self._model.save(self._dir.name, format)
+            model = behavior.BehaviorClassifier()
+            model.load(self._dir.name, format)
+            self.assertEqual(model.config, {'image_size': (16, 16), 'time_steps': 6, 'fps': 2.})
+            np.testing.assert_allclose(model.predict_probs(self._X), expected, rtol=1e-4, atol=1e-5)
+
+    def test_if_it_reloads_modified_model(self):
+        self._model.save(self._dir.name)
+        model = behavior.BehaviorClassifier()
+        model.load(self._dir.name)
+        self.assertFalse(model.reload(self._dir.name))
+        retrained = behavior.BehaviorClassifier(shape=(16, 16, 6), fps=4., labels=['sit', 'stand'])
+        retrained._create_model()
+        retrained.save(self._dir.name)
+        os.utime(os.path.join(self._dir.name, 'model.h5'), (0, 0))
+        self.assertTrue(model.reload(self._dir.name))
+        self.assertEqual(model.fps, 4.)
+        np.testing.assert_allclose(model.predict_probs(self._X), retrained.predict_probs(self._X),
+                                   rtol=1e-4, atol=1e-5)
@@ -0,0 +1,77 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import time
+import threading
+import unittest
+import numpy as np
+from ..brain.server import InferenceServer
+
+
+class SlowModel:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, X):
+        self.batch_sizes.append(len(X))
+        time.sleep(0.01)
+        return X.reshape((len(X), -1)).sum(axis=1)
+
+
+class TestInferenceServer(unittest.TestCase):
+    def test_if_it_batches_requests_of_streams(self):
+        model = SlowModel()
+        server = InferenceServer(model.predict, max_batch_size=4, max_latency=0.05)
+        results = {}
+
+        def stream(i):
+            results[i] = server.predict(np.full((1, 2, 2, 3), i, dtype=np.float32), timeout=1.)
+        threads = [threading.Thread(target=stream, args=(i, )) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        server.close()
+        self.assertEqual(results, {i: 12. * i for i in range(8)})
+        self.assertEqual(sum(model.batch_sizes), 8)
+        self.assertLessEqual(max(model.batch_sizes), 4)
+        self.assertLess(len(model.batch_sizes), 8)
+        self.assertEqual(server.stats['predictions'], 8)
+
+    def test_if_it_does_not_wait_longer_than_max_latency(self):
+        server = InferenceServer(lambda X: X, max_batch_size=16, max_latency=0.01)
+        start_time = time.time()
+        np.testing.assert_array_equal(server.predict(np.ones(3), timeout=1.), np.ones(3))
+        self.assertLess(time.time() - start_time, 0.5)
+        server.close()
+        self.assertRaises(RuntimeError, server.submit, np.ones(3))
+
+    def test_if_it_propagates_errors(self):
+        def predict(X):
+            raise ValueError('Bad input.')
+        server = InferenceServer(predict)
+        self.assertRaises(ValueError, server.predict, np.ones(3), 1.)
+        server.close()
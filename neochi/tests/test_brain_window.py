@@ -0,0 +1,116 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import unittest
+import numpy as np
+from ..brain.window import FrameWindow
+from ..brain.clips import ClipSpec, WindowBatches
+
+
+class TestFrameWindow(unittest.TestCase):
+    def setUp(self):
+        self._frames = [np.random.randint(0, 256, size=(24, 32, 3), dtype=np.uint8) for _ in range(12)]
+
+    def test_if_it_keeps_the_layout_of_fit(self):
+        window = FrameWindow.from_config({'image_size': (32, 24), 'time_steps': 15})
+        for i, frame in enumerate(self._frames):
+            window.append(frame)
+            if i < 4:
+                self.assertFalse(window.is_full)
+                self.assertRaises(ValueError, lambda: window.tensor)
+                continue
+            expected = np.array(self._frames[i - 4:i + 1]).reshape((-1, 24, 32, 15))
+            np.testing.assert_array_equal(window.tensor, expected)
+
+    def test_if_tensor_is_a_view(self):
+        window = FrameWindow((32, 24), 15)
+        window.extend(self._frames)
+        self.assertTrue(np.shares_memory(window.tensor, window._buffer))
+        self.assertEqual(len(window), 5)
+        np.testing.assert_array_equal(window.frames[0], self._frames[-5])
+
+    def test_if_it_validates_shapes(self):
+        self.assertRaises(ValueError, FrameWindow, (32, 24), 16)
+        window = FrameWindow((32, 24), 15)
+        self.assertRaises(ValueError, window.append, np.zeros((32, 24, 3), dtype=np.uint8))
+        window.extend(self._frames[:2])
+        window.clear()
+        self.assertEqual(len(window), 0)
+
+
+class TestClipSpec(unittest.TestCase):
+    def setUp(self):
+        self._spec = ClipSpec((32, 24), 15)
+        self._frames = np.random.randint(0, 256, size=(12, 24, 32, 3), dtype=np.uint8)
+
+    def test_if_it_builds_tensors_as_views(self):
+        tensor = self._spec.to_tensor(self._frames[:10].reshape((2, 5, 24, 32, 3)))
+        self.assertEqual(tensor.shape, (2, 24, 32, 15))
+        self.assertTrue(np.shares_memory(tensor, self._frames))
+        np.testing.assert_array_equal(tensor[1], self._frames[5:10].reshape((24, 32, 15)))
+        self.assertRaises(ValueError, self._spec.to_tensor, self._frames[:8].reshape((2, 4, 24, 32, 3)))
+
+    def test_if_it_validates_model_shapes(self):
+        self._spec.validate((24, 32, 15))
+        self.assertRaises(ValueError, self._spec.validate, (32, 32, 15))
+        self.assertEqual(ClipSpec.from_frames((24, 32, 3), 5).shape, (24, 32, 15))
+
+    def test_if_it_windows_clips_of_variable_lengths(self):
+        tensors, clips = self._spec.clip_windows(self._frames, [0, 7, 12], stride=2)
+        self.assertEqual(clips.tolist(), [0, 0, 1])
+        for tensor, start in zip(tensors, [0, 2, 7]):
+            np.testing.assert_array_equal(tensor, self._frames[start:start + 5].reshape((24, 32, 15)))
+        tensors, clips = self._spec.clip_windows(self._frames[:10], [0, 5, 10])
+        self.assertTrue(np.shares_memory(tensors, self._frames))
+        self.assertEqual(clips.tolist(), [0, 1])
+
+
+class TestWindowBatches(unittest.TestCase):
+    def setUp(self):
+        self._spec = ClipSpec((32, 24), 15)
+        self._frames = np.random.randint(0, 256, size=(40, 24, 32, 3), dtype=np.uint8)
+        self._starts, self._clips = self._spec.clip_starts([0, 17, 40], stride=2)
+
+    def test_if_it_batches_all_windows(self):
+        batches = WindowBatches(self._spec, self._frames, self._starts, self._clips, batch_size=4)
+        self.assertEqual(len(batches), 5)
+        seen = []
+        for X, y in batches:
+            self.assertLessEqual(len(X), 4)
+            self.assertFalse(np.shares_memory(X, self._frames))
+            for tensor, clip in zip(X, y):
+                start = next(start for start in self._starts
+                             if np.array_equal(tensor, self._frames[start:start + 5].reshape((24, 32, 15))))
+                self.assertEqual(clip, self._clips[list(self._starts).index(start)])
+                seen.append(start)
+        self.assertEqual(sorted(seen), self._starts.tolist())
+
+    def test_if_it_splits_windows(self):
+        batches = WindowBatches(self._spec, self._frames, self._starts, self._clips)
+        train, test = batches.split(0.75, shuffle=False)
+        self.assertEqual(len(train.starts), 13)
+        self.assertEqual(sorted(train.starts.tolist() + test.starts.tolist()), self._starts.tolist())
+        self.assertFalse(test.shuffle)
@@ -24,8 +24,15 @@
 __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 
+import os
+import time
+import asyncio
+import tempfile
+import threading
 import unittest
+import multiprocessing
 from ..core.dataflow.backends import caches
+from ..core.dataflow.backends.caches import local, shm, redis
 from ..neochi import settings
 
 
@@ -37,4 +44,249 @@ class TestRedis(unittest.TestCase):
     def if_it_can_set_and_get_value(self):
         data = {'key': 'key', 'value': 'value'}
         self.cache.set(**data)
-        self.assertEqual(data['key'], self.cache.get('key'))
\ No newline at end of file
+        self.assertEqual(data['key'], self.cache.get('key'))
+
+    def test_if_it_shares_clients(self):
+        cache = caches.get_cache(settings.DATAFLOW['BACKEND']['CACHE']['MODULE'], shared=False,
+                                 **settings.DATAFLOW['BACKEND']['CACHE']['KWARGS'])
+        self.assertIsNot(cache, self.cache)
+        self.assertIs(cache._redis, self.cache._redis)
+        self.assertIsNot(redis.RedisCache(host='localhost', db=1)._redis, self.cache._redis)
+        self.assertEqual(self.cache.pool_stats()['in_use_connections'], 0)
+
+    def test_if_it_gets_value_only_if_modified(self):
+        self.cache.set('test_redis:key', b'value')
+        modified, value, version = self.cache.get_if_modified('test_redis:key', None)
+        self.assertEqual((modified, value), (True, b'value'))
+        self.assertEqual(version, self.cache.get_version('test_redis:key'))
+        self.assertEqual(self.cache.get_if_modified('test_redis:key', version), (False, None, version))
+        self.cache.set('test_redis:key', b'new value')
+        self.assertEqual(self.cache.get_if_modified('test_redis:key', version), (True, b'new value', version + 1))
+        self.cache._redis.delete('test_redis:key')
+        self.assertEqual(self.cache.get_if_modified('test_redis:key', version + 1), (True, None, version + 1))
+
+    def test_if_it_gets_and_sets_many_values(self):
+        self.cache._redis.delete('test_redis:key2', 'test_redis:key2:version')
+        self.assertEqual(self.cache.set_many({'test_redis:key0': b'0', 'test_redis:key1': b'1'}), [True, True])
+        self.assertEqual(self.cache.get_many(['test_redis:key0', 'test_redis:key1', 'test_redis:key2']),
+                         [b'0', b'1', None])
+        version = self.cache.get_version('test_redis:key0')
+        self.assertEqual(self.cache.get_many_if_modified(['test_redis:key0', 'test_redis:key1', 'test_redis:key2'],
+                                                         [version, None, None]),
+                         [(False, None, version), (True, b'1', self.cache.get_version('test_redis:key1')),
+                          (True, None, None)])
+
+    def test_if_it_executes_pipeline(self):
+        self.cache._redis.delete('test_redis:key0', 'test_redis:key1')
+        version = self.cache.get_version('test_redis:key0') or 0
+        with self.cache.pipeline() as pipeline:
+            pipeline.set('test_redis:key0', b'0').set('test_redis:key1', b'1').get('test_redis:key0')
+            self.assertIsNone(self.cache.get('test_redis:key0'))
+        self.assertEqual(pipeline.results, [True, True, b'0'])
+        self.assertEqual(self.cache.get_version('test_redis:key0'), version + 1)
+
+    def _assert_notified(self, cache, write):
+        updated = threading.Event()
+        keys = []
+
+        def callback(key):
+            keys.append(key)
+            updated.set()
+        cache.subscribe('test_redis:key', callback)
+        try:
+            time.sleep(0.2)
+            write()
+            self.assertTrue(updated.wait(2.))
+            self.assertEqual(keys[0], 'test_redis:key')
+        finally:
+            cache.unsubscribe('test_redis:key', callback)
+            cache.close()
+
+    def test_if_it_notifies_subscribers(self):
+        cache = caches.get_cache(settings.DATAFLOW['BACKEND']['CACHE']['MODULE'], shared=False,
+                                 **settings.DATAFLOW['BACKEND']['CACHE']['KWARGS'])
+        self._assert_notified(cache, lambda: self.cache.set('test_redis:key', b'value'))
+
+    def test_if_it_notifies_writes_of_other_clients_by_keyspace_notifications(self):
+        cache = caches.get_cache(settings.DATAFLOW['BACKEND']['CACHE']['MODULE'], shared=False,
+                                 keyspace_notifications=True, **settings.DATAFLOW['BACKEND']['CACHE']['KWARGS'])
+        self._assert_notified(cache, lambda: self.cache._redis.set('test_redis:key', b'value'))
+
+
+class TestAsyncRedis(unittest.TestCase):
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.cache = redis.AsyncRedisCache(**settings.DATAFLOW['BACKEND']['CACHE']['KWARGS'])
+        self.sync_cache = caches.get_cache(settings.DATAFLOW['BACKEND']['CACHE']['MODULE'],
+                                           **settings.DATAFLOW['BACKEND']['CACHE']['KWARGS'])
+
+    def tearDown(self):
+        self._loop.run_until_complete(self.cache.close())
+        self._loop.close()
+
+    def test_if_it_shares_values_and_versions_with_redis_cache(self):
+        async def run():
+            await self.cache.set('test_async_redis:key', b'value')
+            version = self.sync_cache.get_version('test_async_redis:key')
+            self.assertEqual(await self.cache.get_if_modified('test_async_redis:key', None),
+                             (True, b'value', version))
+            self.assertEqual(await self.cache.get_if_modified('test_async_redis:key', version),
+                             (False, None, version))
+            self.sync_cache.set('test_async_redis:key', b'new value')
+            self.assertEqual(await self.cache.get('test_async_redis:key'), b'new value')
+        self._loop.run_until_complete(run())
+
+    def test_if_it_notifies_writes_of_redis_cache(self):
+        async def run():
+            updated = asyncio.Event()
+            await self.cache.subscribe('test_async_redis:key', lambda key: updated.set())
+            await asyncio.sleep(0.2)
+            self.sync_cache.set('test_async_redis:key', b'value')
+            await asyncio.wait_for(updated.wait(), 2.)
+        self._loop.run_until_complete(run())
+
+
+class TestGetCache(unittest.TestCase):
+    def test_if_it_shares_caches(self):
+        class_path = 'neochi.core.dataflow.backends.caches.local.LocalCache'
+        cache = caches.get_cache(class_path, name='test', max_bytes=None)
+        self.assertIs(caches.get_cache(class_path, name='test', max_bytes=None), cache)
+        self.assertIsNot(caches.get_cache(class_path, name='test', max_bytes=None, shared=False), cache)
+        self.assertIsNot(caches.get_cache(class_path, name='other'), cache)
+        caches.reset_caches()
+        self.assertIsNot(caches.get_cache(class_path, name='test', max_bytes=None), cache)
+
+
+class TestLocal(unittest.TestCase):
+    def setUp(self):
+        self.cache = caches.get_cache('neochi.core.dataflow.backends.caches.local.LocalCache', name='test')
+        self.cache.clear()
+
+    def test_if_it_can_set_and_get_value(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', b'value')
+        self.assertEqual(self.cache.get('key'), b'value')
+
+    def test_if_it_shares_values_between_instances_with_same_name(self):
+        value = b'value'
+        self.cache.set('key', value)
+        self.assertIs(local.LocalCache(name='test').get('key'), value)
+        self.assertIsNone(local.LocalCache(name='other').get('key'))
+
+    def test_if_it_expires_values(self):
+        self.cache.set('key0', b'value', ttl=0.01)
+        self.cache.set('key1', b'value')
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('key0'))
+        self.assertEqual(self.cache.get('key1'), b'value')
+
+    def test_if_it_evicts_least_recently_used_values(self):
+        cache = local.LocalCache(name='test_lru', max_bytes=10)
+        cache.set('key0', b'0000')
+        cache.set('key1', b'1111')
+        cache.get('key0')
+        cache.set('key2', b'2222')
+        self.assertEqual(cache.get('key0'), b'0000')
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.get('key2'), b'2222')
+        self.assertEqual(cache.size, 8)
+        self.assertFalse(cache.set('key3', b'33333333333'))
+
+    def test_if_it_gets_and_sets_many_values(self):
+        self.assertEqual(self.cache.set_many({'key0': b'0', 'key1': b'1'}), [True, True])
+        self.assertEqual(self.cache.get_many(['key0', 'key1', 'key2']), [b'0', b'1', None])
+        version = self.cache.get_version('key0')
+        self.assertEqual(self.cache.get_many_if_modified(['key0', 'key1'], [version, None]),
+                         [(False, None, version), (True, b'1', self.cache.get_version('key1'))])
+
+    def test_if_it_executes_pipeline(self):
+        with self.cache.pipeline() as pipeline:
+            pipeline.set('key0', b'0').set('key1', b'1').get('key0')
+            self.assertIsNone(self.cache.get('key0'))
+        self.assertEqual(pipeline.results, [True, True, b'0'])
+        with self.assertRaises(RuntimeError):
+            with self.cache.pipeline() as pipeline:
+                pipeline.set('key2', b'2')
+                raise RuntimeError
+        self.assertIsNone(self.cache.get('key2'))
+
+    def test_if_it_can_be_used_from_threads(self):
+        def write(i):
+            for j in range(100):
+                self.cache.set('key%d' % j, b'%d' % i)
+                self.cache.get('key%d' % j)
+
+        threads = [threading.Thread(target=write, args=(i, )) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.size, sum(len(self.cache.get('key%d' % j)) for j in range(100)))
+
+
+def _write_values(directory, n):
+    cache = shm.SharedMemoryCache(name='test', slots=4, slot_size=16, directory=directory)
+    for i in range(n):
+        cache.set('key', b'%d' % i)
+    cache.close()
+
+
+class TestSharedMemory(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = shm.SharedMemoryCache(name='test', slots=4, slot_size=16, directory=self.directory.name)
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_if_it_can_set_and_get_value(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', b'value')
+        self.assertEqual(self.cache.get('key'), b'value')
+        reader = shm.SharedMemoryCache(name='test', directory=self.directory.name)
+        self.assertEqual(reader.get('key'), b'value')
+        reader.close()
+
+    def test_if_it_keeps_recent_values(self):
+        for i in range(10):
+            self.cache.set('key', b'%d' % i)
+        self.assertEqual(self.cache.get_history('key', 2), [b'8', b'9'])
+        self.assertEqual(self.cache.get_history('key', 10), [b'7', b'8', b'9'])
+
+    def test_if_it_rejects_too_large_value(self):
+        with self.assertRaises(ValueError):
+            self.cache.set('key', b'0' * 17)
+
+    def test_if_it_shares_values_between_processes(self):
+        process = multiprocessing.Process(target=_write_values, args=(self.directory.name, 100))
+        process.start()
+        process.join()
+        self.assertEqual(self.cache.get_history('key', 3), [b'97', b'98', b'99'])
+
+    def test_if_it_notifies_subscribers(self):
+        updated = threading.Event()
+        self.cache.subscribe('key', lambda key: updated.set())
+        process = multiprocessing.Process(target=_write_values, args=(self.directory.name, 1))
+        process.start()
+        process.join()
+        self.assertTrue(updated.wait(1.))
+
+    def test_if_it_stops_notifying_after_unsubscribe(self):
+        keys = []
+        self.cache.subscribe('key', keys.append)
+        poller = self.cache._poller
+        self.cache.set('key', b'0')
+        time.sleep(0.05)
+        self.cache.unsubscribe('key', keys.append)
+        poller.join(1.)
+        self.assertFalse(poller.is_alive())
+        self.cache.set('key', b'1')
+        self.assertEqual(keys, ['key'])
+        self.assertEqual(os.listdir(self.cache._subscribers_path('key')), [])
+
+    def test_if_it_removes_subscribers_which_are_gone(self):
+        os.makedirs(self.cache._subscribers_path('key'))
+        os.mkfifo(os.path.join(self.cache._subscribers_path('key'), 'gone'))
+        self.cache.set('key', b'value')
+        self.assertEqual(os.listdir(self.cache._subscribers_path('key')), [])
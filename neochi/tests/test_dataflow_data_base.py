@@ -24,9 +24,14 @@
 __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 
+import time
+import asyncio
+import tempfile
+import threading
 import unittest
 import numpy as np
 from ..core.dataflow.backends import caches
+from ..core.dataflow.backends.caches import local
 from ..core.dataflow import serializers
 from ..core.dataflow import data
 from ..neochi import settings
@@ -89,6 +94,107 @@ class TestData(unittest.TestCase):
         self.assertEqual(d0.value['value'], 'None')
 
 
+class TestNamespace(unittest.TestCase):
+    def test_if_it_namespaces_keys(self):
+        cache = local.LocalCache(name='test_namespace')
+        d0 = SampleData(cache, namespace='cam1')
+        d1 = SampleData(cache, namespace='cam2')
+        self.assertEqual(d0.key, 'sample_data:cam1')
+        d0.value = {'key': 'Hello'}
+        d1.value = {'key': 'Junya'}
+        self.assertEqual(SampleData(cache, namespace='cam1').value['key'], 'Hello')
+        self.assertIsNone(cache.get('sample_data'))
+        self.assertEqual(data.Image(cache, binary=True, namespace='cam1').key, 'image:cam1')
+
+
+class TestTimestamp(unittest.TestCase):
+    def test_if_it_sets_observed_timestamp(self):
+        cache = local.LocalCache(name='test_timestamp')
+        SampleData(cache).set({'key': 'Hello'}, 123.)
+        d = SampleData(cache)
+        self.assertEqual(d.value['key'], 'Hello')
+        self.assertEqual(d.timestamp, 123.)
+
+
+class TestBehavior(unittest.TestCase):
+    def test_if_it_stores_results(self):
+        cache = local.LocalCache(name='test_behavior')
+        data.brain.Behavior(cache, namespace='cam1').value = {'index': 1, 'probabilities': [0.2, 0.8]}
+        value = data.brain.Behavior(cache, namespace='cam1').value
+        self.assertEqual(value, {'index': 1, 'label': None, 'probabilities': [0.2, 0.8], 'window_timestamp': None})
+        self.assertRaises(serializers.exceptions.ValidationError, setattr, data.brain.Behavior(cache), 'value', {'index': 1})
+
+
+class TestVersionedRead(unittest.TestCase):
+    def setUp(self):
+        self._cache = caches.get_cache('neochi.core.dataflow.backends.caches.local.LocalCache', name='test')
+
+    def test_if_it_reuses_unchanged_value(self):
+        d0 = SampleData(self._cache)
+        d1 = SampleData(self._cache)
+        d0.value = {'key': 'Hello'}
+        self.assertEqual(d1.value['key'], 'Hello')
+        self.assertEqual(d1.value['key'], 'Hello')
+        self.assertEqual((d1.hits, d1.misses), (1, 1))
+        d0.value = {'key': 'Junya'}
+        self.assertEqual(d1.value['key'], 'Junya')
+        self.assertEqual((d1.hits, d1.misses), (1, 2))
+
+    def test_if_it_uses_write_count_of_ring_as_version(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = caches.get_cache('neochi.core.dataflow.backends.caches.shm.SharedMemoryCache',
+                                     name='test', directory=directory)
+            d0 = SampleData(cache)
+            d1 = SampleData(cache)
+            d0.value = {'key': 'Hello'}
+            self.assertEqual(d1.value['key'], 'Hello')
+            self.assertEqual(d1.value['key'], 'Hello')
+            self.assertEqual((d1.hits, d1.misses), (1, 1))
+            cache.close()
+
+    def test_if_it_reuses_decoded_image(self):
+        image = np.random.randint(0, 256, size=(48, 64, 3), dtype=np.uint8)
+        writer = data.Image(self._cache, binary=False)
+        reader = data.Image(self._cache)
+        writer.value = image
+        decoded = reader.value
+        self.assertIs(reader.value, decoded)
+        self.assertEqual(reader.hits, 1)
+        writer.value = image[::-1].copy()
+        np.testing.assert_array_equal(reader.value, image[::-1])
+        self.assertIsNot(reader.value, decoded)
+
+    def test_if_it_does_not_reuse_expired_value(self):
+        cache = local.LocalCache(name='test_expired', ttl=0.05)
+        writer = data.Image(cache)
+        reader = data.Image(cache)
+        writer.value = np.zeros((4, 4, 3), dtype=np.uint8)
+        self.assertIsNotNone(reader.value)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(writer.key))
+        self.assertIsNone(reader.value)
+        self.assertEqual(reader.hits, 0)
+
+    def test_if_it_does_not_reuse_deleted_value(self):
+        writer = data.Image(self._cache)
+        reader = data.Image(self._cache)
+        writer.value = np.zeros((4, 4, 3), dtype=np.uint8)
+        self.assertIsNotNone(reader.value)
+        self._cache.delete(writer.key)
+        self.assertIsNone(reader.value)
+        writer.value = np.ones((4, 4, 3), dtype=np.uint8)
+        np.testing.assert_array_equal(reader.value, np.ones((4, 4, 3), dtype=np.uint8))
+
+    def test_if_it_does_not_reuse_rejected_value(self):
+        cache = local.LocalCache(name='test_rejected', max_bytes=256)
+        writer = SampleData(cache)
+        reader = SampleData(cache)
+        writer.value = {'key': 'Hello'}
+        self.assertEqual(reader.value['key'], 'Hello')
+        writer.value = {'key': 'x' * 256}
+        self.assertIsNone(reader.value)
+
+
 class TestImage(unittest.TestCase):
     def setUp(self):
         self._cache = caches.get_cache(settings.DATAFLOW['BACKEND']['CACHE']['MODULE'],
@@ -112,3 +218,151 @@ class TestImage(unittest.TestCase):
         d0 = data.Image(self._cache)
         with self.assertRaises(ValueError):
             d0.value = self._invalid_image
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self._cache = caches.get_cache('neochi.core.dataflow.backends.caches.local.LocalCache', name='test_batch')
+        self._cache.clear()
+
+    def test_if_it_stores_and_refreshes_several_data(self):
+        d0 = SampleData(self._cache)
+        d1 = data.Image(self._cache)
+        self.assertEqual(data.refresh(d0, d1), [None, None])
+        image = np.zeros((4, 4), dtype=np.uint8)
+        data.store((d0, {'key': 'Hello'}), (d1, image))
+        r0 = SampleData(self._cache)
+        r1 = data.Image(self._cache)
+        value0, value1 = data.refresh(r0, r1)
+        self.assertEqual(value0['key'], 'Hello')
+        self.assertTrue(np.all(value1 == image))
+        data.refresh(r0, r1)
+        self.assertEqual((r0.hits, r1.hits), (1, 1))
+
+
+class StructImage(data.Image):
+    class Serializer(data.Image.Serializer):
+        _format = 'struct'
+
+    _serializer = Serializer()
+
+
+class TestBinaryImage(unittest.TestCase):
+    def setUp(self):
+        self._cache = caches.get_cache('neochi.core.dataflow.backends.caches.local.LocalCache', name='test')
+        self._color_image = np.random.randint(0, 256, size=(32, 32, 3), dtype=np.uint8)
+
+    def test_if_it_sets_and_gets_value(self):
+        d0 = data.Image(self._cache, binary=True)
+        d0.value = self._color_image
+        d1 = data.Image(self._cache)
+        self.assertTrue(np.all(d1.value == self._color_image))
+        self.assertEqual(d0.timestamp, d1.timestamp)
+
+    def test_if_it_reads_json_images(self):
+        d0 = data.Image(self._cache, binary=False)
+        d0.value = self._color_image
+        d1 = data.Image(self._cache, binary=True)
+        self.assertTrue(np.all(d1.value == self._color_image))
+
+    def test_if_it_uses_wire_format(self):
+        d0 = StructImage(self._cache)
+        d0.value = self._color_image
+        d1 = StructImage(self._cache)
+        self.assertTrue(np.all(d1.value == self._color_image))
+        with self.assertRaises(ValueError):
+            data.Image(self._cache).value
+
+    def test_if_it_gets_history(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = caches.get_cache('neochi.core.dataflow.backends.caches.shm.SharedMemoryCache',
+                                     name='test', directory=directory)
+            d0 = data.Image(cache, binary=True)
+            images = [np.full((32, 32, 3), i, dtype=np.uint8) for i in range(5)]
+            for i, image in enumerate(images):
+                d0.set(image, timestamp=float(i))
+            history = data.Image(cache).history(3)
+            self.assertEqual(len(history), 3)
+            for image, value in zip(images[2:], history):
+                self.assertTrue(np.all(image == value))
+            self.assertEqual([timestamp for timestamp, value in data.Image(cache).history(2, timestamps=True)],
+                             [3., 4.])
+            with self.assertRaises(NotImplementedError):
+                data.Image(self._cache).history(3)
+            cache.close()
+
+
+class TestUpdateNotification(unittest.TestCase):
+    def setUp(self):
+        self._cache = caches.get_cache('neochi.core.dataflow.backends.caches.local.LocalCache', name='test')
+
+    def test_if_it_waits_for_update(self):
+        d0 = SampleData(self._cache)
+        d1 = SampleData(self._cache)
+        self.assertFalse(d1.wait_for_update(0.01))
+        timer = threading.Timer(0.01, lambda: setattr(d0, 'value', {'key': 'Hello'}))
+        timer.start()
+        self.assertTrue(d1.wait_for_update(1.))
+        self.assertTrue(d1.wait_for_update(0.))
+        self.assertEqual(d1.value['key'], 'Hello')
+        self.assertFalse(d1.wait_for_update(0.))
+        timer.join()
+        d1.close()
+
+    def test_if_it_calls_callbacks(self):
+        d0 = SampleData(self._cache)
+        d1 = SampleData(self._cache)
+        values = []
+        d1.add_callback(lambda d: values.append(d.value['key']))
+        d0.value = {'key': 'Hello'}
+        d0.value = {'key': 'Junya'}
+        self.assertEqual(values, ['Hello', 'Junya'])
+        d1.close()
+        d0.value = {'key': 'Hello'}
+        self.assertEqual(values, ['Hello', 'Junya'])
+
+
+class TestAsyncData(unittest.TestCase):
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self._cache = local.AsyncLocalCache(name='test_async')
+
+    def tearDown(self):
+        self._loop.close()
+
+    def test_if_it_sets_and_gets_value(self):
+        async def run():
+            d0 = data.AsyncData(SampleData, self._cache)
+            d1 = data.AsyncData(SampleData, self._cache)
+            await d0.set({'key': 'Hello'})
+            self.assertEqual(await d1.get(), {'key': 'Hello', 'value': 'None'})
+            self.assertEqual((await d1.get())['key'], 'Hello')
+            self.assertEqual(d1.hits, 1)
+        self._loop.run_until_complete(run())
+
+    def test_if_it_shares_values_with_data(self):
+        async def run():
+            d = data.AsyncData(SampleData, self._cache)
+            await d.set({'key': 'Hello', 'value': 'Junya'})
+            return SampleData(local.LocalCache(name='test_async')).value
+        self.assertEqual(self._loop.run_until_complete(run())['value'], 'Junya')
+
+    def test_if_it_iterates_over_updates(self):
+        async def run():
+            d0 = data.AsyncData(SampleData, self._cache)
+            d1 = data.AsyncData(SampleData, self._cache)
+            values = []
+
+            async def consume():
+                async for value in d1:
+                    values.append(value['key'])
+                    if len(values) == 2:
+                        break
+            task = asyncio.ensure_future(consume())
+            await asyncio.sleep(0.01)
+            await d0.set({'key': 'Hello'})
+            await asyncio.sleep(0.01)
+            await d0.set({'key': 'Junya'})
+            await asyncio.wait_for(task, 1.)
+            return values
+        self.assertEqual(self._loop.run_until_complete(run()), ['Hello', 'Junya'])
@@ -0,0 +1,60 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import unittest
+import numpy as np
+from ..core.dataflow import data
+
+
+class TestFrameSampler(unittest.TestCase):
+    def test_if_it_drops_frames_of_faster_capture(self):
+        sampler = data.FrameSampler(fps=2.)
+        sampled = []
+        for i in range(11):
+            sampled.extend(sampler.add(i * 0.1, i))
+        self.assertEqual(sampled, [0, 5, 10])
+
+    def test_if_it_repeats_frames_of_slower_capture(self):
+        sampler = data.FrameSampler(fps=4.)
+        sampled = []
+        for i in range(3):
+            sampled.extend(sampler.add(i * 0.5, i))
+        self.assertEqual(sampled, [0, 1, 1, 2, 2])
+
+    def test_if_it_interpolates(self):
+        sampler = data.FrameSampler(fps=4., method='linear')
+        frames = [np.full((2, 2), value, dtype=np.uint8) for value in (0, 100)]
+        sampler.add(0., frames[0])
+        sampled = sampler.add(0.5, frames[1])
+        self.assertEqual([int(frame[0, 0]) for frame in sampled], [50, 100])
+        self.assertEqual(sampled[0].dtype, np.uint8)
+
+    def test_if_it_ignores_duplicates_and_restarts_after_gaps(self):
+        sampler = data.FrameSampler(fps=10., max_gap=1.)
+        self.assertEqual(sampler.add(0., 0), [0])
+        self.assertEqual(sampler.add(0., 0), [])
+        self.assertEqual(sampler.add(10., 1), [1])
+        self.assertEqual(data.FrameSampler().add(0., 0), [0])
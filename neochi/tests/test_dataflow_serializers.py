@@ -26,6 +26,9 @@ __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 import unittest
 import time
+import json
+import timeit
+import numpy as np
 from ..core.dataflow import serializers
 
 
@@ -51,6 +54,15 @@ class MockData:
         return self._value
 
 
+@serializers.register(name='mock')
+class RegisteredMockData(MockData):
+    @classmethod
+    def __from_json__(cls, json_obj):
+        obj = RegisteredMockData()
+        obj.value = json_obj['key']
+        return obj
+
+
 class MockSerializer(serializers.Serializer):
     _schema = {
         'type': 'object',
@@ -69,6 +81,24 @@ class MockSerializer(serializers.Serializer):
     }
 
 
+class CompiledMockSerializer(MockSerializer):
+    _compile = True
+
+
+class WriterOnlyMockSerializer(CompiledMockSerializer):
+    _validation = 'writer'
+
+
+class SampledMockSerializer(CompiledMockSerializer):
+    _validation = 'sample'
+    _sample_rate = 3
+
+
+class UnsupportedMockSerializer(MockSerializer):
+    _compile = True
+    _schema = {'type': 'object', 'properties': {'key0': {'type': 'string', 'minLength': 2}}}
+
+
 class TestEncoder(unittest.TestCase):
     def test_it_encodes_and_decodes_class(self):
         mc = MockData()
@@ -76,6 +106,20 @@ class TestEncoder(unittest.TestCase):
         decoded = serializers.Decoder().decode(encoded)
         self.assertEqual(decoded.value, mc.value)
 
+    def test_it_decodes_registered_class(self):
+        mc = RegisteredMockData()
+        mc.value = 'value'
+        encoded = serializers.Encoder().encode(mc)
+        self.assertIn('"__json__": "mock"', encoded)
+        decoded = serializers.Decoder().decode(encoded)
+        self.assertTrue(isinstance(decoded, RegisteredMockData))
+        self.assertEqual(decoded.value, 'value')
+
+    def test_it_does_not_import_disallowed_modules(self):
+        for tag in ['subprocess/Popen', 'neochi_evil/Class', 'invalid']:
+            with self.assertRaises(serializers.exceptions.UnknownTypeError):
+                serializers.Decoder().decode('{"__json__": "%s", "key": "value"}' % tag)
+
 
 class TestSerializer(unittest.TestCase):
     def test_it_only_accepts_valid_json(self):
@@ -111,3 +155,141 @@ class TestSerializer(unittest.TestCase):
         self.assertEqual(valid_json_obj['key0'], deserialized['key0'])
         self.assertEqual(valid_json_obj['key1']['key1.1'], deserialized['key1']['key1.1'])
         self.assertTrue(valid_json_obj['key1']['key1.2'], deserialized['key1']['key1.2'])
+
+
+class TestCompiledSerializer(unittest.TestCase):
+    def setUp(self):
+        self.valid_json_obj = {
+            'key0': 'string',
+            'key1': {
+                'key1.1': 123.,
+            }
+        }
+
+    def test_it_only_accepts_valid_json(self):
+        serializer = CompiledMockSerializer()
+        serializer.validate(self.valid_json_obj)
+        self.assertTrue(isinstance(self.valid_json_obj['key1']['key1.2'], float))
+        for invalid_json_obj in [{'key0': 1, 'key1': {}}, {'key0': 'string'}, {'key0': 'string', 'key1': []},
+                                 {'key0': 'string', 'key1': {'key1.1': True}}]:
+            with self.assertRaises(serializers.exceptions.ValidationError):
+                serializer.validate(invalid_json_obj)
+            with self.assertRaises(serializers.exceptions.ValidationError):
+                MockSerializer().validate(invalid_json_obj)
+
+    def test_if_it_falls_back_to_jsonschema(self):
+        serializer = UnsupportedMockSerializer()
+        with self.assertRaises(serializers.exceptions.ValidationError):
+            serializer.validate({'key0': 'a'})
+
+    def test_if_it_follows_validation_policy(self):
+        invalid_json_str = json.dumps({'key0': 1, 'key1': {}})
+        with self.assertRaises(serializers.exceptions.ValidationError):
+            CompiledMockSerializer().deserialize(invalid_json_str)
+        with self.assertRaises(serializers.exceptions.ValidationError):
+            WriterOnlyMockSerializer().serialize({'key0': 1, 'key1': {}})
+        deserialized = WriterOnlyMockSerializer().deserialize(invalid_json_str)
+        self.assertTrue(isinstance(deserialized['key1']['key1.2'], float))
+
+        serializer = SampledMockSerializer()
+        errors = 0
+        for _ in range(6):
+            try:
+                serializer.deserialize(invalid_json_str)
+            except serializers.exceptions.ValidationError:
+                errors += 1
+        self.assertEqual(errors, 2)
+
+    def test_if_it_is_faster_than_jsonschema(self):
+        def create():
+            return {'key0': 'string', 'key1': {'key1.1': 123.}}
+
+        serializer = MockSerializer()
+        compiled_serializer = CompiledMockSerializer()
+        jsonschema_time = min(timeit.repeat(lambda: serializer.serialize(create()), number=200, repeat=3))
+        compiled_time = min(timeit.repeat(lambda: compiled_serializer.serialize(create()), number=200, repeat=3))
+        self.assertLess(compiled_time * 3, jsonschema_time)
+
+
+class TestImageSerializer(unittest.TestCase):
+    def test_if_it_serializes_and_deserializes_images(self):
+        serializer = serializers.ImageSerializer()
+        for shape in [(32, 32), (240, 320, 3)]:
+            image = np.random.randint(0, 256, size=shape, dtype=np.uint8)
+            serialized = serializer.serialize({'header': {'timestamp': 1.5}, 'body': {'image': image}})
+            self.assertTrue(serializer.is_binary(serialized))
+            self.assertEqual(len(serialized), 32 + image.nbytes)
+            deserialized = serializer.deserialize(serialized)
+            self.assertEqual(deserialized['header']['timestamp'], 1.5)
+            self.assertEqual(deserialized['body']['height'], shape[0])
+            self.assertEqual(deserialized['body']['width'], shape[1])
+            self.assertTrue(np.all(deserialized['body']['image'] == image))
+            self.assertFalse(deserialized['body']['image'].flags.owndata)
+
+    def test_if_it_keeps_dtype(self):
+        serializer = serializers.ImageSerializer()
+        image = np.random.rand(4, 8).astype(np.float32)
+        deserialized = serializer.deserialize(
+            serializer.serialize({'header': {'timestamp': 0.}, 'body': {'image': image}}))
+        self.assertEqual(deserialized['body']['image'].dtype, np.float32)
+        self.assertTrue(np.all(deserialized['body']['image'] == image))
+
+    def test_if_it_rejects_invalid_data(self):
+        serializer = serializers.ImageSerializer()
+        with self.assertRaises(serializers.exceptions.ValidationError):
+            serializer.serialize({'header': {'timestamp': 0.}, 'body': {'image': 'image'}})
+        with self.assertRaises(serializers.exceptions.ValidationError):
+            serializer.deserialize(b'{"header": {}}')
+
+
+class TestFormats(unittest.TestCase):
+    def setUp(self):
+        mock_data = MockData()
+        mock_data.value = 'value'
+        self.obj = {
+            'none': None,
+            'bool': [True, False],
+            'number': [1, -2, 3.5],
+            'string': 'string',
+            'image': np.random.randint(0, 256, size=(4, 8, 3), dtype=np.uint8),
+            'object': mock_data,
+        }
+        self.formats = [serializers.formats.JsonFormat(serializers.Encoder, serializers.Decoder),
+                        serializers.formats.StructFormat()]
+        for name in ['msgpack', 'cbor']:
+            try:
+                self.formats.append(serializers.formats.get_format(name))
+            except ImportError:
+                pass
+
+    def test_if_it_dumps_and_loads_objects(self):
+        for wire_format in self.formats:
+            obj = dict(self.obj)
+            if not wire_format.native_ndarray:
+                del obj['image']
+            loaded = wire_format.loads(wire_format.dumps(obj))
+            for key in ['none', 'bool', 'number', 'string']:
+                self.assertEqual(loaded[key], obj[key])
+            self.assertEqual(loaded['object'].value, 'value')
+            if wire_format.native_ndarray:
+                self.assertEqual(loaded['image'].dtype, np.uint8)
+                self.assertTrue(np.all(loaded['image'] == obj['image']))
+
+    def test_if_it_keeps_shapes_of_arrays(self):
+        arrays = [np.array(1.5), np.arange(12).reshape(3, 4).T, np.zeros((0, 3), dtype=np.uint8)]
+        for wire_format in self.formats:
+            if not wire_format.native_ndarray:
+                continue
+            for array in arrays:
+                loaded = wire_format.loads(wire_format.dumps({'array': array}))['array']
+                self.assertEqual(loaded.shape, array.shape)
+                np.testing.assert_array_equal(loaded, array)
+
+    def test_if_serializer_uses_format(self):
+        class StructSerializer(CompiledMockSerializer):
+            _format = 'struct'
+
+        serializer = StructSerializer()
+        serialized = serializer.serialize({'key0': 'string', 'key1': {'key1.1': 123.}})
+        self.assertTrue(serialized.startswith(serializers.formats.StructFormat.magic))
+        self.assertEqual(serializer.deserialize(serialized)['key1']['key1.1'], 123.)
@@ -0,0 +1,333 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import os
+import json
+import time
+import base64
+import tempfile
+import threading
+import unittest
+import cv2
+import numpy as np
+from ..core.dataflow import data
+from ..core.dataflow.backends.caches import local
+from ..eye import eye, pipeline, preprocessing, change
+
+
+class CounterCapture:
+    def __init__(self):
+        self._count = 0
+
+    def capture(self):
+        self._count += 1
+        return True, np.full((2, 2, 3), self._count, dtype=np.uint8)
+
+
+class TestFrameQueue(unittest.TestCase):
+    def test_if_it_drops_old_frames(self):
+        queue = pipeline.FrameQueue(2)
+        for i in range(5):
+            queue.put(i)
+        self.assertEqual(queue.dropped, 3)
+        self.assertEqual(queue.get_all(0.), [3, 4])
+        self.assertEqual(queue.get_all(0.), [])
+
+
+class TestCapturePipeline(unittest.TestCase):
+    def test_if_grab_is_not_delayed_by_publish(self):
+        published = []
+
+        def publish(frames):
+            time.sleep(0.05)
+            published.extend(frames)
+        with pipeline.CapturePipeline(CounterCapture(), publish, fps=100) as p:
+            time.sleep(0.5)
+        metrics = p.metrics
+        self.assertGreater(metrics['captured'], 25)
+        self.assertLess(metrics['published'], metrics['captured'] / 2)
+        self.assertGreater(metrics['dropped'] + metrics['skipped'], 0)
+        self.assertEqual(metrics['published'], len(published))
+        self.assertGreaterEqual(metrics['publish']['mean'], 0.05)
+        self.assertEqual(sorted(published, key=lambda f: f[0]), published)
+
+    def test_if_it_publishes_all_frames_without_skipping(self):
+        published = []
+        with pipeline.CapturePipeline(CounterCapture(), published.extend, fps=100, queue_size=100,
+                                      skip_stale=False) as p:
+            time.sleep(0.2)
+        counts = [int(frame[0, 0, 0]) for timestamp, frame in published]
+        self.assertEqual(counts, list(range(1, len(counts) + 1)))
+        self.assertEqual(p.metrics['skipped'], 0)
+
+
+class PreprocessingCapture(eye.Capture):
+    def __init__(self, buffers):
+        super().__init__([2, 2], 0)
+        self._count = 0
+        self._preprocess = preprocessing.Preprocessor(self._size, color=None, buffers=buffers)
+
+    def _capture(self):
+        self._count += 1
+        return True, self._preprocess(np.full((4, 4, 3), self._count % 256, dtype=np.uint8))
+
+    def recycle(self, frame):
+        self._preprocess.release(frame)
+
+
+class TestRecyclingPipeline(unittest.TestCase):
+    def test_if_frames_are_not_overwritten_while_publishing(self):
+        changed = []
+
+        def publish(frames):
+            before = [frame.copy() for timestamp, frame in frames]
+            time.sleep(0.05)
+            changed.extend(not np.array_equal(b, frame) for b, (timestamp, frame) in zip(before, frames))
+        with pipeline.CapturePipeline(PreprocessingCapture(buffers=4), publish, fps=200) as p:
+            time.sleep(0.5)
+        self.assertGreater(len(changed), 5)
+        self.assertFalse(any(changed))
+        self.assertGreater(p.metrics['captured'], 50)
+
+
+class TestGatedPipeline(unittest.TestCase):
+    def test_if_it_counts_suppressed_frames(self):
+        published = []
+        gate = change.ChangeDetector(keyframe_interval=None)
+        with pipeline.CapturePipeline(StaticCapture(), published.extend, fps=100, gate=gate) as p:
+            time.sleep(0.2)
+        metrics = p.metrics
+        self.assertEqual(len(published), 1)
+        self.assertEqual(metrics['published'], 1)
+        self.assertGreater(metrics['suppressed'], 5)
+
+
+class TestCaptureScheduler(unittest.TestCase):
+    def test_if_it_captures_at_fps_of_each_source(self):
+        published = {'fast': [], 'slow': []}
+        with pipeline.CaptureScheduler() as scheduler:
+            scheduler.add('fast', CounterCapture(), published['fast'].extend, fps=100)
+            scheduler.add('slow', CounterCapture(), published['slow'].extend, fps=10)
+            time.sleep(0.5)
+            scheduler.set_fps('slow', 100)
+            scheduler.remove('fast')
+            time.sleep(0.2)
+        metrics = scheduler.metrics
+        self.assertNotIn('fast', metrics)
+        self.assertGreater(len(published['fast']), 30)
+        self.assertGreater(metrics['slow']['captured'], 15)
+        self.assertLess(metrics['slow']['captured'], 35)
+
+    def test_if_a_failing_source_does_not_stop_others(self):
+        published = []
+        with pipeline.CaptureScheduler() as scheduler:
+            scheduler.add('broken', FailingCapture(), published.extend, fps=100)
+            scheduler.add('working', CounterCapture(), published.extend, fps=100)
+            time.sleep(0.1)
+            captured = scheduler.metrics['working']['captured']
+            time.sleep(0.2)
+        metrics = scheduler.metrics
+        self.assertGreater(metrics['working']['captured'], captured + 10)
+        self.assertGreater(metrics['broken']['errors'], 10)
+        self.assertEqual(metrics['broken']['captured'], 0)
+
+
+class FailingCapture:
+    def capture(self):
+        raise IOError('Camera is unplugged.')
+
+
+class StaticCapture:
+    def capture(self):
+        return True, np.full((32, 32, 3), 128, dtype=np.uint8)
+
+
+class TestChangeDetector(unittest.TestCase):
+    def setUp(self):
+        self._frame = np.random.randint(0, 256, size=(32, 32, 3), dtype=np.uint8)
+
+    def test_if_it_suppresses_unchanged_frames(self):
+        for method, threshold in (('difference', 4.), ('hash', 4)):
+            detector = change.ChangeDetector(threshold, method=method, keyframe_interval=None)
+            self.assertTrue(detector(self._frame, 0.))
+            self.assertFalse(detector(self._frame.copy(), 1.))
+            self.assertTrue(detector(255 - self._frame, 2.))
+            self.assertEqual((detector.passed, detector.suppressed), (2, 1))
+
+    def test_if_it_passes_keyframes(self):
+        detector = change.ChangeDetector(keyframe_interval=1.)
+        self.assertEqual([detector(self._frame, t) for t in (0., 0.5, 1., 1.5)], [True, False, True, False])
+
+
+class TestPreprocessor(unittest.TestCase):
+    def setUp(self):
+        self._frame = np.random.randint(0, 256, size=(480, 640, 3), dtype=np.uint8)
+
+    def test_if_it_resizes_and_converts(self):
+        preprocess = preprocessing.Preprocessor((32, 24))
+        expected = cv2.cvtColor(cv2.resize(self._frame, (32, 24)), cv2.COLOR_BGR2RGB)
+        np.testing.assert_array_equal(preprocess(self._frame), expected)
+
+    def test_if_it_rotates(self):
+        preprocess = preprocessing.Preprocessor((24, 32), rotation=90)
+        expected = np.rot90(cv2.cvtColor(cv2.resize(self._frame, (32, 24)), cv2.COLOR_BGR2RGB), -1)
+        np.testing.assert_array_equal(preprocess(self._frame), expected)
+        self.assertEqual(preprocessing.Preprocessor((32, 32), rotation=45)(self._frame).shape, (32, 32, 3))
+
+    def test_if_it_crops(self):
+        preprocess = preprocessing.Preprocessor((32, 32), roi=(80, 0, 480, 480), interpolation=cv2.INTER_AREA)
+        expected = cv2.cvtColor(cv2.resize(self._frame[:, 80:560], (32, 32), interpolation=cv2.INTER_AREA),
+                                cv2.COLOR_BGR2RGB)
+        np.testing.assert_array_equal(preprocess(self._frame), expected)
+
+    def test_if_it_reuses_released_buffers(self):
+        preprocess = preprocessing.Preprocessor((32, 32), rotation=180, buffers=3)
+        addresses = []
+        for _ in range(9):
+            output = preprocess(self._frame)
+            addresses.append(output.ctypes.data)
+            preprocess.release(output)
+        self.assertEqual(len(set(addresses)), 1)
+
+    def test_if_it_does_not_overwrite_outputs_in_use(self):
+        preprocess = preprocessing.Preprocessor((32, 32), buffers=2)
+        outputs = [preprocess(self._frame) for _ in range(4)]
+        self.assertEqual(len(set(output.ctypes.data for output in outputs)), 4)
+        preprocess.release(outputs[1])
+        preprocess.release(np.empty((32, 32, 3), dtype=np.uint8))
+        self.assertEqual(preprocess(self._frame).ctypes.data, outputs[1].ctypes.data)
+
+
+class ResizingCapture(eye.Capture):
+    def _capture(self):
+        return True, np.zeros((self._size[1], self._size[0], 3), dtype=np.uint8)
+
+    def _reconfigure(self, size, rotation):
+        return True
+
+
+class TestCapture(unittest.TestCase):
+    def test_if_it_reconfigures_without_reopening(self):
+        cap = ResizingCapture([32, 32], 0)
+        self.assertTrue(cap.reconfigure([64, 48], 90))
+        self.assertEqual(cap.capture()[1].shape, (48, 64, 3))
+        self.assertEqual(cap.rotation, 90)
+
+    def test_if_it_requires_reopening_by_default(self):
+        cap = eye.Capture([32, 32], 0)
+        self.assertTrue(cap.reconfigure([32, 32], 0))
+        self.assertFalse(cap.reconfigure([64, 64], 0))
+        self.assertEqual(cap.size, [32, 32])
+
+
+class TestReplayCapture(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._frames = [np.full((32, 32, 3), i, dtype=np.uint8) for i in range(3)]
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _write_dataset(self):
+        os.mkdir(os.path.join(self._dir.name, 'clip'))
+        for i, frame in enumerate(self._frames):
+            with open(os.path.join(self._dir.name, 'clip', '%03d.json' % i), 'w') as f:
+                json.dump({'image': base64.b64encode(frame.tobytes()).decode(),
+                           'height': 32, 'width': 32, 'channel': 3}, f)
+        with open(os.path.join(self._dir.name, 'labels.json'), 'w') as f:
+            json.dump({'labels': [{'directoryName': 'clip', 'label': 'sit'}]}, f)
+
+    def test_if_it_replays_dataset(self):
+        self._write_dataset()
+        cap = eye.ReplayCapture(self._dir.name, loop=False)
+        values = []
+        while True:
+            captured, frame = cap.capture()
+            if not captured:
+                break
+            values.append(int(frame[0, 0, 0]))
+        self.assertEqual(values, [0, 1, 2])
+
+    def test_if_it_replays_images_in_a_loop(self):
+        for i, frame in enumerate(self._frames):
+            cv2.imwrite(os.path.join(self._dir.name, '%03d.png' % i), frame)
+        cap = eye.ReplayCapture(self._dir.name, size=[16, 8], preload=True)
+        frames = [cap.capture()[1].copy() for _ in range(5)]
+        self.assertEqual(frames[0].shape, (8, 16, 3))
+        self.assertEqual([int(frame[0, 0, 0]) for frame in frames], [0, 1, 2, 0, 1])
+
+    def test_if_it_replays_video(self):
+        path = os.path.join(self._dir.name, 'video.avi')
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (32, 32))
+        if not writer.isOpened():
+            self.skipTest('No video encoder.')
+        for frame in self._frames:
+            writer.write(frame)
+        writer.release()
+        cap = eye.ReplayCapture(path, loop=False)
+        self.assertEqual([cap.capture()[0] for _ in range(4)], [True, True, True, False])
+
+    def test_if_it_paces_frames(self):
+        self._write_dataset()
+        cap = eye.ReplayCapture(self._dir.name, fps=50)
+        start_time = time.time()
+        for _ in range(6):
+            cap.capture()
+        self.assertGreaterEqual(time.time() - start_time, 0.09)
+
+    def test_if_get_capture_returns_replay(self):
+        self._write_dataset()
+        self.assertIsInstance(eye.get_capture([32, 32], source=self._dir.name), eye.ReplayCapture)
+
+
+class TestEyeManager(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        for i in range(3):
+            cv2.imwrite(os.path.join(self._dir.name, '%03d.png' % i), np.full((32, 32, 3), i, dtype=np.uint8))
+        self._cache = local.LocalCache(name='test_eye_manager')
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_if_it_publishes_images_of_each_camera(self):
+        manager = eye.EyeManager(self._cache, {'cam1': {}, 'cam2': {'fps': 20.}}, source=self._dir.name, fps=10.)
+        thread = threading.Thread(target=manager.start_capture, daemon=True)
+        thread.start()
+        for camera in ('cam1', 'cam2'):
+            manager.eyes[camera].update_state(is_capturing=True)
+        images = [data.eye.Image(self._cache, namespace=camera) for camera in ('cam1', 'cam2')]
+        self.assertTrue(all(image.wait_for_update(1.) for image in images))
+        time.sleep(0.5)
+        metrics = manager.metrics
+        manager.close()
+        thread.join(2.)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(images[0].key, 'eye:image:cam1')
+        self.assertEqual(images[0].value.shape, (32, 32, 3))
+        self.assertGreater(metrics['cam2']['captured'], metrics['cam1']['captured'])
+        self.assertIsNone(self._cache.get('eye:image'))
+        self.assertEqual(manager.metrics, {})
@@ -0,0 +1,74 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import zipfile
+import tempfile
+import numpy as np
+from neochi.brain.dataset import compile_dataset
+
+
+def write_dataset(path, clips, frames=5, size=(32, 32)):
+    frame = np.random.randint(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+    member = json.dumps({'image': base64.b64encode(frame.tobytes()).decode(),
+                         'height': size[1], 'width': size[0], 'channel': 3})
+    with zipfile.ZipFile(path, 'w') as archive:
+        entries = []
+        for i in range(clips):
+            directory = 'clip%05d' % i
+            entries.append({'directoryName': directory, 'label': 'label%d' % (i % 3)})
+            for j in range(frames):
+                archive.writestr('%s/%03d.json' % (directory, j), member)
+        archive.writestr('labels.json', json.dumps({'labels': entries}))
+
+
+def bench(zip_path, workers):
+    directory = tempfile.mkdtemp()
+    try:
+        start_time = time.time()
+        compile_dataset(zip_path, directory, workers=workers)
+        return time.time() - start_time
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    clips = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with tempfile.TemporaryDirectory() as directory:
+        zip_path = os.path.join(directory, 'data.zip')
+        write_dataset(zip_path, clips)
+        print('%d clips, %d CPUs' % (clips, os.cpu_count()))
+        print('%-8s %10s %10s' % ('workers', 'time[s]', 'speedup'))
+        baseline = None
+        for workers in sorted({1, 2, 4, os.cpu_count()}):
+            elapsed = bench(zip_path, workers)
+            baseline = baseline or elapsed
+            print('%-8d %10.2f %10.2f' % (workers, elapsed, baseline / elapsed))
@@ -0,0 +1,75 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import timeit
+import numpy as np
+from neochi.core.dataflow import data
+from neochi.core.dataflow.backends.caches import local
+
+
+SIZES = [(32, 32), (320, 240), (640, 480)]
+
+
+class StructImage(data.Image):
+    class Serializer(data.Image.Serializer):
+        _format = 'struct'
+
+    _serializer = Serializer()
+
+
+MODES = {
+    'json': lambda cache: data.Image(cache),
+    'struct': lambda cache: StructImage(cache),
+    'binary': lambda cache: data.Image(cache, binary=True),
+}
+
+
+def bench(size, mode, number=100):
+    cache = local.LocalCache(name='benchmark')
+    writer = MODES[mode](cache)
+    reader = MODES[mode](cache)
+    frame = np.random.randint(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+
+    def write():
+        writer.value = frame
+
+    def write_and_read():
+        writer.value = frame
+        return reader.value
+
+    write()
+    payload = len(cache.get(writer._key))
+    write_time = min(timeit.repeat(write, number=number, repeat=3)) / number
+    read_time = min(timeit.repeat(write_and_read, number=number, repeat=3)) / number - write_time
+    return payload, write_time, read_time
+
+
+if __name__ == '__main__':
+    print('%-10s %-7s %10s %12s %12s' % ('size', 'format', 'bytes', 'write[us]', 'read[us]'))
+    for size in SIZES:
+        for mode in MODES:
+            payload, write_time, read_time = bench(size, mode)
+            print('%-10s %-7s %10d %12.1f %12.1f' % ('%dx%d' % size, mode, payload, write_time * 1e6, read_time * 1e6))
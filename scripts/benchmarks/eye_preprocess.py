@@ -0,0 +1,62 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import timeit
+import cv2
+import numpy as np
+from neochi.eye.preprocessing import Preprocessor
+
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+SIZES = [(32, 32), (320, 240)]
+
+
+def bench(resolution, size, rotation, number=200):
+    frame = np.random.randint(0, 256, size=(resolution[1], resolution[0], 3), dtype=np.uint8)
+    preprocess = Preprocessor(size, rotation)
+    if rotation:
+        def baseline():
+            return cv2.rotate(cv2.cvtColor(cv2.resize(frame, (size[1], size[0])), cv2.COLOR_BGR2RGB),
+                              cv2.ROTATE_90_CLOCKWISE)
+    else:
+        def baseline():
+            return cv2.cvtColor(cv2.resize(frame, size), cv2.COLOR_BGR2RGB)
+
+    def preallocated():
+        preprocess.release(preprocess(frame))
+    baseline_time = min(timeit.repeat(baseline, number=number, repeat=3)) / number
+    preprocess_time = min(timeit.repeat(preallocated, number=number, repeat=3)) / number
+    return baseline_time, preprocess_time
+
+
+if __name__ == '__main__':
+    print('%-10s %-8s %-9s %14s %17s' % ('input', 'output', 'rotation', 'allocating[us]', 'preallocated[us]'))
+    for resolution in RESOLUTIONS:
+        for size in SIZES:
+            for rotation in (0, 90):
+                baseline_time, preprocess_time = bench(resolution, size, rotation)
+                print('%-10s %-8s %-9d %14.1f %17.1f' % ('%dx%d' % resolution, '%dx%d' % size, rotation,
+                                                         baseline_time * 1e6, preprocess_time * 1e6))
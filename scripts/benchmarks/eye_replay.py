@@ -0,0 +1,60 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import sys
+import time
+from neochi.core.dataflow import data
+from neochi.core.dataflow.backends.caches import local
+from neochi.eye.eye import ReplayCapture
+from neochi.eye.pipeline import CapturePipeline
+
+
+def bench(source, fps, duration=5., binary=False):
+    cache = local.LocalCache(name='benchmark')
+    image = data.eye.Image(cache, binary=binary)
+
+    def publish(frames):
+        for timestamp, frame in frames:
+            image.value = frame
+
+    cap = ReplayCapture(source, size=[32, 32], preload=True)
+    with CapturePipeline(cap, publish, fps) as pipeline:
+        time.sleep(duration)
+    return pipeline.metrics
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python eye_replay.py <video file or directory> [fps]')
+        sys.exit(1)
+    fps = float(sys.argv[2]) if len(sys.argv) > 2 else 1000.
+    for binary in (False, True):
+        metrics = bench(sys.argv[1], fps, binary=binary)
+        print('binary=%s fps=%.1f captured=%d published=%d dropped=%d skipped=%d' %
+              (binary, metrics['fps'], metrics['captured'], metrics['published'], metrics['dropped'],
+               metrics['skipped']))
+        for stage in ('grab', 'wait', 'publish'):
+            print('  %-8s mean=%8.1fus max=%8.1fus' % (stage, metrics[stage]['mean'] * 1e6, metrics[stage]['max'] * 1e6))
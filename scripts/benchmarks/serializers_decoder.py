@@ -0,0 +1,79 @@
+# MIT License
+#
+# Copyright (c) 2019 Morning Project Samurai Inc. (MPS)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+__author__ = 'Junya Kaneko <junya@mpsamurai.org>'
+
+
+import json
+import timeit
+import importlib
+from neochi.core.dataflow import serializers
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    @classmethod
+    def __from_json__(cls, json_obj):
+        return cls(json_obj['x'], json_obj['y'])
+
+    def __to_json__(self):
+        return {'x': self.x, 'y': self.y}
+
+
+@serializers.register(name='point')
+class RegisteredPoint(Point):
+    pass
+
+
+class ImportingDecoder(json.JSONDecoder):
+    """ Decoder resolving classes as the original Decoder did, by importing on every object. """
+    def __init__(self, *args, **kwargs):
+        super().__init__(object_hook=self._object_hook, *args, **kwargs)
+
+    def _object_hook(self, obj):
+        if '__json__' in obj:
+            module_path, cls_name = obj['__json__'].split('/')
+            cls = getattr(importlib.import_module(module_path), cls_name)
+            del obj['__json__']
+            return cls.__from_json__(obj)
+        else:
+            return obj
+
+
+def bench(decoder, encoded, number=10):
+    return min(timeit.repeat(lambda: decoder.decode(encoded), number=number, repeat=3)) / number
+
+
+if __name__ == '__main__':
+    serializers.registry.allow('__main__')
+    n = 10000
+    encoder = serializers.Encoder()
+    encoded = encoder.encode([Point(i, -i) for i in range(n)])
+    registered_encoded = encoder.encode([RegisteredPoint(i, -i) for i in range(n)])
+    print('%-24s %10s' % ('decoder', 'time[ms]'))
+    print('%-24s %10.2f' % ('import per object', bench(ImportingDecoder(), encoded) * 1e3))
+    print('%-24s %10.2f' % ('registry (cached import)', bench(serializers.Decoder(), encoded) * 1e3))
+    print('%-24s %10.2f' % ('registry (registered)', bench(serializers.Decoder(), registered_encoded) * 1e3))
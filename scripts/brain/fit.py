@@ -25,47 +25,41 @@ __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 
 import os
-import base64
-import zipfile
-import json
-import numpy as np
 from sklearn.preprocessing.label import LabelEncoder
 
 from neochi import utils
+from neochi.brain.dataset import compile_dataset
+from neochi.brain.clips import ClipSpec, WindowBatches
 from neochi.neochi import settings
 
 
-def fit(zip_path, data_dir, model_dir, model_cls, **kwargs):
+def fit(zip_path, data_dir, model_dir, model_cls, workers=None, frames=None, stride=None, format='h5', **kwargs):
+    """
+    :param frames: number of frames of a window. The length of the clips if None, which must be the same.
+    :param stride: number of frames between windows in a clip. Windows do not overlap if None.
+    :param format: format of the network exported in addition to HDF5 for prediction.
+    :param kwargs: keyword arguments of model_cls, which must include fps of the clips.
+    """
     if not os.path.exists(zip_path):
         raise ValueError('data.zip not found.')
-    zip = zipfile.ZipFile(zip_path)
-    zip.extractall(data_dir)
-    zip.close()
-    with open(os.path.join(data_dir, 'labels.json')) as f:
-        data_json = json.load(f)
-    movies = []
-    labels = []
-    for datum in data_json['labels']:
-        dirname = datum['directoryName']
-        label = datum['label']
-        movie = []
-        image_dir = os.path.join(data_dir, dirname)
-        for image_file in sorted(os.listdir(image_dir)):
-            with open(os.path.join(image_dir, image_file)) as f:
-                image_json = json.load(f)
-                image = np.fromstring(base64.b64decode(image_json['image']), np.uint8)\
-                    .reshape((image_json['height'], image_json['width'], image_json['channel']))
-                movie.append(image)
-        movies.append(movie)
-        labels.append(label)
-    X = np.array(movies)
-    X = X.reshape((-1, 32, 32, 15))
+    dataset = compile_dataset(zip_path, data_dir, workers)
+    if frames is None:
+        lengths = set(dataset.clip_lengths)
+        if len(lengths) != 1:
+            raise ValueError('Clips have different lengths %s. Specify frames of a window.' % sorted(lengths))
+        frames = lengths.pop()
+    spec = ClipSpec.from_frames(dataset.frame_shape, frames)
+    starts, clips = spec.clip_starts(dataset.offsets, stride)
+    labels = [dataset.labels[i] for i in clips]
     le = LabelEncoder()
     y = le.fit_transform(labels)
 
-    model = model_cls(shape=X.shape[1:], labels=labels, **kwargs)
-    loss, acc = model.fit(X, y)
-    model.save(model_dir)
+    model = model_cls(shape=spec.shape, labels=labels, **kwargs)
+    if model.fps is None:
+        raise ValueError('fps of the training clips is required to sample frames at prediction.')
+    spec.validate(model.shape)
+    loss, acc = model.fit_batches(WindowBatches(spec, dataset.frames, starts, y))
+    model.save(model_dir, format)
     return {'loss': loss, 'acc': float(acc)}
 
 
@@ -74,4 +68,7 @@ if __name__ == '__main__':
     fit(settings.BRAIN['DATA']['ZIP_PATH'],
         settings.BRAIN['DATA']['DIR'],
         settings.BRAIN['MODEL']['DIR'],
-        model_cls)
+        model_cls,
+        settings.BRAIN['DATA'].get('WORKERS'),
+        format=settings.BRAIN['MODEL'].get('FORMAT', 'h5'),
+        **settings.BRAIN['MODEL']['KWARGS'])
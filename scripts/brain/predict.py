@@ -24,44 +24,141 @@
 __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 
+import sys
 import time
+import threading
 import numpy as np
 from neochi import utils
 from neochi.core.dataflow.backends import caches
-from neochi.core.dataflow.data import eye
+from neochi.core.dataflow import data
+from neochi.core.dataflow.data import eye, brain
+from neochi.brain.window import FrameWindow
+from neochi.brain.server import InferenceServer
 from neochi.neochi import settings
 
 
-def wait(start_time):
-    time.sleep(np.max((0, 1. - (time.time() - start_time))))
+# Seconds between checks of the model files, which are loaded again when fit saves a new model.
+RELOAD_INTERVAL = 10.
+
+
+def subscribe(images):
+    event = threading.Event()
+    try:
+        for image in images:
+            image.add_callback(lambda datum: event.set())
+    except NotImplementedError:
+        return None
+    return event
+
+
+def sample(image, current_image, sampler, window, capture_fps):
+    """
+    Sample frames of the current image. An empty window is filled from the recent images in one read
+    if the cache keeps them, e.g. SharedMemoryCache.
+    :param capture_fps: frames per second of the eye, which determines how many recent images cover the window.
+    """
+    if len(window) == 0:
+        duration = window.length / sampler.fps
+        try:
+            history = image.history(int(np.ceil(duration * max(capture_fps or 0., sampler.fps))) + 1,
+                                    timestamps=True)
+        except NotImplementedError:
+            history = []
+        if history:
+            sampler.reset()
+            frames = []
+            for timestamp, value in history:
+                if timestamp >= history[-1][0] - duration:
+                    frames.extend(sampler.add(timestamp, value))
+            return frames
+    return sampler.add(image.timestamp, current_image)
+
+
+def prepare(model, cameras):
+    """
+    Windows and samplers of the cameras for the model, and the polling interval.
+    """
+    windows = {camera: FrameWindow.from_config(model.config) for camera in cameras}
+    for window in windows.values():
+        window.spec.validate(model.shape)
+    fps = model.fps
+    if fps is None:
+        fps = 1.
+        print('WARNING: fps is not saved with the model. Frames are sampled at %s fps. '
+              'Fit the model again with fps in BRAIN MODEL KWARGS.' % fps)
+    return windows, {camera: data.FrameSampler(fps) for camera in cameras}, 1. / fps
+
+
+def wait(event, start_time, interval=1.):
+    if event is None:
+        time.sleep(np.max((0, interval - (time.time() - start_time))))
+        return True
+    updated = event.wait(1.)
+    event.clear()
+    return updated
 
 
 if __name__ == '__main__':
+    # Camera IDs to subscribe to can be given as arguments. The default is the camera without ID.
+    cameras = sys.argv[1:] or [None]
     cache = caches.get_cache(settings.DATAFLOW['BACKEND']['CACHE']['MODULE'],
                              **settings.DATAFLOW['BACKEND']['CACHE']['KWARGS'])
-    image = eye.Image(cache)
-    state = eye.State(cache)
+    images = [eye.Image(cache, namespace=camera) for camera in cameras]
+    states = [eye.State(cache, namespace=camera) for camera in cameras]
+    model_dir, model_format = settings.BRAIN['MODEL']['DIR'], settings.BRAIN['MODEL'].get('FORMAT', 'h5')
     model = utils.load_module(settings.BRAIN['MODEL']['MODULE'])()
-    model.load(settings.BRAIN['MODEL']['DIR'])
+    model.load(model_dir, model_format)
 
-    images = []
+    behaviors = {camera: brain.Behavior(cache, namespace=camera) for camera in cameras}
+    server = InferenceServer(model.predict_probs, max_batch_size=max(len(cameras), 1))
+    event = subscribe(images)
+    windows, samplers, interval = prepare(model, cameras)
+    reloaded_at = time.time()
     while True:
         start_time = time.time()
-        if not state.value['is_capturing']:
-            images = []
-            wait(start_time)
+        if start_time - reloaded_at >= RELOAD_INTERVAL:
+            reloaded_at = start_time
+            try:
+                if model.reload(model_dir, model_format):
+                    windows, samplers, interval = prepare(model, cameras)
+            except Exception as e:
+                print('RELOAD ERROR:', e)
+        if not wait(event, start_time, interval):
             continue
+        values = data.refresh(*(states + images))
+        requests = {}
+        for camera, image, current_state, current_image in zip(cameras, images, values[:len(cameras)],
+                                                               values[len(cameras):]):
+            window = windows[camera]
+            if current_state is None or not current_state['is_capturing']:
+                window.clear()
+                samplers[camera].reset()
+                continue
 
-        if len(images) < 5:
-            images.append(image.value)
-            wait(start_time)
-            continue
+            if current_image is None:
+                continue
+            frames = sample(image, current_image, samplers[camera], window, current_state.get('fps'))
+            try:
+                window.extend(frames)
+            except ValueError as e:
+                print('SHAPE ERROR:', camera, e)
+                window.clear()
+                continue
+
+            if not frames or not window.is_full:
+                continue
 
-        if len(images) == 5:
-            images.pop(0)
-            images.append(image.value)
+            requests[camera] = image.timestamp, server.submit(window.tensor)
 
-        X = np.array(images)
-        X = X.reshape((-1, 32, 32, 15))
-        print(model.predict(X))
-        wait(start_time)
+        for camera, (timestamp, request) in requests.items():
+            probabilities = request.result()
+            index = int(np.argmax(probabilities))
+            label = model.classes[index] if model.classes and index < len(model.classes) else None
+            behaviors[camera].value = {'index': index,
+                                       'label': label,
+                                       'probabilities': [float(p) for p in probabilities],
+                                       'window_timestamp': timestamp}
+            if camera is None:
+                print(index, label)
+            else:
+                print(camera, index, label)
@@ -24,6 +24,7 @@
 __author__ = 'Junya Kaneko <junya@mpsamurai.org>'
 
 
+import sys
 from neochi.core.dataflow.backends import caches
 from neochi.neochi import settings
 from neochi.eye.eye import Eye
@@ -31,5 +32,6 @@ from neochi.eye.eye import Eye
 
 if __name__ == '__main__':
     cache = caches.get_cache(settings.DATAFLOW['BACKEND']['CACHE']['MODULE'], host='localhost')
-    eye = Eye(cache)
+    # An optional argument replays frames from a video file or a directory instead of the camera.
+    eye = Eye(cache, source=sys.argv[1] if len(sys.argv) > 1 else None)
     eye.start_capture()
@@ -34,6 +34,7 @@ if __name__ == '__main__':
     cache = caches.get_cache(settings.DATAFLOW['BACKEND']['CACHE']['MODULE'], host='localhost')
     eye = Eye(cache, init=False)
     while True:
+        eye.wait_for_image(0.1)
         image = eye.image
         if image is None:
             continue